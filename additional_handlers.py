@@ -1,61 +1,25 @@
-from aiogram import Router, F
+from aiogram import Router
 from aiogram.types import Message, CallbackQuery
 from aiogram.fsm.context import FSMContext
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-from database import DatabaseManager
+from callbacks import Op, pack, callback_dispatcher
+from database import AsyncDatabaseManager
 from keyboards import *
+from messaging import safe_delete_message, safe_edit_or_send, update_main_message
+from shopping_list_renderer import shopping_list_renderer, CREATED_HEADER
 from states import *
 
 additional_router = Router()
 
-async def safe_delete_message(message: Message):
-    """Safely deletes a message, returns success status."""
-    try:
-        await message.delete()
-        return True
-    except Exception as e:
-        print(f"Failed to delete message: {e}")
-        return False
-
-async def safe_edit_or_send(message_or_callback, text: str, reply_markup=None):
-    """Universal function for editing or sending a new message."""
-    if isinstance(message_or_callback, CallbackQuery):
-        try:
-            await message_or_callback.message.edit_text(text, reply_markup=reply_markup)
-        except Exception:
-            await safe_delete_message(message_or_callback.message)
-            await message_or_callback.message.answer(text, reply_markup=reply_markup)
-    else:
-        await message_or_callback.answer(text, reply_markup=reply_markup)
-
-async def update_main_message(bot, chat_id: int, state: FSMContext, text: str, reply_markup=None):
-    """Universal function for updating main message."""
-    data = await state.get_data()
-
-    if 'main_message_id' not in data:
-        return False
-
-    try:
-        await bot.edit_message_text(
-            chat_id=chat_id,
-            message_id=data['main_message_id'],
-            text=text,
-            reply_markup=reply_markup
-        )
-        return True
-    except Exception as e:
-        print(f"Failed to edit message: {e}")
-        return False
-
-@additional_router.callback_query(F.data == "add_recipe")
+@callback_dispatcher.handler(Op.ADD_RECIPE)
 async def add_recipe_start(callback: CallbackQuery, state: FSMContext):
     await safe_edit_or_send(
         callback,
         "➕ Adding new recipe\n\n"
         "⌨️ Enter recipe name:",
         reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="❌ Cancel", callback_data="cancel")]
+            [InlineKeyboardButton(text="❌ Cancel", callback_data=pack(Op.CANCEL))]
         ])
     )
 
@@ -80,7 +44,7 @@ async def recipe_name_received(message: Message, state: FSMContext):
         f"📝 Recipe: {recipe_name}\n\n"
         "📦 Enter first ingredient name:",
         reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="❌ Cancel", callback_data="cancel")]
+            [InlineKeyboardButton(text="❌ Cancel", callback_data=pack(Op.CANCEL))]
         ])
     )
 
@@ -89,7 +53,7 @@ async def recipe_name_received(message: Message, state: FSMContext):
             f"📝 Recipe: {recipe_name}\n\n"
             "📦 Enter first ingredient name:",
             reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="❌ Cancel", callback_data="cancel")]
+                [InlineKeyboardButton(text="❌ Cancel", callback_data=pack(Op.CANCEL))]
             ])
         )
         await state.update_data(main_message_id=new_msg.message_id)
@@ -117,7 +81,7 @@ async def ingredient_name_received(message: Message, state: FSMContext):
         f"📦 Ingredient: {ingredient_name}\n\n"
         "⚖️ Enter quantity (numbers only):",
         reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="❌ Cancel", callback_data="cancel")]
+            [InlineKeyboardButton(text="❌ Cancel", callback_data=pack(Op.CANCEL))]
         ])
     )
 
@@ -151,21 +115,18 @@ async def ingredient_quantity_received(message: Message, state: FSMContext):
         reply_markup=get_units_keyboard()
     )
 
-@additional_router.callback_query(F.data.startswith("unit_"), RecipeStates.waiting_for_ingredient_quantity)
-async def ingredient_unit_selected(callback: CallbackQuery, state: FSMContext):
-    unit = callback.data.split("_")[1]
+@callback_dispatcher.handler(Op.UNIT, RecipeStates.waiting_for_ingredient_quantity)
+async def ingredient_unit_selected(callback: CallbackQuery, state: FSMContext, db: AsyncDatabaseManager, unit: str):
     data = await state.get_data()
 
     ingredient_name = data['current_ingredient_name']
 
-    with DatabaseManager() as db:
-        existing_product = db.get_product_by_name(ingredient_name)
+    existing_product = await db.get_product_by_name(ingredient_name)
 
     if existing_product:
         await save_ingredient_and_continue(callback, state, unit, existing_product.category.name)
     else:
-        with DatabaseManager() as db:
-            categories = db.get_categories()
+        categories = await db.get_categories_with_product_counts()
 
         await state.update_data(current_ingredient_unit=unit)
 
@@ -175,26 +136,18 @@ async def ingredient_unit_selected(callback: CallbackQuery, state: FSMContext):
         text += "Select category for this product:"
 
         builder = InlineKeyboardBuilder()
-        for category in categories:
-            builder.button(text=category.name, callback_data=f"category_{category.id}")
+        for category, products_count in categories:
+            builder.button(text=f"{category.name} ({products_count})", callback_data=pack(Op.INGREDIENT_CATEGORY, category.id))
         builder.adjust(2)
-        builder.row(InlineKeyboardButton(text="➕ New category", callback_data="new_category"))
-        builder.row(InlineKeyboardButton(text="❌ Cancel", callback_data="cancel"))
+        builder.row(InlineKeyboardButton(text="➕ New category", callback_data=pack(Op.NEW_CATEGORY)))
+        builder.row(InlineKeyboardButton(text="❌ Cancel", callback_data=pack(Op.CANCEL)))
 
         await safe_edit_or_send(callback, text, reply_markup=builder.as_markup())
         await state.set_state(RecipeStates.waiting_for_ingredient_category)
 
-@additional_router.callback_query(F.data.startswith("category_"), RecipeStates.waiting_for_ingredient_category)
-async def ingredient_category_selected(callback: CallbackQuery, state: FSMContext):
-    category_id = int(callback.data.split("_")[1])
-
-    with DatabaseManager() as db:
-        categories = db.get_categories()
-        category = None
-        for cat in categories:
-            if cat.id == category_id:
-                category = cat
-                break
+@callback_dispatcher.handler(Op.INGREDIENT_CATEGORY, RecipeStates.waiting_for_ingredient_category)
+async def ingredient_category_selected(callback: CallbackQuery, state: FSMContext, db: AsyncDatabaseManager, category_id: int):
+    category = await db.get_category_by_id(category_id)
 
     if not category:
         await callback.answer("❌ Category not found!", show_alert=True)
@@ -205,7 +158,7 @@ async def ingredient_category_selected(callback: CallbackQuery, state: FSMContex
 
     await save_ingredient_and_continue(callback, state, unit, category.name)
 
-@additional_router.callback_query(F.data == "new_category", RecipeStates.waiting_for_ingredient_category)
+@callback_dispatcher.handler(Op.NEW_CATEGORY, RecipeStates.waiting_for_ingredient_category)
 async def new_category_for_ingredient(callback: CallbackQuery, state: FSMContext):
     data = await state.get_data()
 
@@ -216,7 +169,7 @@ async def new_category_for_ingredient(callback: CallbackQuery, state: FSMContext
         f"⚖️ Quantity: {data['current_ingredient_quantity']} {data['current_ingredient_unit']}\n\n"
         "⌨️ Enter new category name:",
         reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="❌ Cancel", callback_data="cancel")]
+            [InlineKeyboardButton(text="❌ Cancel", callback_data=pack(Op.CANCEL))]
         ])
     )
 
@@ -258,9 +211,10 @@ async def save_ingredient_and_continue(callback: CallbackQuery, state: FSMContex
 
     text += "\nWhat would you like to do next?"
 
-    await safe_edit_or_send(callback, text, reply_markup=get_ingredient_actions_keyboard())
+    keyboard = get_ingredient_actions_keyboard(allow_reset='editing_recipe_id' in data)
+    await safe_edit_or_send(callback, text, reply_markup=keyboard)
 
-@additional_router.callback_query(F.data == "add_ingredient")
+@callback_dispatcher.handler(Op.ADD_INGREDIENT)
 async def add_another_ingredient(callback: CallbackQuery, state: FSMContext):
     data = await state.get_data()
 
@@ -269,17 +223,16 @@ async def add_another_ingredient(callback: CallbackQuery, state: FSMContext):
         f"📝 Recipe: {data['recipe_name']}\n\n"
         "📦 Enter next ingredient name:",
         reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="❌ Cancel", callback_data="cancel")]
+            [InlineKeyboardButton(text="❌ Cancel", callback_data=pack(Op.CANCEL))]
         ])
     )
 
     await state.update_data(main_message_id=callback.message.message_id)
     await state.set_state(RecipeStates.waiting_for_ingredient_name)
 
-@additional_router.callback_query(F.data == "finish_recipe")
-async def finish_recipe(callback: CallbackQuery, state: FSMContext):
+@callback_dispatcher.handler(Op.FINISH_RECIPE)
+async def finish_recipe(callback: CallbackQuery, state: FSMContext, user_id: str, db: AsyncDatabaseManager):
     data = await state.get_data()
-    user_id = ""
 
     if 'recipe_name' not in data:
         await callback.answer("❌ Error: recipe data lost!", show_alert=True)
@@ -297,12 +250,11 @@ async def finish_recipe(callback: CallbackQuery, state: FSMContext):
 
     try:
         if 'editing_recipe_id' in data:
-            with DatabaseManager() as db:
-                db.update_recipe(
-                    recipe_id=data['editing_recipe_id'],
-                    name=data['recipe_name'],
-                    ingredients=data['ingredients']
-                )
+            await db.update_recipe(
+                recipe_id=data['editing_recipe_id'],
+                name=data['recipe_name'],
+                ingredients=data['ingredients']
+            )
 
             recipe_name = data['recipe_name']
             ingredients = data['ingredients']
@@ -317,15 +269,14 @@ async def finish_recipe(callback: CallbackQuery, state: FSMContext):
 
             await safe_edit_or_send(callback, text, reply_markup=get_recipes_menu())
         else:
-            with DatabaseManager() as db:
-                recipe = db.create_recipe(
-                    name=data['recipe_name'],
-                    user_id=user_id,
-                    ingredients=data['ingredients']
-                )
+            recipe = await db.create_recipe(
+                name=data['recipe_name'],
+                user_id=user_id,
+                ingredients=data['ingredients']
+            )
 
-                recipe_name = data['recipe_name']
-                ingredients = data['ingredients']
+            recipe_name = data['recipe_name']
+            ingredients = data['ingredients']
 
             await state.clear()
 
@@ -347,10 +298,9 @@ async def finish_recipe(callback: CallbackQuery, state: FSMContext):
         )
         await state.clear()
 
-@additional_router.callback_query(F.data == "edit_recipe")
-async def edit_recipe_start(callback: CallbackQuery):
-    with DatabaseManager() as db:
-        recipes = db.get_recipes()
+@callback_dispatcher.handler(Op.RECIPES_TO_EDIT)
+async def edit_recipe_start(callback: CallbackQuery, db: AsyncDatabaseManager):
+    recipes = await db.get_recipes()
 
     if not recipes:
         await safe_edit_or_send(
@@ -366,26 +316,24 @@ async def edit_recipe_start(callback: CallbackQuery):
         reply_markup=get_recipes_list(recipes, "edit")
     )
 
-@additional_router.callback_query(F.data.startswith("edit_recipe_"))
-async def edit_specific_recipe(callback: CallbackQuery, state: FSMContext):
-    recipe_id = int(callback.data.split("_")[2])
-
-    with DatabaseManager() as db:
-        recipe = db.get_recipe_by_id(recipe_id)
+@callback_dispatcher.handler(Op.EDIT_RECIPE)
+async def edit_specific_recipe(callback: CallbackQuery, state: FSMContext, db: AsyncDatabaseManager, recipe_id: int):
+    recipe = await db.get_recipe_by_id(recipe_id)
 
-        if not recipe:
-            await callback.answer("❌ Recipe not found!", show_alert=True)
-            return
+    if not recipe:
+        await callback.answer("❌ Recipe not found!", show_alert=True)
+        return
 
-        recipe_name = recipe.name
-        recipe_ingredients = []
+    recipe_name = recipe.name
+    recipe_ingredients = []
 
-        for ingredient in recipe.ingredients:
-            recipe_ingredients.append({
-                'product_name': ingredient.product.name,
-                'quantity': ingredient.quantity,
-                'unit': ingredient.unit
-            })
+    for ingredient in recipe.ingredients:
+        recipe_ingredients.append({
+            'product_name': ingredient.product.name,
+            'quantity': ingredient.quantity,
+            'unit': ingredient.unit,
+            'category': ingredient.product.category.name
+        })
 
     text = f"✏️ Editing recipe: {recipe_name}\n\n"
     text += "📋 Current ingredients:\n"
@@ -406,7 +354,7 @@ async def edit_specific_recipe(callback: CallbackQuery, state: FSMContext):
         callback,
         text,
         reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="❌ Cancel", callback_data="cancel")]
+            [InlineKeyboardButton(text="❌ Cancel", callback_data=pack(Op.CANCEL))]
         ])
     )
     await state.set_state(RecipeStates.editing_recipe)
@@ -420,25 +368,57 @@ async def edit_recipe_name(message: Message, state: FSMContext):
     if len(new_name) < 2:
         return
 
-    await state.update_data(recipe_name=new_name, ingredients=[])
+    data = await state.get_data()
+    ingredients = data.get('original_ingredients', [])
+
+    await state.update_data(recipe_name=new_name, ingredients=ingredients)
+
+    text = f"✏️ Editing recipe: {new_name}\n\n"
+    text += "📋 Ingredients:\n"
+
+    for i, ing in enumerate(ingredients, 1):
+        text += f"{i}. {ing['product_name']} - {ing['quantity']} {ing['unit']}\n"
+
+    text += "\nWhat would you like to do next?"
 
     success = await update_main_message(
         message.bot,
         message.chat.id,
         state,
-        f"✏️ Editing recipe: {new_name}\n\n"
+        text,
+        reply_markup=get_ingredient_actions_keyboard(allow_reset=True)
+    )
+
+    if not success:
+        new_msg = await message.answer(text, reply_markup=get_ingredient_actions_keyboard(allow_reset=True))
+        await state.update_data(main_message_id=new_msg.message_id)
+
+    await state.set_state(RecipeStates.waiting_for_ingredients)
+
+@callback_dispatcher.handler(Op.RESET_INGREDIENTS)
+async def reset_recipe_ingredients(callback: CallbackQuery, state: FSMContext):
+    data = await state.get_data()
+
+    if 'recipe_name' not in data:
+        await callback.answer("❌ Error: recipe data lost!", show_alert=True)
+        return
+
+    await state.update_data(ingredients=[], main_message_id=callback.message.message_id)
+
+    await safe_edit_or_send(
+        callback,
+        f"✏️ Editing recipe: {data['recipe_name']}\n\n"
         "📦 Enter first ingredient name:",
         reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="❌ Cancel", callback_data="cancel")]
+            [InlineKeyboardButton(text="❌ Cancel", callback_data=pack(Op.CANCEL))]
         ])
     )
 
     await state.set_state(RecipeStates.waiting_for_ingredient_name)
 
-@additional_router.callback_query(F.data == "delete_recipe")
-async def delete_recipe_start(callback: CallbackQuery):
-    with DatabaseManager() as db:
-        recipes = db.get_recipes()
+@callback_dispatcher.handler(Op.RECIPES_TO_DELETE)
+async def delete_recipe_start(callback: CallbackQuery, db: AsyncDatabaseManager):
+    recipes = await db.get_recipes()
 
     if not recipes:
         await safe_edit_or_send(
@@ -454,34 +434,28 @@ async def delete_recipe_start(callback: CallbackQuery):
         reply_markup=get_recipes_list(recipes, "delete")
     )
 
-@additional_router.callback_query(F.data.startswith("delete_recipe_"))
-async def delete_specific_recipe(callback: CallbackQuery):
-    recipe_id = int(callback.data.split("_")[2])
+@callback_dispatcher.handler(Op.DELETE_RECIPE)
+async def delete_specific_recipe(callback: CallbackQuery, db: AsyncDatabaseManager, recipe_id: int):
+    recipe = await db.get_recipe_by_id(recipe_id)
 
-    with DatabaseManager() as db:
-        recipe = db.get_recipe_by_id(recipe_id)
-
-        if not recipe:
-            await callback.answer("❌ Recipe not found!", show_alert=True)
-            return
+    if not recipe:
+        await callback.answer("❌ Recipe not found!", show_alert=True)
+        return
 
-        recipe_name = recipe.name
+    recipe_name = recipe.name
 
     await safe_edit_or_send(
         callback,
         f"❌ Are you sure you want to delete recipe '{recipe_name}'?\n\n"
         "This action cannot be undone!",
-        reply_markup=get_confirmation_keyboard("delete_recipe", recipe_id)
+        reply_markup=get_confirmation_keyboard(pack(Op.CONFIRM_DELETE_RECIPE, recipe_id), pack(Op.CANCEL_DELETE_RECIPE))
     )
 
-@additional_router.callback_query(F.data.startswith("confirm_delete_recipe_"))
-async def confirm_delete_recipe(callback: CallbackQuery):
-    recipe_id = int(callback.data.split("_")[3])
-
-    with DatabaseManager() as db:
-        recipe = db.get_recipe_by_id(recipe_id)
-        recipe_name = recipe.name if recipe else "Unknown"
-        db.delete_recipe(recipe_id)
+@callback_dispatcher.handler(Op.CONFIRM_DELETE_RECIPE)
+async def confirm_delete_recipe(callback: CallbackQuery, db: AsyncDatabaseManager, recipe_id: int):
+    recipe = await db.get_recipe_by_id(recipe_id)
+    recipe_name = recipe.name if recipe else "Unknown"
+    await db.delete_recipe(recipe_id)
 
     await safe_edit_or_send(
         callback,
@@ -489,10 +463,9 @@ async def confirm_delete_recipe(callback: CallbackQuery):
         reply_markup=get_recipes_menu()
     )
 
-@additional_router.callback_query(F.data.startswith("cancel_delete_recipe"))
-async def cancel_delete_recipe(callback: CallbackQuery):
-    with DatabaseManager() as db:
-        recipes = db.get_recipes()
+@callback_dispatcher.handler(Op.CANCEL_DELETE_RECIPE)
+async def cancel_delete_recipe(callback: CallbackQuery, db: AsyncDatabaseManager):
+    recipes = await db.get_recipes()
 
     await safe_edit_or_send(
         callback,
@@ -500,22 +473,19 @@ async def cancel_delete_recipe(callback: CallbackQuery):
         reply_markup=get_recipes_list(recipes, "delete")
     )
 
-@additional_router.callback_query(F.data.startswith("select_recipe_"), MenuStates.selecting_recipes)
-async def select_recipe_for_menu(callback: CallbackQuery, state: FSMContext):
-    recipe_id = int(callback.data.split("_")[2])
-    user_id = ""
-    with DatabaseManager() as db:
-        db.add_selected_recipe(user_id, recipe_id)
-        selected_recipes = db.get_selected_recipes(user_id)
-        recipes = db.get_recipes()
-
-        selected_data = []
-        for sel in selected_recipes:
-            selected_data.append({
-                'recipe_id': sel.recipe_id,
-                'recipe_name': sel.recipe.name,
-                'count': sel.count
-            })
+@callback_dispatcher.handler(Op.SELECT_RECIPE, MenuStates.selecting_recipes)
+async def select_recipe_for_menu(callback: CallbackQuery, state: FSMContext, user_id: str, db: AsyncDatabaseManager, recipe_id: int):
+    await db.add_selected_recipe(user_id, recipe_id)
+    selected_recipes = await db.get_selected_recipes(user_id)
+    recipes = await db.get_recipes()
+
+    selected_data = []
+    for sel in selected_recipes:
+        selected_data.append({
+            'recipe_id': sel.recipe_id,
+            'recipe_name': sel.recipe.name,
+            'count': sel.count
+        })
 
     text = "🧾 Creating menu\n\n"
 
@@ -531,103 +501,67 @@ async def select_recipe_for_menu(callback: CallbackQuery, state: FSMContext):
     builder = InlineKeyboardBuilder()
 
     for recipe in recipes:
-        builder.button(text=recipe.name, callback_data=f"select_recipe_{recipe.id}")
+        builder.button(text=recipe.name, callback_data=pack(Op.SELECT_RECIPE, recipe.id))
 
     builder.adjust(1)
 
     if selected_data:
-        builder.row(InlineKeyboardButton(text="📋 Manage selected", callback_data="manage_selected"))
-        builder.row(InlineKeyboardButton(text="🛍️ Add products", callback_data="add_temp_products"))
-        builder.row(InlineKeyboardButton(text="✅ Create shopping list", callback_data="create_shopping_list"))
+        builder.row(InlineKeyboardButton(text="📋 Manage selected", callback_data=pack(Op.MANAGE_SELECTED)))
+        builder.row(InlineKeyboardButton(text="🛍️ Add products", callback_data=pack(Op.ADD_TEMP_PRODUCTS)))
+        builder.row(InlineKeyboardButton(text="✅ Create shopping list", callback_data=pack(Op.CREATE_SHOPPING_LIST)))
 
-    builder.row(InlineKeyboardButton(text="🔄 Clear selection", callback_data="clear_selection"))
-    builder.row(InlineKeyboardButton(text="🏠 Main menu", callback_data="main_menu"))
+    builder.row(InlineKeyboardButton(text="🔄 Clear selection", callback_data=pack(Op.CLEAR_SELECTION)))
+    builder.row(InlineKeyboardButton(text="🏠 Main menu", callback_data=pack(Op.MAIN_MENU)))
 
     await safe_edit_or_send(callback, text, reply_markup=builder.as_markup())
 
-@additional_router.callback_query(F.data == "clear_selection")
-async def clear_selection(callback: CallbackQuery):
-    user_id = ""
-    with DatabaseManager() as db:
-        db.clear_selected_recipes(user_id)
-        recipes = db.get_recipes()
+@callback_dispatcher.handler(Op.CLEAR_SELECTION)
+async def clear_selection(callback: CallbackQuery, user_id: str, db: AsyncDatabaseManager):
+    await db.clear_selected_recipes(user_id)
+    recipes = await db.get_recipes()
 
     text = "🧾 Creating menu\n\nSelect recipes for your menu:"
     await safe_edit_or_send(callback, text, reply_markup=get_recipes_list(recipes, "select"))
 
-@additional_router.callback_query(F.data == "create_shopping_list")
-async def create_shopping_list(callback: CallbackQuery, state: FSMContext):
+@callback_dispatcher.handler(Op.CREATE_SHOPPING_LIST)
+async def create_shopping_list(callback: CallbackQuery, state: FSMContext, user_id: str, db: AsyncDatabaseManager):
     await callback.answer()
-    user_id = str(callback.from_user.id)
 
-    with DatabaseManager() as db:
-        selected_recipes = db.get_selected_recipes(user_id)
+    selected_recipes = await db.get_selected_recipes(user_id)
 
-        if not selected_recipes:
-            await callback.answer("❌ No recipes selected!", show_alert=True)
-            return
+    if not selected_recipes:
+        await callback.answer("❌ No recipes selected!", show_alert=True)
+        return
 
-        db.create_shopping_list_from_selected(user_id)
-        shopping_items = db.get_shopping_list(user_id)
+    await db.create_shopping_list_from_selected(user_id)
+    shopping_items = await db.get_shopping_list(user_id)
 
     await state.clear()
 
-    from products_handlers import get_user_temp_products
+    from product_handlers import get_user_temp_products
     temp_products = get_user_temp_products(user_id)
 
-    categories = {}
-
-    for item in shopping_items:
-        category_name = item.product.category.name
-        if category_name not in categories:
-            categories[category_name] = []
-        categories[category_name].append({
-            'type': 'recipe',
-            'item': item
-        })
-
-    for temp_product in temp_products:
-        category_name = temp_product['category']
-        if category_name not in categories:
-            categories[category_name] = []
-        categories[category_name].append({
-            'type': 'temp',
-            'item': temp_product
-        })
-
-    text = "✅ Shopping list created!\n\n🛒 Your list:\n\n"
-
-    for category_name, items in categories.items():
-        text += f"📦 {category_name}:\n"
-        for item_data in items:
-            if item_data['type'] == 'recipe':
-                item = item_data['item']
-                text += f"• {item.product.name} - {item.quantity} {item.unit}\n"
-            else:
-                item = item_data['item']
-                text += f"• {item['name']} - {item['quantity']} {item['unit']} 🛍️\n"
-        text += "\n"
-
-    if temp_products:
-        keyboard = get_shopping_list_with_temp_keyboard(shopping_items, temp_products)
-    else:
-        keyboard = get_shopping_list_keyboard(shopping_items)
+    text, keyboard = shopping_list_renderer.render(
+        user_id,
+        shopping_items,
+        temp_products,
+        header=CREATED_HEADER,
+        show_status=False
+    )
 
     await safe_edit_or_send(callback, text, reply_markup=keyboard)
 
-@additional_router.callback_query(F.data == "manage_selected")
-async def manage_selected_recipes(callback: CallbackQuery, state: FSMContext):
-   user_id = ""
-   with DatabaseManager() as db:
-       selected_recipes = db.get_selected_recipes(user_id)
+@callback_dispatcher.handler(Op.MANAGE_SELECTED)
+async def manage_selected_recipes(callback: CallbackQuery, state: FSMContext, user_id: str, db: AsyncDatabaseManager):
+   selected_recipes = await db.get_selected_recipes(user_id)
 
-       selected_data = []
-       for sel in selected_recipes:
-           selected_data.append({
-               'recipe_id': sel.recipe_id,
-               'recipe_name': sel.recipe.name,
-               'count': sel.count
-           })
+   selected_data = []
+   for sel in selected_recipes:
+       selected_data.append({
+           'recipe_id': sel.recipe_id,
+           'recipe_name': sel.recipe.name,
+           'count': sel.count
+       })
 
    if not selected_data:
        await callback.answer("❌ No selected recipes!", show_alert=True)
@@ -643,32 +577,42 @@ async def manage_selected_recipes(callback: CallbackQuery, state: FSMContext):
    for sel in selected_data:
        count_text = f" (x{sel['count']})" if sel['count'] > 1 else ""
        builder.row(
-           InlineKeyboardButton(text=f"➖", callback_data=f"remove_selected_{sel['recipe_id']}"),
-           InlineKeyboardButton(text=f"{sel['recipe_name']}{count_text}", callback_data=f"view_selected_{sel['recipe_id']}"),
-           InlineKeyboardButton(text=f"➕", callback_data=f"add_selected_{sel['recipe_id']}")
+           InlineKeyboardButton(text=f"➖", callback_data=pack(Op.REMOVE_SELECTED, sel['recipe_id'])),
+           InlineKeyboardButton(text=f"{sel['recipe_name']}{count_text}", callback_data=pack(Op.VIEW_SELECTED, sel['recipe_id'])),
+           InlineKeyboardButton(text=f"➕", callback_data=pack(Op.ADD_SELECTED, sel['recipe_id']))
        )
 
-   builder.row(InlineKeyboardButton(text="◀️ Back to selection", callback_data="back_to_selection"))
-   builder.row(InlineKeyboardButton(text="🛍️ Add products", callback_data="add_temp_products"))
-   builder.row(InlineKeyboardButton(text="✅ Create shopping list", callback_data="create_shopping_list"))
-   builder.row(InlineKeyboardButton(text="🔄 Clear selection", callback_data="clear_selection"))
-   builder.row(InlineKeyboardButton(text="🏠 Main menu", callback_data="main_menu"))
+   builder.row(InlineKeyboardButton(text="◀️ Back to selection", callback_data=pack(Op.BACK_TO_SELECTION)))
+   builder.row(InlineKeyboardButton(text="🛍️ Add products", callback_data=pack(Op.ADD_TEMP_PRODUCTS)))
+   builder.row(InlineKeyboardButton(text="✅ Create shopping list", callback_data=pack(Op.CREATE_SHOPPING_LIST)))
+   builder.row(InlineKeyboardButton(text="🔄 Clear selection", callback_data=pack(Op.CLEAR_SELECTION)))
+   builder.row(InlineKeyboardButton(text="🏠 Main menu", callback_data=pack(Op.MAIN_MENU)))
 
    await safe_edit_or_send(callback, text, reply_markup=builder.as_markup())
 
-@additional_router.callback_query(F.data == "back_to_selection")
-async def back_to_recipe_selection(callback: CallbackQuery, state: FSMContext):
-   user_id = ""
-   with DatabaseManager() as db:
-       recipes = db.get_recipes()
-       selected_recipes = db.get_selected_recipes(user_id)
+@callback_dispatcher.handler(Op.VIEW_SELECTED)
+async def view_selected_recipe(callback: CallbackQuery, user_id: str, db: AsyncDatabaseManager, recipe_id: int):
+   selected_recipes = await db.get_selected_recipes(user_id)
+   sel = next((sel for sel in selected_recipes if sel.recipe_id == recipe_id), None)
+
+   if sel is None:
+       await callback.answer("❌ Recipe is not selected!", show_alert=True)
+       return
 
-       selected_data = []
-       for sel in selected_recipes:
-           selected_data.append({
-               'recipe_name': sel.recipe.name,
-               'count': sel.count
-           })
+   count_text = f" (x{sel.count})" if sel.count > 1 else ""
+   await callback.answer(f"🍽️ {sel.recipe.name}{count_text}\n\nUse ➖ and ➕ to change the count.", show_alert=True)
+
+@callback_dispatcher.handler(Op.BACK_TO_SELECTION)
+async def back_to_recipe_selection(callback: CallbackQuery, state: FSMContext, user_id: str, db: AsyncDatabaseManager):
+   recipes = await db.get_recipes()
+   selected_recipes = await db.get_selected_recipes(user_id)
+
+   selected_data = []
+   for sel in selected_recipes:
+       selected_data.append({
+           'recipe_name': sel.recipe.name,
+           'count': sel.count
+       })
 
    text = "🧾 Creating menu\n\n"
 
@@ -684,10 +628,9 @@ async def back_to_recipe_selection(callback: CallbackQuery, state: FSMContext):
    await safe_edit_or_send(callback, text, reply_markup=get_recipes_list(recipes, "select"))
    await state.set_state(MenuStates.selecting_recipes)
 
-@additional_router.callback_query(F.data == "list_categories")
-async def list_categories(callback: CallbackQuery):
-   with DatabaseManager() as db:
-       categories = db.get_categories()
+@callback_dispatcher.handler(Op.LIST_CATEGORIES)
+async def list_categories(callback: CallbackQuery, db: AsyncDatabaseManager):
+   categories = await db.get_categories()
 
    text = "📦 Categories list:\n\n"
    for category in categories:
@@ -695,14 +638,14 @@ async def list_categories(callback: CallbackQuery):
 
    await safe_edit_or_send(callback, text, reply_markup=get_categories_menu())
 
-@additional_router.callback_query(F.data == "add_category")
+@callback_dispatcher.handler(Op.ADD_CATEGORY)
 async def add_category_start(callback: CallbackQuery, state: FSMContext):
    await safe_edit_or_send(
        callback,
        "➕ Adding new category\n\n"
        "⌨️ Enter category name:",
        reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-           [InlineKeyboardButton(text="❌ Cancel", callback_data="cancel")]
+           [InlineKeyboardButton(text="❌ Cancel", callback_data=pack(Op.CANCEL))]
        ])
    )
 
@@ -710,7 +653,7 @@ async def add_category_start(callback: CallbackQuery, state: FSMContext):
    await state.set_state(CategoryStates.waiting_for_category_name)
 
 @additional_router.message(CategoryStates.waiting_for_category_name)
-async def category_name_received(message: Message, state: FSMContext):
+async def category_name_received(message: Message, state: FSMContext, db: AsyncDatabaseManager):
    await safe_delete_message(message)
 
    category_name = message.text.strip()
@@ -718,72 +661,73 @@ async def category_name_received(message: Message, state: FSMContext):
    if len(category_name) < 2:
        return
 
-   with DatabaseManager() as db:
-       existing_category = db.get_category_by_name(category_name)
+   existing_category = await db.get_category_by_name(category_name)
+
+   if existing_category:
+       return
 
-       if existing_category:
-           return
+   data = await state.get_data()
+   category = await db.create_category(category_name)
 
-       data = await state.get_data()
-       category = db.create_category(category_name)
+   if 'current_ingredient_unit' in data:
+       unit = data.get('current_ingredient_unit', 'g')
 
-       if 'current_ingredient_unit' in data:
-           unit = data.get('current_ingredient_unit', 'g')
+       ingredient = {
+           'product_name': data['current_ingredient_name'],
+           'quantity': data['current_ingredient_quantity'],
+           'unit': unit,
+           'category': category.name
+       }
 
-           ingredient = {
-               'product_name': data['current_ingredient_name'],
-               'quantity': data['current_ingredient_quantity'],
-               'unit': unit,
-               'category': category.name
-           }
+       ingredients = data.get('ingredients', [])
+       ingredients.append(ingredient)
 
-           ingredients = data.get('ingredients', [])
-           ingredients.append(ingredient)
+       await state.update_data(ingredients=ingredients)
 
-           await state.update_data(ingredients=ingredients)
+       recipe_name = data['recipe_name']
+       text = f"📝 Recipe: {recipe_name}\n\n"
+       text += "📋 Ingredients:\n"
 
-           recipe_name = data['recipe_name']
-           text = f"📝 Recipe: {recipe_name}\n\n"
-           text += "📋 Ingredients:\n"
+       for i, ing in enumerate(ingredients, 1):
+           text += f"{i}. {ing['product_name']} - {ing['quantity']} {ing['unit']}\n"
 
-           for i, ing in enumerate(ingredients, 1):
-               text += f"{i}. {ing['product_name']} - {ing['quantity']} {ing['unit']}\n"
+       text += "\nWhat would you like to do next?"
 
-           text += "\nWhat would you like to do next?"
+       success = await update_main_message(
+           message.bot,
+           message.chat.id,
+           state,
+           text,
+           reply_markup=get_ingredient_actions_keyboard(allow_reset='editing_recipe_id' in data)
+       )
 
-           success = await update_main_message(
-               message.bot,
-               message.chat.id,
-               state,
+       if not success:
+           new_msg = await message.answer(
                text,
-               reply_markup=get_ingredient_actions_keyboard()
+               reply_markup=get_ingredient_actions_keyboard(allow_reset='editing_recipe_id' in data)
            )
+           await state.update_data(main_message_id=new_msg.message_id)
 
-           if not success:
-               new_msg = await message.answer(text, reply_markup=get_ingredient_actions_keyboard())
-               await state.update_data(main_message_id=new_msg.message_id)
+   else:
+       await state.clear()
 
-       else:
-           await state.clear()
+       success = await update_main_message(
+           message.bot,
+           message.chat.id,
+           state,
+           f"✅ Category '{category.name}' successfully created!",
+           reply_markup=get_categories_menu()
+       )
 
-           success = await update_main_message(
-               message.bot,
-               message.chat.id,
-               state,
+       if not success:
+           await message.answer(
                f"✅ Category '{category.name}' successfully created!",
                reply_markup=get_categories_menu()
            )
 
-           if not success:
-               await message.answer(
-                   f"✅ Category '{category.name}' successfully created!",
-                   reply_markup=get_categories_menu()
-               )
-
-@additional_router.callback_query(F.data == "reorder_categories")
-async def reorder_categories_start(callback: CallbackQuery):
-   with DatabaseManager() as db:
-       categories = db.get_categories()
+@callback_dispatcher.handler(Op.REORDER_CATEGORIES)
+async def reorder_categories_start(callback: CallbackQuery, db: AsyncDatabaseManager):
+   categories = await db.get_categories()
 
    text = "🔄 Reordering categories\n\n"
    text += "Current order:\n"
@@ -793,80 +737,65 @@ async def reorder_categories_start(callback: CallbackQuery):
 
    await safe_edit_or_send(callback, text, reply_markup=get_categories_menu())
 
-@additional_router.callback_query(F.data == "finish_shopping")
+@callback_dispatcher.handler(Op.FINISH_SHOPPING)
 async def finish_shopping_confirm(callback: CallbackQuery):
    await safe_edit_or_send(
        callback,
        "🏁 Are you sure you want to finish shopping?\n\n"
        "The entire list will be cleared!",
-       reply_markup=get_confirmation_keyboard("finish_shopping")
+       reply_markup=get_confirmation_keyboard(pack(Op.CONFIRM_FINISH_SHOPPING), pack(Op.CANCEL_FINISH_SHOPPING))
    )
 
-@additional_router.callback_query(F.data == "confirm_finish_shopping")
-async def confirm_finish_shopping(callback: CallbackQuery):
-   user_id = ""
-   with DatabaseManager() as db:
-       db.clear_shopping_list(user_id)
+@callback_dispatcher.handler(Op.CONFIRM_FINISH_SHOPPING)
+async def confirm_finish_shopping(callback: CallbackQuery, user_id: str, db: AsyncDatabaseManager):
+   await db.clear_shopping_list(user_id)
 
-   from products_handlers import clear_user_temp_products
+   from product_handlers import clear_user_temp_products
    clear_user_temp_products(user_id)
 
    await safe_edit_or_send(
        callback,
        "✅ Shopping completed! List cleared.",
        reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-           [InlineKeyboardButton(text="🏠 Main menu", callback_data="main_menu")]
+           [InlineKeyboardButton(text="🏠 Main menu", callback_data=pack(Op.MAIN_MENU))]
        ])
    )
 
-@additional_router.callback_query(F.data == "cancel_finish_shopping")
-async def cancel_finish_shopping(callback: CallbackQuery):
-   user_id = ""
-   with DatabaseManager() as db:
-       shopping_items = db.get_shopping_list(user_id)
-
-   categories = {}
-   for item in shopping_items:
-       category_name = item.product.category.name
-       if category_name not in categories:
-           categories[category_name] = []
-       categories[category_name].append(item)
-
-   text = "🛒 Shopping list:\n\n"
-   for category_name, items in categories.items():
-       text += f"📦 {category_name}:\n"
-       for item in items:
-           status = "✅" if item.is_bought else "⭕"
-           text += f"{status} {item.product.name} - {item.quantity} {item.unit}\n"
-       text += "\n"
+@callback_dispatcher.handler(Op.CANCEL_FINISH_SHOPPING)
+async def cancel_finish_shopping(callback: CallbackQuery, user_id: str, db: AsyncDatabaseManager):
+   shopping_items = await db.get_shopping_list(user_id)
+
+   from product_handlers import get_user_temp_products
+   temp_products = get_user_temp_products(user_id)
 
-   await safe_edit_or_send(callback, text, reply_markup=get_shopping_list_keyboard(shopping_items))
+   text, keyboard = shopping_list_renderer.render(user_id, shopping_items, temp_products)
 
-@additional_router.callback_query(F.data == "cancel")
-async def cancel_operation(callback: CallbackQuery, state: FSMContext):
+   await safe_edit_or_send(callback, text, reply_markup=keyboard)
+
+@callback_dispatcher.handler(Op.CANCEL)
+async def cancel_operation(callback: CallbackQuery, state: FSMContext, user_id: str, db: AsyncDatabaseManager):
    await state.clear()
 
+   has_shopping_list = await db.has_shopping_list(user_id)
+
    await safe_edit_or_send(
        callback,
        "🏠 Main menu\n\nSelect action:",
-       reply_markup=get_main_menu_inline()
+       reply_markup=get_main_menu_inline(has_shopping_list)
    )
 
-@additional_router.callback_query(F.data.startswith("add_selected_"))
-async def add_selected_recipe(callback: CallbackQuery):
-   recipe_id = int(callback.data.split("_")[2])
-   user_id = ""
-   with DatabaseManager() as db:
-       db.add_selected_recipe(user_id, recipe_id)
-       selected_recipes = db.get_selected_recipes(user_id)
-
-       selected_data = []
-       for sel in selected_recipes:
-           selected_data.append({
-               'recipe_id': sel.recipe_id,
-               'recipe_name': sel.recipe.name,
-               'count': sel.count
-           })
+@callback_dispatcher.handler(Op.ADD_SELECTED)
+async def add_selected_recipe(callback: CallbackQuery, user_id: str, db: AsyncDatabaseManager, recipe_id: int):
+   await db.add_selected_recipe(user_id, recipe_id)
+   selected_recipes = await db.get_selected_recipes(user_id)
+
+   selected_data = []
+   for sel in selected_recipes:
+       selected_data.append({
+           'recipe_id': sel.recipe_id,
+           'recipe_name': sel.recipe.name,
+           'count': sel.count
+       })
 
    text = "📋 Managing selected recipes:\n\n"
    for sel in selected_data:
@@ -878,38 +807,34 @@ async def add_selected_recipe(callback: CallbackQuery):
    for sel in selected_data:
        count_text = f" (x{sel['count']})" if sel['count'] > 1 else ""
        builder.row(
-           InlineKeyboardButton(text=f"➖", callback_data=f"remove_selected_{sel['recipe_id']}"),
-           InlineKeyboardButton(text=f"{sel['recipe_name']}{count_text}", callback_data=f"view_selected_{sel['recipe_id']}"),
-           InlineKeyboardButton(text=f"➕", callback_data=f"add_selected_{sel['recipe_id']}")
+           InlineKeyboardButton(text=f"➖", callback_data=pack(Op.REMOVE_SELECTED, sel['recipe_id'])),
+           InlineKeyboardButton(text=f"{sel['recipe_name']}{count_text}", callback_data=pack(Op.VIEW_SELECTED, sel['recipe_id'])),
+           InlineKeyboardButton(text=f"➕", callback_data=pack(Op.ADD_SELECTED, sel['recipe_id']))
        )
 
-   builder.row(InlineKeyboardButton(text="◀️ Back to selection", callback_data="back_to_selection"))
-   builder.row(InlineKeyboardButton(text="🛍️ Add products", callback_data="add_temp_products"))
-   builder.row(InlineKeyboardButton(text="✅ Create shopping list", callback_data="create_shopping_list"))
-   builder.row(InlineKeyboardButton(text="🔄 Clear selection", callback_data="clear_selection"))
-   builder.row(InlineKeyboardButton(text="🏠 Main menu", callback_data="main_menu"))
+   builder.row(InlineKeyboardButton(text="◀️ Back to selection", callback_data=pack(Op.BACK_TO_SELECTION)))
+   builder.row(InlineKeyboardButton(text="🛍️ Add products", callback_data=pack(Op.ADD_TEMP_PRODUCTS)))
+   builder.row(InlineKeyboardButton(text="✅ Create shopping list", callback_data=pack(Op.CREATE_SHOPPING_LIST)))
+   builder.row(InlineKeyboardButton(text="🔄 Clear selection", callback_data=pack(Op.CLEAR_SELECTION)))
+   builder.row(InlineKeyboardButton(text="🏠 Main menu", callback_data=pack(Op.MAIN_MENU)))
 
    await safe_edit_or_send(callback, text, reply_markup=builder.as_markup())
 
-@additional_router.callback_query(F.data.startswith("remove_selected_"))
-async def remove_selected_recipe(callback: CallbackQuery):
-   recipe_id = int(callback.data.split("_")[2])
-   user_id = ""
-   with DatabaseManager() as db:
-       db.remove_selected_recipe(user_id, recipe_id)
-       selected_recipes = db.get_selected_recipes(user_id)
-
-       selected_data = []
-       for sel in selected_recipes:
-           selected_data.append({
-               'recipe_id': sel.recipe_id,
-               'recipe_name': sel.recipe.name,
-               'count': sel.count
-           })
+@callback_dispatcher.handler(Op.REMOVE_SELECTED)
+async def remove_selected_recipe(callback: CallbackQuery, user_id: str, db: AsyncDatabaseManager, recipe_id: int):
+   await db.remove_selected_recipe(user_id, recipe_id)
+   selected_recipes = await db.get_selected_recipes(user_id)
+
+   selected_data = []
+   for sel in selected_recipes:
+       selected_data.append({
+           'recipe_id': sel.recipe_id,
+           'recipe_name': sel.recipe.name,
+           'count': sel.count
+       })
 
    if not selected_data:
-       with DatabaseManager() as db:
-           recipes = db.get_recipes()
+       recipes = await db.get_recipes()
 
        text = "🧾 Creating menu\n\nSelect recipes for your menu:"
        await safe_edit_or_send(callback, text, reply_markup=get_recipes_list(recipes, "select"))
@@ -925,15 +850,15 @@ async def remove_selected_recipe(callback: CallbackQuery):
    for sel in selected_data:
        count_text = f" (x{sel['count']})" if sel['count'] > 1 else ""
        builder.row(
-           InlineKeyboardButton(text=f"➖", callback_data=f"remove_selected_{sel['recipe_id']}"),
-           InlineKeyboardButton(text=f"{sel['recipe_name']}{count_text}", callback_data=f"view_selected_{sel['recipe_id']}"),
-           InlineKeyboardButton(text=f"➕", callback_data=f"add_selected_{sel['recipe_id']}")
+           InlineKeyboardButton(text=f"➖", callback_data=pack(Op.REMOVE_SELECTED, sel['recipe_id'])),
+           InlineKeyboardButton(text=f"{sel['recipe_name']}{count_text}", callback_data=pack(Op.VIEW_SELECTED, sel['recipe_id'])),
+           InlineKeyboardButton(text=f"➕", callback_data=pack(Op.ADD_SELECTED, sel['recipe_id']))
        )
 
-   builder.row(InlineKeyboardButton(text="◀️ Back to selection", callback_data="back_to_selection"))
-   builder.row(InlineKeyboardButton(text="🛍️ Add products", callback_data="add_temp_products"))
-   builder.row(InlineKeyboardButton(text="✅ Create shopping list", callback_data="create_shopping_list"))
-   builder.row(InlineKeyboardButton(text="🔄 Clear selection", callback_data="clear_selection"))
-   builder.row(InlineKeyboardButton(text="🏠 Main menu", callback_data="main_menu"))
+   builder.row(InlineKeyboardButton(text="◀️ Back to selection", callback_data=pack(Op.BACK_TO_SELECTION)))
+   builder.row(InlineKeyboardButton(text="🛍️ Add products", callback_data=pack(Op.ADD_TEMP_PRODUCTS)))
+   builder.row(InlineKeyboardButton(text="✅ Create shopping list", callback_data=pack(Op.CREATE_SHOPPING_LIST)))
+   builder.row(InlineKeyboardButton(text="🔄 Clear selection", callback_data=pack(Op.CLEAR_SELECTION)))
+   builder.row(InlineKeyboardButton(text="🏠 Main menu", callback_data=pack(Op.MAIN_MENU)))
 
    await safe_edit_or_send(callback, text, reply_markup=builder.as_markup())
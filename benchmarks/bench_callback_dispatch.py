@@ -0,0 +1,171 @@
+"""Benchmark: finding the handler of a callback query.
+
+Registers the full set of callback handlers twice with no-op callbacks: once
+as the previous chain of F.data filters in router include order, and once in
+a CallbackDispatcher table built from what the handler modules register. Every
+registered operation is then fed through aiogram's router propagation, so the
+numbers include filter checks and handler invocation but no Telegram or
+database calls.
+
+Usage:
+    python benchmarks/bench_callback_dispatch.py [rounds]
+"""
+import asyncio
+import os
+import sys
+import time
+
+os.environ.setdefault("BOT_TOKEN", "0:benchmark")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiogram import F, Router
+from aiogram.types import CallbackQuery, User
+
+import additional_handlers, handlers, product_handlers, saved_data_handlers  # noqa: F401 - register handlers
+from callbacks import CallbackDispatcher, Op, callback_dispatcher, pack
+from states import MenuStates, RecipeStates, TempProductStates
+
+TEMP_ID = "3af70005-a865-4cf8-957c-a66611acdabf"
+
+# Previous filters in the order aiogram checked them: additional, products,
+# saved data, then main router. "==" is an exact match, "^" a prefix.
+LEGACY_FILTERS = [
+    ("==", "add_recipe", None, Op.ADD_RECIPE),
+    ("^", "unit_", RecipeStates.waiting_for_ingredient_quantity, Op.UNIT),
+    ("^", "category_", RecipeStates.waiting_for_ingredient_category, Op.INGREDIENT_CATEGORY),
+    ("==", "new_category", RecipeStates.waiting_for_ingredient_category, Op.NEW_CATEGORY),
+    ("==", "add_ingredient", None, Op.ADD_INGREDIENT),
+    ("==", "finish_recipe", None, Op.FINISH_RECIPE),
+    ("==", "edit_recipe", None, Op.RECIPES_TO_EDIT),
+    ("^", "edit_recipe_", None, Op.EDIT_RECIPE),
+    ("==", "reset_ingredients", None, Op.RESET_INGREDIENTS),
+    ("==", "delete_recipe", None, Op.RECIPES_TO_DELETE),
+    ("^", "delete_recipe_", None, Op.DELETE_RECIPE),
+    ("^", "confirm_delete_recipe_", None, Op.CONFIRM_DELETE_RECIPE),
+    ("^", "cancel_delete_recipe", None, Op.CANCEL_DELETE_RECIPE),
+    ("^", "select_recipe_", MenuStates.selecting_recipes, Op.SELECT_RECIPE),
+    ("==", "clear_selection", None, Op.CLEAR_SELECTION),
+    ("==", "create_shopping_list", None, Op.CREATE_SHOPPING_LIST),
+    ("==", "manage_selected", None, Op.MANAGE_SELECTED),
+    ("==", "back_to_selection", None, Op.BACK_TO_SELECTION),
+    ("==", "list_categories", None, Op.LIST_CATEGORIES),
+    ("==", "add_category", None, Op.ADD_CATEGORY),
+    ("==", "reorder_categories", None, Op.REORDER_CATEGORIES),
+    ("==", "finish_shopping", None, Op.FINISH_SHOPPING),
+    ("==", "confirm_finish_shopping", None, Op.CONFIRM_FINISH_SHOPPING),
+    ("==", "cancel_finish_shopping", None, Op.CANCEL_FINISH_SHOPPING),
+    ("==", "cancel", None, Op.CANCEL),
+    ("^", "add_selected_", None, Op.ADD_SELECTED),
+    ("^", "remove_selected_", None, Op.REMOVE_SELECTED),
+    ("==", "add_temp_products", None, Op.ADD_TEMP_PRODUCTS),
+    ("^", "unit_", TempProductStates.waiting_for_product_quantity, Op.UNIT),
+    ("^", "temp_category_", TempProductStates.waiting_for_product_category, Op.TEMP_CATEGORY),
+    ("==", "manage_temp_products", None, Op.MANAGE_TEMP_PRODUCTS),
+    ("^", "delete_temp_", None, Op.DELETE_TEMP),
+    ("^", "confirm_delete_temp_", None, Op.CONFIRM_DELETE_TEMP),
+    ("==", "clear_temp_products", None, Op.CLEAR_TEMP_PRODUCTS),
+    ("==", "confirm_clear_temp", None, Op.CONFIRM_CLEAR_TEMP),
+    ("==", "temp_products_back", None, Op.TEMP_PRODUCTS_BACK),
+    ("==", "create_list_with_temp", None, Op.CREATE_LIST_WITH_TEMP),
+    ("^", "toggle_temp_", None, Op.TOGGLE_TEMP),
+    # Never reached: its data was caught by "delete_temp_" above.
+    ("^", "delete_temp_from_list_", None, Op.DELETE_LIST_TEMP),
+    ("==", "cancel_temp_products", None, Op.CANCEL_TEMP_PRODUCTS),
+    ("==", "add_recipe_to_list", None, Op.RECIPES_FOR_LIST),
+    ("^", "add_recipe_to_list_", None, Op.ADD_RECIPE_TO_LIST),
+    ("==", "back_to_shopping_list", None, Op.BACK_TO_SHOPPING_LIST),
+    ("==", "saved_menu", None, Op.SAVED_MENU),
+    ("==", "saved_recipes", None, Op.SAVED_RECIPES),
+    ("^", "view_recipe_", None, Op.VIEW_RECIPE),
+    ("^", "delete_saved_recipe_", None, Op.DELETE_SAVED_RECIPE),
+    ("^", "confirm_delete_saved_recipe_", None, Op.CONFIRM_DELETE_SAVED_RECIPE),
+    ("==", "saved_products", None, Op.SAVED_PRODUCTS),
+    ("^", "view_saved_product_", None, Op.VIEW_SAVED_PRODUCT),
+    ("^", "edit_product_name_", None, Op.EDIT_PRODUCT_NAME),
+    ("^", "delete_product_confirm_", None, Op.DELETE_PRODUCT),
+    ("^", "confirm_delete_saved_product_", None, Op.CONFIRM_DELETE_SAVED_PRODUCT),
+    ("==", "saved_categories", None, Op.SAVED_CATEGORIES),
+    ("==", "main_menu", None, Op.MAIN_MENU),
+    ("==", "shopping_menu", None, Op.SHOPPING_MENU),
+    ("==", "compose_menu", None, Op.COMPOSE_MENU),
+    ("==", "recipes_menu", None, Op.RECIPES_MENU),
+    ("==", "categories_menu", None, Op.CATEGORIES_MENU),
+    ("^", "toggle_item_", None, Op.TOGGLE_ITEM),
+    ("^", "delete_item_", None, Op.DELETE_ITEM),
+]
+
+USER = User(id=1, is_bot=False, first_name="bench")
+
+async def noop(callback: CallbackQuery):
+    return True
+
+def sample_args(op: Op) -> list:
+    """Gets argument values of the same size as real ones."""
+    return [TEMP_ID if name == "temp_id" else "kg" if name == "unit" else 4217
+            for name, _ in op.fields]
+
+def legacy_router() -> Router:
+    router = Router()
+    for kind, value, state, _ in LEGACY_FILTERS:
+        data_filter = F.data == value if kind == "==" else F.data.startswith(value)
+        filters = (data_filter, state) if state else (data_filter,)
+        router.callback_query.register(noop, *filters)
+    return router
+
+def table_router() -> Router:
+    dispatcher = CallbackDispatcher()
+    for op, states in callback_dispatcher.registered().items():
+        for state in states:
+            dispatcher.handler(op, state)(noop)
+    return dispatcher.router
+
+def legacy_events() -> list:
+    events = []
+    for kind, value, state, op in LEGACY_FILTERS:
+        if kind == "^" and op.fields:
+            value += str(sample_args(op)[0])
+        events.append((op.name, value, state.state if state else None))
+    return events
+
+def table_events() -> list:
+    return [(op.name, pack(op, *sample_args(op)), state)
+            for op, states in callback_dispatcher.registered().items() for state in states]
+
+async def measure(label: str, router: Router, events: list, rounds: int) -> dict:
+    """Feeds every event rounds times, returns mean dispatch time per operation."""
+    queries = [(f"{name}/{state.split(':')[-1]}" if state else name,
+                CallbackQuery(id="1", from_user=USER, chat_instance="bench", data=data), state)
+               for name, data, state in events]
+    timings = {}
+
+    for name, query, state in queries:
+        result = await router.propagate_event("callback_query", query, raw_state=state)
+        assert result is True, f"{label}: {name} was not dispatched"
+
+    for _ in range(rounds):
+        for name, query, state in queries:
+            started = time.perf_counter()
+            await router.propagate_event("callback_query", query, raw_state=state)
+            timings[name] = timings.get(name, 0.0) + time.perf_counter() - started
+
+    per_op = {name: total / rounds for name, total in timings.items()}
+    mean = sum(per_op.values()) / len(per_op)
+    worst_name = max(per_op, key=per_op.get)
+    print(f"{label:<20} mean {mean * 1e6:8.1f} µs   "
+          f"worst {per_op[worst_name] * 1e6:8.1f} µs ({worst_name})   "
+          f"data {max(len(data.encode()) for _, data, _ in events)} bytes max")
+    return {'mean': mean, 'worst': per_op[worst_name]}
+
+async def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+
+    events = table_events()
+    print(f"{len(LEGACY_FILTERS)} legacy filters, {len(events)} table entries, {rounds} rounds\n")
+
+    legacy = await measure("F.data filter chain", legacy_router(), legacy_events(), rounds)
+    table = await measure("dispatch table", table_router(), events, rounds)
+
+    print(f"\nSpeedup: x{legacy['mean'] / table['mean']:.1f} mean, x{legacy['worst'] / table['worst']:.1f} worst case")
+
+if __name__ == "__main__":
+    asyncio.run(main())
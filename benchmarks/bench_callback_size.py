@@ -0,0 +1,73 @@
+"""Benchmark: size of shopping list keyboards on the wire, and callback data codec cost.
+
+Serializes the keyboard of a large shopping list the way it is sent to
+Telegram, once with the previous text callback data (uuid4 temp ids) and
+once as rendered now: base85 binary callback data with short temp ids. Then
+times pack and unpack of every operation.
+
+Usage:
+    python benchmarks/bench_callback_size.py [items] [temp_products] [rounds]
+"""
+import os
+import sys
+import time
+import uuid
+
+os.environ.setdefault("BOT_TOKEN", "0:benchmark")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_callback_dispatch import sample_args
+from bench_shopping_list_render import LIST_KEY, build_list, legacy_render
+from callbacks import Op, pack, unpack
+from shopping_list_renderer import ShoppingListRenderer
+
+def keyboard_stats(label: str, markup) -> int:
+    """Prints the serialized keyboard size and callback data totals, returns the size."""
+    data = [button.callback_data for row in markup.inline_keyboard for button in row if button.callback_data]
+    size = len(markup.model_dump_json(exclude_none=True).encode())
+    print(f"{label:<22} {size:8d} bytes   {len(data)} buttons   "
+          f"callback data {sum(len(d.encode()) for d in data):6d} bytes, "
+          f"{max(len(d.encode()) for d in data)} max")
+    return size
+
+def measure_codec(rounds: int):
+    """Times pack and unpack over every operation with realistic arguments."""
+    calls = [(op, sample_args(op)) for op in Op]
+    packed = [pack(op, *args) for op, args in calls]
+
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for op, args in calls:
+            pack(op, *args)
+    pack_time = (time.perf_counter() - started) / (rounds * len(calls))
+
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for data in packed:
+            unpack(data)
+    unpack_time = (time.perf_counter() - started) / (rounds * len(packed))
+
+    print(f"\npack   {pack_time * 1e6:6.2f} µs per call")
+    print(f"unpack {unpack_time * 1e6:6.2f} µs per call ({len(calls)} operations, {rounds} rounds)")
+
+def main():
+    items = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    temp_count = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    rounds = int(sys.argv[3]) if len(sys.argv) > 3 else 2000
+
+    shopping_items, temp_products = build_list(items, temp_count)
+    legacy_products = [{**product, 'temp_id': str(uuid.uuid4())} for product in temp_products]
+    print(f"List: {items} items + {temp_count} temp products\n")
+
+    _, legacy_markup = legacy_render(shopping_items, legacy_products)
+    _, markup = ShoppingListRenderer().render(LIST_KEY, shopping_items, temp_products)
+
+    legacy = keyboard_stats("text callback data", legacy_markup)
+    packed = keyboard_stats("packed callback data", markup)
+    print(f"\nKeyboard is {(1 - packed / legacy) * 100:.1f}% smaller")
+
+    measure_codec(rounds)
+
+if __name__ == "__main__":
+    main()
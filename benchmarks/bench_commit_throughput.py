@@ -0,0 +1,77 @@
+"""Benchmark: commit throughput of a toggle-heavy workload.
+
+Runs the same sequence of toggle_shopping_item calls (one commit each) against
+an engine with SQLite defaults and against the tuned engine profile from
+database.py (WAL, synchronous=NORMAL, busy_timeout, mmap and cache sizes).
+
+Usage:
+    python benchmarks/bench_commit_throughput.py [toggles] [items]
+"""
+import os
+import sys
+import tempfile
+import time
+
+WORK_DIR = tempfile.mkdtemp()
+os.environ.setdefault("BOT_TOKEN", "0:benchmark")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(WORK_DIR, 'tuned.db')}"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+from database import DatabaseManager, engine as tuned_engine
+from models import Base, Category, Product, ShoppingListItem
+
+USER_ID = "bench"
+
+def prepare(engine, items: int) -> list:
+    """Creates schema and a shopping list, returns item ids."""
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    try:
+        category = Category(name="Bench", order=1)
+        session.add(category)
+        session.flush()
+        products = [Product(name=f"Product {i}", category_id=category.id) for i in range(items)]
+        session.add_all(products)
+        session.flush()
+        list_items = [ShoppingListItem(product_id=p.id, quantity=1, unit="g", user_id=USER_ID) for p in products]
+        session.add_all(list_items)
+        session.commit()
+        return [item.id for item in list_items]
+    finally:
+        session.close()
+
+def run_toggles(engine, item_ids: list, toggles: int) -> float:
+    """Toggles items round-robin, one DatabaseManager commit per toggle."""
+    session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    started = time.perf_counter()
+    for i in range(toggles):
+        with DatabaseManager(session_factory()) as db:
+            db.toggle_shopping_item(item_ids[i % len(item_ids)], USER_ID)
+    return time.perf_counter() - started
+
+def describe(engine) -> str:
+    with engine.connect() as connection:
+        journal = connection.execute(text("PRAGMA journal_mode")).scalar()
+        synchronous = connection.execute(text("PRAGMA synchronous")).scalar()
+    return f"journal_mode={journal}, synchronous={synchronous}"
+
+def main():
+    toggles = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    items = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+
+    default_engine = create_engine(f"sqlite:///{os.path.join(WORK_DIR, 'default.db')}")
+
+    results = {}
+    for label, engine in (("SQLite defaults", default_engine), ("tuned profile", tuned_engine)):
+        item_ids = prepare(engine, items)
+        elapsed = run_toggles(engine, item_ids, toggles)
+        results[label] = toggles / elapsed
+        print(f"{label:<16} {describe(engine):<40} {results[label]:9.0f} commits/s")
+
+    print(f"\nSpeedup: x{results['tuned profile'] / results['SQLite defaults']:.1f} over {toggles} toggles")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Benchmark: event loop stalls while heavy DatabaseManager calls run.
+
+Loads a large shopping list many times at once, first through
+AsyncDatabaseManager on aiosqlite (queries awaited, ORM work on the event
+loop) and then through DatabaseExecutor (queries and ORM work on pool
+threads). A ticker task meanwhile measures how late the event loop wakes
+it up every 5 ms, i.e. how long a callback answer would have waited.
+
+Usage:
+    python benchmarks/bench_db_executor.py [items] [concurrent_calls]
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+WORK_DIR = tempfile.mkdtemp()
+os.environ.setdefault("BOT_TOKEN", "0:benchmark")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(WORK_DIR, 'bench.db')}"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import AsyncDatabaseManager, SessionLocal, async_engine, create_tables
+from db_executor import DatabaseExecutor
+from models import Category, Product, ShoppingListItem
+
+USER_ID = "bench"
+TICK = 0.005
+
+def prepare(items: int):
+    """Creates a shopping list of items products spread over the default categories."""
+    create_tables()
+    session = SessionLocal()
+    try:
+        categories = session.query(Category).all()
+        products = [Product(name=f"Product {i}", category_id=categories[i % len(categories)].id)
+                    for i in range(items)]
+        session.add_all(products)
+        session.flush()
+        session.add_all([ShoppingListItem(product_id=p.id, quantity=1, unit="g", user_id=USER_ID) for p in products])
+        session.commit()
+    finally:
+        session.close()
+
+async def ticker(lags: list, stop: asyncio.Event):
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(TICK)
+        lags.append(time.perf_counter() - started - TICK)
+
+async def load(executor) -> int:
+    async with AsyncDatabaseManager(executor=executor) as db:
+        return len(await db.get_shopping_list(USER_ID))
+
+async def measure(label: str, executor, calls: int, items: int):
+    lags, stop = [], asyncio.Event()
+    tick_task = asyncio.create_task(ticker(lags, stop))
+    started = time.perf_counter()
+    loaded = await asyncio.gather(*[load(executor) for _ in range(calls)])
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await tick_task
+
+    assert loaded == [items] * calls
+    lags.sort()
+    p99 = lags[int(len(lags) * 0.99)] if lags else 0
+    print(f"{label:<28} {elapsed:6.2f} s   {len(lags):4d} ticks, loop lag median {lags[len(lags) // 2] * 1000:5.1f} ms, "
+          f"p99 {p99 * 1000:6.1f} ms")
+
+async def main():
+    items = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    calls = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    prepare(items)
+    print(f"{calls} concurrent loads of a {items}-item shopping list\n")
+    executor = DatabaseExecutor()
+    try:
+        await measure("AsyncDatabaseManager", None, calls, items)
+        await measure(f"DatabaseExecutor, {executor.threads} threads", executor, calls, items)
+        print(f"\n{executor.get_stats()}")
+    finally:
+        await executor.close()
+        await async_engine.dispose()
+
+if __name__ == "__main__":
+    asyncio.run(main())
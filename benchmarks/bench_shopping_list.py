@@ -0,0 +1,126 @@
+"""Benchmark: shopping list generation from a synthetic weekly menu.
+
+Compares the previous ORM path (joinedload + Python dict aggregation) with
+the single INSERT ... SELECT used by DatabaseManager.create_shopping_list_from_selected.
+
+Usage:
+    python benchmarks/bench_shopping_list.py [recipes] [ingredients_per_recipe] [runs]
+"""
+import os
+import sys
+import tempfile
+import time
+
+DB_PATH = os.path.join(tempfile.mkdtemp(), "bench_shopping_list.db")
+os.environ.setdefault("BOT_TOKEN", "0:benchmark")
+os.environ["DATABASE_URL"] = f"sqlite:///{DB_PATH}"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy.orm import joinedload
+
+from database import DatabaseManager, create_tables
+from models import Recipe, RecipeIngredient, SelectedRecipe, ShoppingListItem
+
+USER_ID = "bench"
+
+def legacy_create_shopping_list(db: DatabaseManager, user_id: str):
+    """Previous implementation, kept here for comparison."""
+    db.session.query(ShoppingListItem).filter(ShoppingListItem.user_id == user_id).delete()
+    db.session.commit()
+
+    selected_recipes = (db.session.query(SelectedRecipe)
+                        .options(
+        joinedload(SelectedRecipe.recipe)
+        .joinedload(Recipe.ingredients)
+        .joinedload(RecipeIngredient.product)
+    )
+                        .filter(SelectedRecipe.user_id == user_id)
+                        .all())
+
+    ingredients_dict = {}
+    for selected in selected_recipes:
+        recipe = selected.recipe
+        if recipe:
+            for ingredient in recipe.ingredients:
+                key = (ingredient.product.name, ingredient.unit)
+                total_quantity = ingredient.quantity * selected.count
+                if key in ingredients_dict:
+                    ingredients_dict[key]['quantity'] += total_quantity
+                else:
+                    ingredients_dict[key] = {
+                        'product_id': ingredient.product_id,
+                        'quantity': total_quantity,
+                    }
+
+    for (product_name, unit), data in ingredients_dict.items():
+        db.session.add(ShoppingListItem(
+            product_id=data['product_id'],
+            quantity=data['quantity'],
+            unit=unit,
+            user_id=user_id
+        ))
+
+    db.session.query(SelectedRecipe).filter(SelectedRecipe.user_id == user_id).delete()
+    db.session.commit()
+
+def build_menu(recipes: int, ingredients_per_recipe: int) -> list:
+    """Creates synthetic recipes sharing a pool of products, returns recipe ids."""
+    product_pool = max(ingredients_per_recipe * 3, 10)
+    recipe_ids = []
+    with DatabaseManager() as db:
+        for r in range(recipes):
+            ingredients = [{
+                'product_name': f"Product {(r * 7 + i) % product_pool}",
+                'quantity': 10 + i,
+                'unit': "g" if i % 3 else "pcs",
+                'category': f"Category {i % 8}",
+            } for i in range(ingredients_per_recipe)]
+            recipe = db.create_recipe(f"Recipe {r}", USER_ID, ingredients)
+            recipe_ids.append(recipe.id)
+    return recipe_ids
+
+def select_menu(recipe_ids: list):
+    """Selects every recipe of the menu, some of them twice."""
+    with DatabaseManager() as db:
+        for i, recipe_id in enumerate(recipe_ids):
+            db.add_selected_recipe(USER_ID, recipe_id)
+            if i % 4 == 0:
+                db.add_selected_recipe(USER_ID, recipe_id)
+
+def snapshot() -> list:
+    with DatabaseManager() as db:
+        return sorted((item.product_id, item.unit, round(item.quantity, 6))
+                      for item in db.get_shopping_list(USER_ID))
+
+def measure(label: str, create, recipe_ids: list, runs: int) -> float:
+    timings = []
+    for _ in range(runs):
+        select_menu(recipe_ids)
+        with DatabaseManager() as db:
+            started = time.perf_counter()
+            create(db)
+            timings.append(time.perf_counter() - started)
+    timings.sort()
+    median = timings[len(timings) // 2]
+    print(f"{label:<20} median {median * 1000:8.2f} ms   min {timings[0] * 1000:8.2f} ms")
+    return median
+
+def main():
+    recipes = int(sys.argv[1]) if len(sys.argv) > 1 else 30
+    ingredients_per_recipe = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    runs = int(sys.argv[3]) if len(sys.argv) > 3 else 20
+
+    create_tables()
+    recipe_ids = build_menu(recipes, ingredients_per_recipe)
+    print(f"Menu: {recipes} recipes x {ingredients_per_recipe} ingredients, {runs} runs\n")
+
+    legacy = measure("legacy ORM path", lambda db: legacy_create_shopping_list(db, USER_ID), recipe_ids, runs)
+    legacy_items = snapshot()
+    current = measure("INSERT ... SELECT", lambda db: db.create_shopping_list_from_selected(USER_ID), recipe_ids, runs)
+    current_items = snapshot()
+
+    assert legacy_items == current_items, "both paths must produce the same shopping list"
+    print(f"\nSpeedup: x{legacy / current:.1f} ({len(current_items)} shopping list items)")
+
+if __name__ == "__main__":
+    main()
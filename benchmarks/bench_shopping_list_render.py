@@ -0,0 +1,136 @@
+"""Benchmark: rendering a large shopping list after a single toggle.
+
+Compares the previous per-handler loop (string concatenation + full keyboard
+rebuild) with ShoppingListRenderer, cold and warm. The warm case is what a
+toggle costs: one item changes, so only its category block is re-rendered.
+
+Usage:
+    python benchmarks/bench_shopping_list_render.py [items] [temp_products] [runs]
+"""
+import os
+import sys
+import time
+
+os.environ.setdefault("BOT_TOKEN", "0:benchmark")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiogram.types import InlineKeyboardButton
+from aiogram.utils.keyboard import InlineKeyboardBuilder
+
+from models import Category, Product, ShoppingListItem
+from shopping_list_renderer import ShoppingListRenderer
+from temp_product_store import new_temp_id
+
+LIST_KEY = "bench"
+
+def legacy_render(shopping_items: list, temp_products: list):
+    """Previous implementation, kept here for comparison."""
+    categories = {}
+
+    for item in shopping_items:
+        category_name = item.product.category.name
+        if category_name not in categories:
+            categories[category_name] = []
+        categories[category_name].append({'type': 'recipe', 'item': item})
+
+    for temp_product in temp_products:
+        category_name = temp_product['category']
+        if category_name not in categories:
+            categories[category_name] = []
+        categories[category_name].append({'type': 'temp', 'item': temp_product})
+
+    text = "🛒 Shopping list:\n\n"
+    for category_name, items in categories.items():
+        text += f"📦 {category_name}:\n"
+        for item_data in items:
+            item = item_data['item']
+            if item_data['type'] == 'recipe':
+                status = "✅" if item.is_bought else "⭕"
+                text += f"{status} {item.product.name} - {item.quantity} {item.unit}\n"
+            else:
+                status = "✅" if item['is_bought'] else "⭕"
+                text += f"{status} {item['name']} - {item['quantity']} {item['unit']} 🛍️\n"
+        text += "\n"
+
+    builder = InlineKeyboardBuilder()
+    for item in shopping_items:
+        status = "✅" if item.is_bought else "⭕"
+        builder.row(
+            InlineKeyboardButton(text=f"{status} {item.product.name} ({item.quantity} {item.unit})",
+                                 callback_data=f"toggle_item_{item.id}"),
+            InlineKeyboardButton(text="🗑", callback_data=f"delete_item_{item.id}")
+        )
+    for temp_product in temp_products:
+        status = "✅" if temp_product['is_bought'] else "⭕"
+        builder.row(
+            InlineKeyboardButton(text=f"{status} {temp_product['name']} ({temp_product['quantity']} {temp_product['unit']}) 🛍️",
+                                 callback_data=f"toggle_temp_{temp_product['temp_id']}"),
+            InlineKeyboardButton(text="🗑", callback_data=f"delete_temp_{temp_product['temp_id']}")
+        )
+    builder.row(
+        InlineKeyboardButton(text="🍽️ Add recipe", callback_data="add_recipe_to_list"),
+        InlineKeyboardButton(text="🛍️ Add products", callback_data="add_temp_products")
+    )
+    builder.row(InlineKeyboardButton(text="🏁 Finish shopping", callback_data="finish_shopping"))
+    builder.row(InlineKeyboardButton(text="🏠 Main menu", callback_data="main_menu"))
+
+    return text, builder.as_markup()
+
+def build_list(items: int, temp_count: int):
+    """Creates transient shopping list items spread over 12 categories."""
+    categories = [Category(id=c, name=f"Category {c}", order=c) for c in range(12)]
+    shopping_items = []
+    for i in range(items):
+        product = Product(id=i, name=f"Product {i}", category=categories[i % len(categories)])
+        shopping_items.append(ShoppingListItem(id=i, product=product, quantity=100 + i, unit="g",
+                                               is_bought=False, user_id=LIST_KEY))
+    temp_products = [{
+        'temp_id': new_temp_id(), 'name': f"Extra {i}", 'quantity': 1, 'unit': "pcs",
+        'category': f"Category {i % len(categories)}", 'is_bought': False,
+    } for i in range(temp_count)]
+    return shopping_items, temp_products
+
+def measure(label: str, render, shopping_items: list, runs: int) -> float:
+    """Toggles one item before every render and reports the median render time."""
+    timings = []
+    for run in range(runs):
+        item = shopping_items[run % len(shopping_items)]
+        item.is_bought = not item.is_bought
+        started = time.perf_counter()
+        render()
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    median = timings[len(timings) // 2]
+    print(f"{label:<22} median {median * 1000:8.3f} ms   min {timings[0] * 1000:8.3f} ms")
+    return median
+
+def main():
+    items = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    temp_count = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    runs = int(sys.argv[3]) if len(sys.argv) > 3 else 200
+
+    shopping_items, temp_products = build_list(items, temp_count)
+    print(f"List: {items} items + {temp_count} temp products, {runs} runs\n")
+
+    legacy = measure("legacy loop", lambda: legacy_render(shopping_items, temp_products), shopping_items, runs)
+
+    cold_renderer = ShoppingListRenderer()
+    def cold():
+        cold_renderer.forget(LIST_KEY)
+        return cold_renderer.render(LIST_KEY, shopping_items, temp_products)
+    cold_time = measure("renderer, cold", cold, shopping_items, runs)
+
+    warm_renderer = ShoppingListRenderer()
+    warm_renderer.render(LIST_KEY, shopping_items, temp_products)
+    warm = measure("renderer, after toggle",
+                   lambda: warm_renderer.render(LIST_KEY, shopping_items, temp_products), shopping_items, runs)
+
+    legacy_text, _ = legacy_render(shopping_items, temp_products)
+    text, _ = warm_renderer.render(LIST_KEY, shopping_items, temp_products)
+    assert legacy_text == text, "renderer must produce the same text as the legacy loop"
+
+    print(f"\nSpeedup after toggle: x{legacy / warm:.1f} over legacy, x{cold_time / warm:.1f} over cold render")
+    print(f"Blocks reused: {warm_renderer.blocks_reused}, re-rendered: {warm_renderer.blocks_rendered}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+from typing import Dict, Iterable, Optional
+
+class StatsCache:
+    """In-process cache of the Saved menu counters.
+
+    DatabaseManager invalidates it after committing writes that change the
+    number of recipes, products or categories. The version counter stops a
+    read that started before such a write from storing stale counters.
+    """
+
+    def __init__(self):
+        self._stats: Optional[Dict[str, int]] = None
+        self.version = 0
+        self.enabled = True
+
+    def get(self) -> Optional[Dict[str, int]]:
+        """Gets cached counters or None if they need to be reloaded."""
+        return self._stats if self.enabled else None
+
+    def set(self, stats: Dict[str, int], version: int):
+        """Stores counters loaded while the cache was at the given version."""
+        if version == self.version:
+            self._stats = dict(stats)
+
+    def invalidate(self):
+        """Drops cached counters."""
+        self.version += 1
+        self._stats = None
+
+stats_cache = StatsCache()
+
+class ShoppingListFlags:
+    """In-process per-user "shopping list is non-empty" flags.
+
+    DatabaseManager sets a flag after committing a write that is known to
+    leave the list empty or non-empty, and drops it when the outcome is not
+    known. Once warmed at startup, users without a flag have an empty list.
+    """
+
+    def __init__(self):
+        self._flags: Dict[str, Optional[bool]] = {}
+        self.complete = False
+        self.version = 0
+        self.enabled = True
+
+    def get(self, user_id: str) -> Optional[bool]:
+        """Gets the flag or None if it has to be loaded from the database."""
+        if not self.enabled:
+            return None
+        if user_id in self._flags:
+            return self._flags[user_id]
+        return False if self.complete else None
+
+    def set(self, user_id: str, has_items: bool):
+        """Stores the outcome of a committed write."""
+        self.version += 1
+        self._flags[user_id] = has_items
+
+    def load(self, user_id: str, has_items: bool, version: int):
+        """Stores a flag read while the cache was at the given version."""
+        if version == self.version:
+            self._flags[user_id] = has_items
+
+    def warm(self, user_ids: Iterable[str], version: int):
+        """Marks the given users as having a list and every other user as not."""
+        if version == self.version:
+            self._flags = {user_id: True for user_id in user_ids}
+            self.complete = True
+
+    def invalidate(self, user_id: Optional[str] = None):
+        """Drops the flag of one user, or of every user."""
+        self.version += 1
+        if user_id is None:
+            self._flags.clear()
+            self.complete = False
+        else:
+            self._flags[user_id] = None
+
+shopping_list_flags = ShoppingListFlags()
+
+def disable_shared_caches():
+    """Turns the caches off in a worker process, other workers write the same rows."""
+    stats_cache.enabled = False
+    shopping_list_flags.enabled = False
@@ -0,0 +1,250 @@
+import base64
+import uuid
+from enum import Enum
+from typing import Any, Dict, Optional, Tuple
+
+from aiogram import Router
+from aiogram.dispatcher.event.handler import CallableObject
+from aiogram.fsm.state import State
+from aiogram.types import CallbackQuery
+
+MAX_CALLBACK_DATA = 64
+UUID_BYTES = 16
+
+class ShortId(str):
+    """Hex id packed as raw bytes, half the length of its text."""
+
+class Op(Enum):
+    """Callback operations: a one-byte code and the typed arguments packed after it.
+
+    Codes end up in buttons of messages that were already sent, so a code
+    must never be reused for a different operation.
+    """
+
+    MAIN_MENU = (1,)
+    SHOPPING_MENU = (2,)
+    COMPOSE_MENU = (3,)
+    RECIPES_MENU = (4,)
+    CATEGORIES_MENU = (5,)
+    SAVED_MENU = (6,)
+    CANCEL = (7,)
+
+    TOGGLE_ITEM = (8, ("item_id", int))
+    DELETE_ITEM = (9, ("item_id", int))
+    TOGGLE_TEMP = (10, ("temp_id", ShortId))
+    DELETE_LIST_TEMP = (11, ("temp_id", ShortId))
+    FINISH_SHOPPING = (12,)
+    CONFIRM_FINISH_SHOPPING = (13,)
+    CANCEL_FINISH_SHOPPING = (14,)
+    RECIPES_FOR_LIST = (15,)
+    ADD_RECIPE_TO_LIST = (16, ("recipe_id", int))
+    BACK_TO_SHOPPING_LIST = (17,)
+
+    ADD_RECIPE = (18,)
+    UNIT = (19, ("unit", str))
+    INGREDIENT_CATEGORY = (20, ("category_id", int))
+    NEW_CATEGORY = (21,)
+    ADD_INGREDIENT = (22,)
+    FINISH_RECIPE = (23,)
+    RESET_INGREDIENTS = (24,)
+    RECIPES_TO_EDIT = (25,)
+    EDIT_RECIPE = (26, ("recipe_id", int))
+    RECIPES_TO_DELETE = (27,)
+    DELETE_RECIPE = (28, ("recipe_id", int))
+    CONFIRM_DELETE_RECIPE = (29, ("recipe_id", int))
+    CANCEL_DELETE_RECIPE = (30,)
+
+    SELECT_RECIPE = (31, ("recipe_id", int))
+    CLEAR_SELECTION = (32,)
+    CREATE_SHOPPING_LIST = (33,)
+    MANAGE_SELECTED = (34,)
+    BACK_TO_SELECTION = (35,)
+    ADD_SELECTED = (36, ("recipe_id", int))
+    REMOVE_SELECTED = (37, ("recipe_id", int))
+    VIEW_SELECTED = (38, ("recipe_id", int))
+
+    LIST_CATEGORIES = (39,)
+    ADD_CATEGORY = (40,)
+    REORDER_CATEGORIES = (41,)
+    # 42-44 were buttons of a category list no menu showed, don't reuse them.
+
+    ADD_TEMP_PRODUCTS = (45,)
+    TEMP_CATEGORY = (46, ("category_id", int))
+    MANAGE_TEMP_PRODUCTS = (47,)
+    VIEW_TEMP = (48, ("temp_id", ShortId))
+    DELETE_TEMP = (49, ("temp_id", ShortId))
+    CONFIRM_DELETE_TEMP = (50, ("temp_id", ShortId))
+    CLEAR_TEMP_PRODUCTS = (51,)
+    CONFIRM_CLEAR_TEMP = (52,)
+    TEMP_PRODUCTS_BACK = (53,)
+    CREATE_LIST_WITH_TEMP = (54,)
+    CANCEL_TEMP_PRODUCTS = (55,)
+
+    SAVED_RECIPES = (56,)
+    VIEW_RECIPE = (57, ("recipe_id", int))
+    DELETE_SAVED_RECIPE = (58, ("recipe_id", int))
+    CONFIRM_DELETE_SAVED_RECIPE = (59, ("recipe_id", int))
+    SAVED_PRODUCTS = (60,)
+    VIEW_SAVED_PRODUCT = (61, ("product_id", int))
+    EDIT_PRODUCT_NAME = (62, ("product_id", int))
+    DELETE_PRODUCT = (63, ("product_id", int))
+    CONFIRM_DELETE_SAVED_PRODUCT = (64, ("product_id", int))
+    SAVED_CATEGORIES = (65,)
+
+    def __init__(self, code: int, *fields: Tuple[str, type]):
+        self.code = code
+        self.fields = fields
+
+OPS_BY_CODE: Dict[int, Op] = {}
+for _op in Op:
+    if _op.code in OPS_BY_CODE or not 0 <= _op.code <= 255:
+        raise ValueError(f"Bad callback code {_op.code} of {_op.name}")
+    OPS_BY_CODE[_op.code] = _op
+
+def _write_int(out: bytearray, value) -> None:
+    value = int(value)
+    if value < 0:
+        raise ValueError("Negative ids can't be packed")
+    while value > 0x7f:
+        out.append(value & 0x7f | 0x80)
+        value >>= 7
+    out.append(value)
+
+def _read_int(raw: bytes, pos: int) -> Tuple[int, int]:
+    value = shift = 0
+    while shift < 64:
+        byte = raw[pos]
+        pos += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+    raise ValueError("Varint is too long")
+
+def _write_bytes(out: bytearray, value: bytes) -> None:
+    if len(value) > 255:
+        raise ValueError("Value is longer than 255 bytes")
+    out.append(len(value))
+    out += value
+
+def _read_bytes(raw: bytes, pos: int) -> Tuple[bytes, int]:
+    end = pos + 1 + raw[pos]
+    if end > len(raw):
+        raise ValueError("Value is truncated")
+    return raw[pos + 1:end], end
+
+def _write_str(out: bytearray, value) -> None:
+    _write_bytes(out, str(value).encode())
+
+def _read_str(raw: bytes, pos: int) -> Tuple[str, int]:
+    value, pos = _read_bytes(raw, pos)
+    return value.decode(), pos
+
+def _write_short_id(out: bytearray, value) -> None:
+    _write_bytes(out, bytes.fromhex(str(value).replace("-", "")))
+
+def _read_short_id(raw: bytes, pos: int) -> Tuple[str, int]:
+    value, pos = _read_bytes(raw, pos)
+    # 16 bytes are uuid4 ids of temp products created before short ids.
+    return str(uuid.UUID(bytes=value)) if len(value) == UUID_BYTES else value.hex(), pos
+
+WRITERS = {int: _write_int, str: _write_str, ShortId: _write_short_id}
+READERS = {int: _read_int, str: _read_str, ShortId: _read_short_id}
+
+def pack(op: Op, *args) -> str:
+    """Packs an operation and its arguments into base85 callback data.
+
+    Ints are written as varints, strings and short ids with a length byte.
+    """
+    if len(args) != len(op.fields):
+        raise ValueError(f"{op.name} takes {len(op.fields)} arguments, got {len(args)}")
+
+    raw = bytearray((op.code,))
+    for (_, field_type), value in zip(op.fields, args):
+        WRITERS[field_type](raw, value)
+
+    data = base64.b85encode(raw).decode()
+    if len(data) > MAX_CALLBACK_DATA:
+        raise ValueError(f"Callback data of {op.name} is longer than {MAX_CALLBACK_DATA} bytes")
+    return data
+
+def unpack(data: str) -> Optional[Tuple[Op, Dict[str, Any]]]:
+    """Gets the operation and typed arguments from callback data, None if it is not valid."""
+    try:
+        raw = base64.b85decode(data)
+        op = OPS_BY_CODE.get(raw[0])
+        if op is None:
+            return None
+
+        args = {}
+        pos = 1
+        for name, field_type in op.fields:
+            args[name], pos = READERS[field_type](raw, pos)
+    except (ValueError, IndexError):
+        return None
+
+    if pos != len(raw):
+        return None
+    return op, args
+
+class CallbackDispatcher:
+    """Routes callback queries to handlers by operation code.
+
+    Handlers are kept in a table keyed by operation and FSM state, so the
+    handler of a callback is found with two dict lookups instead of checking
+    every registered filter. A handler registered without a state runs in
+    any state, unless the operation also has a handler for the current one.
+    Unpacked arguments are passed to the handler by name, together with the
+    usual middleware data (state, user_id, db, ...). Middlewares see the
+    operation as callback_op. Callbacks no handler takes, such as buttons of
+    old messages, go to the fallback handler, with callback_op set to None.
+    """
+
+    def __init__(self, name: str = "callbacks"):
+        self.router = Router(name=name)
+        self.router.callback_query.register(self._dispatch, self._resolve)
+        self._handlers: Dict[Op, Dict[Optional[str], CallableObject]] = {}
+        self._fallback: Optional[CallableObject] = None
+
+    def handler(self, op: Op, state: Optional[State] = None):
+        """Registers a handler of op, optionally only for one FSM state."""
+        raw_state = state.state if isinstance(state, State) else state
+
+        def decorator(callback):
+            handlers = self._handlers.setdefault(op, {})
+            if raw_state in handlers:
+                raise ValueError(f"{op.name} already has a handler for state {raw_state}")
+            handlers[raw_state] = CallableObject(callback)
+            return callback
+
+        return decorator
+
+    def fallback(self, callback):
+        """Registers the handler of callbacks with data that can't be unpacked or has no handler in the current state."""
+        if self._fallback is not None:
+            raise ValueError("Fallback handler is already registered")
+        self._fallback = CallableObject(callback)
+        return callback
+
+    def registered(self) -> Dict[Op, Tuple[Optional[str], ...]]:
+        """Gets states every operation has handlers for."""
+        return {op: tuple(handlers) for op, handlers in self._handlers.items()}
+
+    def _resolve(self, callback: CallbackQuery, raw_state: Optional[str] = None):
+        unpacked = unpack(callback.data) if callback.data else None
+        if unpacked is not None:
+            op, args = unpacked
+            handlers = self._handlers.get(op, {})
+            handler = handlers.get(raw_state) or handlers.get(None)
+            if handler is not None:
+                return {'callback_op': op, 'callback_handler': handler, 'callback_args': args}
+
+        if self._fallback is None:
+            return False
+        return {'callback_op': None, 'callback_handler': self._fallback, 'callback_args': {}}
+
+    async def _dispatch(self, callback: CallbackQuery, callback_handler: CallableObject,
+                        callback_args: Dict[str, Any], **data):
+        return await callback_handler.call(callback, **data, **callback_args)
+
+callback_dispatcher = CallbackDispatcher()
@@ -1,16 +1,128 @@
 import os
+import re
 from dataclasses import dataclass
 
 # Create .env file with these variables:
 # BOT_TOKEN=your_bot_token_here
 # DATABASE_URL=sqlite:///recipe_bot.db
+# ASYNC_DATABASE_URL=sqlite+aiosqlite:///recipe_bot.db (derived from DATABASE_URL if empty)
 # ADMIN_IDS=123456789,987654321
 # ALLOWED_USERS=123456789,987654321
+#
+# SQLite engine profile (empty value leaves the SQLite default):
+# DB_JOURNAL_MODE=WAL
+# DB_SYNCHRONOUS=NORMAL
+# DB_BUSY_TIMEOUT_MS=5000
+# DB_MMAP_SIZE=268435456
+# DB_CACHE_SIZE=-20000
+# DB_FOREIGN_KEYS=true
+# DB_POOL_SIZE=5
+# DB_MAX_OVERFLOW=10
+# DB_POOL_TIMEOUT=30
+# DB_UPDATE_STATEMENTS_WARN=20
+#
+# Debug check for queries run in a loop: statements of an update are grouped
+# by their text without literals, one run more than DB_REPEATED_QUERY_LIMIT
+# times is printed (warn) or fails the update (fail):
+# DB_REPEATED_QUERIES=off
+# DB_REPEATED_QUERY_LIMIT=3
+#
+# Thread pool for DatabaseManager calls run off the event loop (db_executor.py);
+# ORM work holds the GIL, so more threads make the event loop itself wait:
+# DB_EXECUTOR_THREADS=2
+# DB_EXECUTOR_QUEUE=64
+# DB_EXECUTOR_TIMEOUT=10
+#
+# FSM storage (states of unfinished dialogs are kept in the database):
+# FSM_CACHE_SIZE=1000
+# FSM_STATE_TTL_HOURS=48
+#
+# Additional products added to a shopping list:
+# TEMP_PRODUCTS_PER_USER=100
+# TEMP_PRODUCTS_TTL_HOURS=168
+# TEMP_PRODUCTS_FLUSH_SECONDS=2
+#
+# Shopping list toggles of a chat are shown with one edit per window:
+# TOGGLE_DEBOUNCE_SECONDS=0.8
+#
+# Outgoing Telegram API calls (messages per second, RetryAfter retries):
+# TG_GLOBAL_RATE=30
+# TG_CHAT_RATE=1
+# TG_CHAT_BURST=3
+# TG_MAX_RETRIES=3
+#
+# Receiving updates: BOT_MODE=polling or webhook. In webhook mode the bot
+# serves WEBHOOK_PATH on WEBHOOK_HOST:WEBHOOK_PORT and registers
+# WEBHOOK_URL + WEBHOOK_PATH with Telegram if WEBHOOK_URL is set.
+# WEBHOOK_SECRET is required in webhook mode (1-256 of A-Z, a-z, 0-9, _ and -);
+# requests without it in the X-Telegram-Bot-Api-Secret-Token header are refused:
+# BOT_MODE=polling
+# WEBHOOK_URL=https://bot.example.com
+# WEBHOOK_PATH=/webhook
+# WEBHOOK_HOST=0.0.0.0
+# WEBHOOK_PORT=8080
+# WEBHOOK_SECRET=random_string
+#
+# Update handling: tasks and queued updates per process, and the number of
+# worker processes (more than 1 runs supervisor.py, updates are sharded by user):
+# UPDATE_TASKS=8
+# UPDATE_QUEUE_SIZE=1000
+# WORKERS=1
+#
+# Updates of one user running or waiting at once, more are dropped:
+# USER_MAX_PENDING=10
+#
+# Prometheus metrics at http://METRICS_HOST:METRICS_PORT/metrics (0 turns them
+# off; worker processes use the following ports):
+# METRICS_HOST=127.0.0.1
+# METRICS_PORT=9464
+#
+# Bot API server, e.g. a local one for testing (empty value uses api.telegram.org):
+# TELEGRAM_API_URL=http://127.0.0.1:8081
 
 @dataclass
 class Config:
    BOT_TOKEN: str = os.getenv("BOT_TOKEN", "")
    DATABASE_URL: str = os.getenv("DATABASE_URL", "sqlite:///recipe_bot.db")
+   ASYNC_DATABASE_URL: str = os.getenv("ASYNC_DATABASE_URL", "")
+   DB_JOURNAL_MODE: str = os.getenv("DB_JOURNAL_MODE", "WAL")
+   DB_SYNCHRONOUS: str = os.getenv("DB_SYNCHRONOUS", "NORMAL")
+   DB_BUSY_TIMEOUT_MS: int = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+   DB_MMAP_SIZE: int = int(os.getenv("DB_MMAP_SIZE", str(256 * 1024 * 1024)))
+   DB_CACHE_SIZE: int = int(os.getenv("DB_CACHE_SIZE", "-20000"))
+   DB_FOREIGN_KEYS: bool = os.getenv("DB_FOREIGN_KEYS", "true").lower() == "true"
+   DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", "5"))
+   DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+   DB_POOL_TIMEOUT: int = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+   DB_UPDATE_STATEMENTS_WARN: int = int(os.getenv("DB_UPDATE_STATEMENTS_WARN", "20"))
+   DB_REPEATED_QUERIES: str = os.getenv("DB_REPEATED_QUERIES", "off")
+   DB_REPEATED_QUERY_LIMIT: int = int(os.getenv("DB_REPEATED_QUERY_LIMIT", "3"))
+   DB_EXECUTOR_THREADS: int = int(os.getenv("DB_EXECUTOR_THREADS", "2"))
+   DB_EXECUTOR_QUEUE: int = int(os.getenv("DB_EXECUTOR_QUEUE", "64"))
+   DB_EXECUTOR_TIMEOUT: float = float(os.getenv("DB_EXECUTOR_TIMEOUT", "10"))
+   FSM_CACHE_SIZE: int = int(os.getenv("FSM_CACHE_SIZE", "1000"))
+   FSM_STATE_TTL_HOURS: int = int(os.getenv("FSM_STATE_TTL_HOURS", "48"))
+   TEMP_PRODUCTS_PER_USER: int = int(os.getenv("TEMP_PRODUCTS_PER_USER", "100"))
+   TEMP_PRODUCTS_TTL_HOURS: int = int(os.getenv("TEMP_PRODUCTS_TTL_HOURS", "168"))
+   TEMP_PRODUCTS_FLUSH_SECONDS: float = float(os.getenv("TEMP_PRODUCTS_FLUSH_SECONDS", "2"))
+   TOGGLE_DEBOUNCE_SECONDS: float = float(os.getenv("TOGGLE_DEBOUNCE_SECONDS", "0.8"))
+   TG_GLOBAL_RATE: float = float(os.getenv("TG_GLOBAL_RATE", "30"))
+   TG_CHAT_RATE: float = float(os.getenv("TG_CHAT_RATE", "1"))
+   TG_CHAT_BURST: float = float(os.getenv("TG_CHAT_BURST", "3"))
+   TG_MAX_RETRIES: int = int(os.getenv("TG_MAX_RETRIES", "3"))
+   BOT_MODE: str = os.getenv("BOT_MODE", "polling")
+   WEBHOOK_URL: str = os.getenv("WEBHOOK_URL", "")
+   WEBHOOK_PATH: str = os.getenv("WEBHOOK_PATH", "/webhook")
+   WEBHOOK_HOST: str = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+   WEBHOOK_PORT: int = int(os.getenv("WEBHOOK_PORT", "8080"))
+   WEBHOOK_SECRET: str = os.getenv("WEBHOOK_SECRET", "")
+   UPDATE_TASKS: int = int(os.getenv("UPDATE_TASKS", "8"))
+   UPDATE_QUEUE_SIZE: int = int(os.getenv("UPDATE_QUEUE_SIZE", "1000"))
+   WORKERS: int = int(os.getenv("WORKERS", "1"))
+   USER_MAX_PENDING: int = int(os.getenv("USER_MAX_PENDING", "10"))
+   TELEGRAM_API_URL: str = os.getenv("TELEGRAM_API_URL", "")
+   METRICS_HOST: str = os.getenv("METRICS_HOST", "127.0.0.1")
+   METRICS_PORT: int = int(os.getenv("METRICS_PORT", "9464"))
    ADMIN_IDS: list = None
    ALLOWED_USERS: list = None
 
@@ -27,7 +139,19 @@ class Config:
            self.ALLOWED_USERS = [int(id_) for id_ in allowed_users_str.split(",")
                                  if id_.strip().isdigit()] if allowed_users_str else []
 
+       if not self.ASYNC_DATABASE_URL:
+           self.ASYNC_DATABASE_URL = self.DATABASE_URL.replace("sqlite://", "sqlite+aiosqlite://", 1)
+
        if not self.BOT_TOKEN:
            raise ValueError("BOT_TOKEN is required")
 
+       if self.BOT_MODE not in ("polling", "webhook"):
+           raise ValueError("BOT_MODE must be polling or webhook")
+
+       if self.BOT_MODE == "webhook" and not re.fullmatch(r"[A-Za-z0-9_-]{1,256}", self.WEBHOOK_SECRET):
+           raise ValueError("WEBHOOK_SECRET of 1-256 characters A-Z, a-z, 0-9, _ or - is required in webhook mode")
+
+       if self.DB_REPEATED_QUERIES not in ("off", "warn", "fail"):
+           raise ValueError("DB_REPEATED_QUERIES must be off, warn or fail")
+
 config = Config()
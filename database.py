@@ -1,15 +1,233 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, inspect, select, insert, update, func, literal, text, String, Boolean
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.engine import Engine, make_url
 from sqlalchemy.orm import sessionmaker, Session, joinedload
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 from models import Base, Category, Product, Recipe, RecipeIngredient, ShoppingListItem, SelectedRecipe
 from config import config
-from typing import List, Optional
+from cache import stats_cache, shopping_list_flags
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+import time
 
-engine = create_engine(config.DATABASE_URL)
+def _is_sqlite_file(url: str) -> bool:
+    """Checks whether URL points to an on-disk SQLite database."""
+    parsed = make_url(url)
+    return parsed.get_backend_name() == "sqlite" and parsed.database not in (None, "", ":memory:")
+
+def _engine_options(url: str, is_async: bool = False) -> dict:
+    """Pool settings for an on-disk SQLite engine, taken from config."""
+    if not _is_sqlite_file(url):
+        return {}
+
+    return {
+        'poolclass': AsyncAdaptedQueuePool if is_async else QueuePool,
+        'pool_size': config.DB_POOL_SIZE,
+        'max_overflow': config.DB_MAX_OVERFLOW,
+        'pool_timeout': config.DB_POOL_TIMEOUT,
+        'pool_pre_ping': False,
+    }
+
+def apply_sqlite_profile(sync_engine: Engine):
+    """Applies journaling, durability and cache pragmas on every new SQLite connection.
+
+    The driver begins a transaction only before the first write, so reads
+    before it hold no snapshot and a later write waits for the lock instead
+    of failing. A SAVEPOINT issued before any write would open the
+    transaction itself, and its RELEASE would commit everything; such a
+    savepoint gets a BEGIN first.
+    """
+    pragmas = [
+        ("journal_mode", config.DB_JOURNAL_MODE),
+        ("synchronous", config.DB_SYNCHRONOUS),
+        ("busy_timeout", config.DB_BUSY_TIMEOUT_MS),
+        ("mmap_size", config.DB_MMAP_SIZE),
+        ("cache_size", config.DB_CACHE_SIZE),
+        ("foreign_keys", "ON" if config.DB_FOREIGN_KEYS else "OFF"),
+    ]
+    statements = [f"PRAGMA {name}={value}" for name, value in pragmas if value != ""]
+
+    @event.listens_for(sync_engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for statement in statements:
+            cursor.execute(statement)
+        cursor.close()
+
+    @event.listens_for(sync_engine, "savepoint")
+    def begin_before_savepoint(connection, name):
+        if not connection.connection.driver_connection.in_transaction:
+            connection.exec_driver_sql("BEGIN")
+
+engine = create_engine(config.DATABASE_URL, **_engine_options(config.DATABASE_URL))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+async_engine = create_async_engine(config.ASYNC_DATABASE_URL,
+                                   **_engine_options(config.ASYNC_DATABASE_URL, is_async=True))
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
+if engine.dialect.name == "sqlite":
+    apply_sqlite_profile(engine)
+if async_engine.dialect.name == "sqlite":
+    apply_sqlite_profile(async_engine.sync_engine)
+
+@event.listens_for(Session, "do_orm_execute")
+def _note_write_statement(orm_execute_state):
+    """Marks the session as holding uncommitted writes when it runs anything but a SELECT."""
+    if not orm_execute_state.is_select:
+        orm_execute_state.session.info['has_writes'] = True
+
+@event.listens_for(Session, "after_flush")
+def _note_flush(session: Session, flush_context):
+    """Marks the session as holding uncommitted writes after a flush."""
+    session.info['has_writes'] = True
+
+# Both also fire for savepoints, whose outer transaction goes on: hooks wait for it.
+@event.listens_for(Session, "after_commit")
+def _run_commit_hooks(session: Session):
+    """Runs hooks registered by DatabaseManager once their transaction is committed."""
+    if session.in_nested_transaction():
+        return
+    session.info.pop('has_writes', None)
+    session.info.pop('on_rollback', None)
+    for hook in session.info.pop('on_commit', []):
+        hook()
+
+@event.listens_for(Session, "after_rollback")
+def _drop_commit_hooks(session: Session):
+    """Discards hooks of a transaction that was rolled back and runs its rollback hooks."""
+    if session.in_nested_transaction():
+        return
+    session.info.pop('has_writes', None)
+    session.info.pop('on_commit', None)
+    for hook in session.info.pop('on_rollback', []):
+        hook()
+
+class StatementCounter:
+    """SQL statements run while handling one update and the time they took."""
+
+    def __init__(self):
+        self.statements = 0
+        self.seconds = 0.0
+
+# Counter of the current context, set by DatabaseMiddleware per update.
+statement_counter: ContextVar[Optional[StatementCounter]] = ContextVar('statement_counter', default=None)
+# Session of the update being processed, shared with other stores so their writes join its transaction.
+unit_of_work_session: ContextVar[Optional[AsyncSession]] = ContextVar('unit_of_work_session', default=None)
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    """Counts statements for the update that is being processed, if any, and notes when they start."""
+    counter = statement_counter.get()
+    if counter is not None:
+        counter.statements += 1
+        conn.info.setdefault('statement_started', []).append(time.perf_counter())
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _time_statement(conn, cursor, statement, parameters, context, executemany):
+    """Adds the time of a counted statement to the update's counter."""
+    counter = statement_counter.get()
+    started = conn.info.get('statement_started')
+    if counter is not None and started:
+        counter.seconds += time.perf_counter() - started.pop()
+
+@event.listens_for(Engine, "handle_error")
+def _drop_statement_timer(exception_context):
+    """Forgets the start of a statement that failed."""
+    connection = exception_context.connection
+    started = connection.info.get('statement_started') if connection is not None else None
+    if started:
+        started.pop()
+
+def migrate_schema():
+    """Brings an existing database up to the current schema.
+
+    Creates indexes that were added to the models after the tables were
+    created. Duplicate selected recipes are merged first, so the unique
+    (user_id, recipe_id) index can be built. Rows shared under an empty
+    user_id are handed over to the first admin or allowed user.
+    """
+    existing_indexes = {
+        table_name: {index['name'] for index in inspect(engine).get_indexes(table_name)}
+        for table_name in Base.metadata.tables
+    }
+
+    with engine.begin() as connection:
+        if 'uq_selected_recipes_user_id_recipe_id' not in existing_indexes['selected_recipes']:
+            connection.execute(text(
+                "UPDATE selected_recipes SET count = ("
+                "  SELECT SUM(s.count) FROM selected_recipes s"
+                "  WHERE s.user_id IS selected_recipes.user_id AND s.recipe_id = selected_recipes.recipe_id"
+                ") WHERE id IN ("
+                "  SELECT MIN(id) FROM selected_recipes GROUP BY user_id, recipe_id HAVING COUNT(*) > 1"
+                ")"
+            ))
+            connection.execute(text(
+                "DELETE FROM selected_recipes WHERE id NOT IN ("
+                "  SELECT MIN(id) FROM selected_recipes GROUP BY user_id, recipe_id"
+                ")"
+            ))
+
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                if index.name not in existing_indexes[table.name]:
+                    index.create(bind=connection)
+
+        owner_id = _legacy_owner_id()
+        if owner_id:
+            _move_shared_rows(connection, owner_id)
+
+def _legacy_owner_id() -> Optional[str]:
+    """Gets the user that inherits rows saved before data was kept per user."""
+    user_ids = config.ADMIN_IDS or config.ALLOWED_USERS
+    return str(user_ids[0]) if user_ids else None
+
+SHARED_USER = "(user_id = '' OR user_id IS NULL)"
+# Tables whose moved rows are merged into rows of the owner with the same key: (key columns, summed column).
+MERGED_ON_MOVE = {
+    'selected_recipes': (('recipe_id',), 'count'),
+    'shopping_list': (('product_id', 'unit'), 'quantity'),
+}
+
+def _move_shared_rows(connection, owner_id: str):
+    """Moves rows saved with an empty user_id to the given user.
+
+    Earlier versions stored everything under user_id "" (or NULL). Does
+    nothing once no such rows are left, so it runs only on the first start
+    after an upgrade. Selected recipes and shopping list items the owner
+    already has are merged into the owner's first row.
+    """
+    tables = ('selected_recipes', 'shopping_list', 'recipes', 'temp_products')
+    if not any(connection.execute(text(f"SELECT 1 FROM {table} WHERE {SHARED_USER} LIMIT 1")).first()
+               for table in tables):
+        return
+
+    params = {'owner_id': owner_id}
+    for table, (key_columns, summed) in MERGED_ON_MOVE.items():
+        keys = ", ".join(key_columns)
+        same_key = " AND ".join(f"s.{column} IS {table}.{column}" for column in key_columns)
+        moved = f"(user_id = :owner_id OR {SHARED_USER})"
+        first_rows = f"SELECT MIN(id) FROM {table} WHERE {moved} GROUP BY {keys}"
+        has_shared = f"EXISTS (SELECT 1 FROM {table} s WHERE {same_key} AND (s.user_id = '' OR s.user_id IS NULL))"
+        connection.execute(text(
+            f"UPDATE {table} SET {summed} = ("
+            f"  SELECT SUM(s.{summed}) FROM {table} s"
+            f"  WHERE {same_key} AND (s.user_id = :owner_id OR s.user_id = '' OR s.user_id IS NULL)"
+            f") WHERE id IN ({first_rows}) AND {has_shared}"
+        ), params)
+        connection.execute(text(
+            f"DELETE FROM {table} WHERE {moved} AND id NOT IN ({first_rows}) AND {has_shared}"
+        ), params)
+
+    for table in tables:
+        connection.execute(text(f"UPDATE {table} SET user_id = :owner_id WHERE {SHARED_USER}"), params)
+
 def create_tables():
-    """Creates database tables and default categories."""
+    """Creates database tables, missing indexes and default categories."""
     Base.metadata.create_all(bind=engine)
+    migrate_schema()
 
     session = SessionLocal()
     try:
@@ -33,11 +251,29 @@ def create_tables():
     finally:
         session.close()
 
+def warm_shopping_list_flags():
+    """Loads which users have a non-empty shopping list with one query."""
+    session = SessionLocal()
+    try:
+        version = shopping_list_flags.version
+        user_ids = session.execute(select(ShoppingListItem.user_id).distinct()).scalars().all()
+        shopping_list_flags.warm(user_ids, version)
+    finally:
+        session.close()
+
 class DatabaseManager:
-    """Database operations manager with context manager support."""
+    """Database operations manager with context manager support.
 
-    def __init__(self):
-        self.session = SessionLocal()
+    With autocommit=False write methods only flush, and the caller commits
+    the whole unit of work (see DatabaseMiddleware). Writes that can fail
+    halfway run in a savepoint and undo only their own statements: some
+    return False, the others raise and leave the rest of the transaction
+    to whoever owns it.
+    """
+
+    def __init__(self, session: Optional[Session] = None, autocommit: bool = True):
+        self.session = session or SessionLocal()
+        self.autocommit = autocommit
 
     def __enter__(self):
         return self
@@ -45,6 +281,17 @@ class DatabaseManager:
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.session.close()
 
+    def _commit(self):
+        """Commits the transaction, or only flushes it inside a unit of work."""
+        if self.autocommit:
+            self.session.commit()
+        else:
+            self.session.flush()
+
+    def _on_commit(self, hook):
+        """Registers a callable to run after the current transaction commits."""
+        self.session.info.setdefault('on_commit', []).append(hook)
+
     def get_categories(self) -> List[Category]:
         """Gets all categories ordered by their order field."""
         return self.session.query(Category).order_by(Category.order).all()
@@ -53,12 +300,25 @@ class DatabaseManager:
         """Gets category by name."""
         return self.session.query(Category).filter(Category.name == name).first()
 
+    def get_category_by_id(self, category_id: int) -> Optional[Category]:
+        """Gets category by ID."""
+        return self.session.query(Category).filter(Category.id == category_id).first()
+
+    def get_categories_with_product_counts(self) -> List[Tuple[Category, int]]:
+        """Gets all categories with their product counts in one query."""
+        return (self.session.query(Category, func.count(Product.id))
+                .outerjoin(Product, Product.category_id == Category.id)
+                .group_by(Category.id)
+                .order_by(Category.order)
+                .all())
+
     def create_category(self, name: str) -> Category:
         """Creates new category with auto-incremented order."""
         max_order = self.session.query(Category).count()
         category = Category(name=name, order=max_order + 1)
         self.session.add(category)
-        self.session.commit()
+        self._on_commit(stats_cache.invalidate)
+        self._commit()
         return category
 
     def update_category_order(self, category_id: int, new_order: int):
@@ -66,7 +326,7 @@ class DatabaseManager:
         category = self.session.query(Category).filter(Category.id == category_id).first()
         if category:
             category.order = new_order
-            self.session.commit()
+            self._commit()
 
     def delete_category(self, category_id: int) -> bool:
         """Deletes category if it has no products."""
@@ -75,7 +335,8 @@ class DatabaseManager:
             products_count = self.session.query(Product).filter(Product.category_id == category_id).count()
             if products_count == 0:
                 self.session.delete(category)
-                self.session.commit()
+                self._on_commit(stats_cache.invalidate)
+                self._commit()
                 return True
         return False
 
@@ -91,6 +352,20 @@ class DatabaseManager:
         """Counts total number of categories."""
         return self.session.query(Category).count()
 
+    def get_stats(self) -> Dict[str, int]:
+        """Gets recipes, products and categories counters, cached until they change."""
+        stats = stats_cache.get()
+        if stats is None:
+            version = stats_cache.version
+            recipes, products, categories = self.session.query(
+                self.session.query(func.count(Recipe.id)).scalar_subquery(),
+                self.session.query(func.count(Product.id)).scalar_subquery(),
+                self.session.query(func.count(Category.id)).scalar_subquery()
+            ).one()
+            stats = {'recipes': recipes, 'products': products, 'categories': categories}
+            stats_cache.set(stats, version)
+        return stats
+
     def count_products_in_category(self, category_id: int) -> int:
         """Counts products in specific category."""
         return self.session.query(Product).filter(Product.category_id == category_id).count()
@@ -129,7 +404,8 @@ class DatabaseManager:
         """Creates new product in specified category."""
         product = Product(name=name, category_id=category_id)
         self.session.add(product)
-        self.session.commit()
+        self._on_commit(stats_cache.invalidate)
+        self._commit()
         return product
 
     def get_or_create_product(self, name: str, category_name: str) -> Product:
@@ -157,16 +433,19 @@ class DatabaseManager:
     def delete_product(self, product_id: int) -> bool:
         """Deletes product and all related records."""
         try:
-            self.session.query(RecipeIngredient).filter(RecipeIngredient.product_id == product_id).delete()
-            self.session.query(ShoppingListItem).filter(ShoppingListItem.product_id == product_id).delete()
-            self.session.query(Product).filter(Product.id == product_id).delete()
-            self.session.commit()
-            return True
+            with self.session.begin_nested():
+                self.session.query(RecipeIngredient).filter(RecipeIngredient.product_id == product_id).delete()
+                self.session.query(ShoppingListItem).filter(ShoppingListItem.product_id == product_id).delete()
+                self.session.query(Product).filter(Product.id == product_id).delete()
         except Exception as e:
-            self.session.rollback()
             print(f"Error deleting product: {e}")
             return False
 
+        self._on_commit(stats_cache.invalidate)
+        self._on_commit(shopping_list_flags.invalidate)
+        self._commit()
+        return True
+
     def get_recipes(self, user_id: str = None) -> List[Recipe]:
         """Gets all recipes, optionally filtered by user."""
         query = self.session.query(Recipe)
@@ -183,74 +462,168 @@ class DatabaseManager:
             .joinedload(Product.category)
         )
                 .filter(Recipe.id == recipe_id)
+                .populate_existing()
                 .first())
 
+    def _dialect_insert(self, model):
+        """Builds dialect-specific INSERT that supports ON CONFLICT clauses."""
+        if self.session.get_bind().dialect.name == "postgresql":
+            return postgresql_insert(model)
+        return sqlite_insert(model)
+
+    def _resolve_categories(self, names: List[str]) -> Dict[str, int]:
+        """Maps category names to ids, inserting missing categories in bulk."""
+        category_ids = dict(self.session.query(Category.name, Category.id)
+                            .filter(Category.name.in_(names))
+                            .all())
+        missing = [name for name in names if name not in category_ids]
+
+        if missing:
+            self._on_commit(stats_cache.invalidate)
+            max_order = self.session.query(func.count(Category.id)).scalar()
+            self.session.execute(
+                self._dialect_insert(Category).on_conflict_do_nothing(),
+                [{'name': name, 'order': max_order + i} for i, name in enumerate(missing, 1)]
+            )
+            category_ids.update(self.session.query(Category.name, Category.id)
+                                .filter(Category.name.in_(missing))
+                                .all())
+
+        return category_ids
+
+    def _resolve_products(self, ingredients: List[dict]) -> Dict[str, int]:
+        """Maps ingredient product names to product ids without committing.
+
+        Existing products are fetched with one IN query. Missing categories and
+        products are inserted in bulk with ON CONFLICT DO NOTHING and read back,
+        so a product created concurrently by another user is reused, not duplicated.
+        """
+        category_by_product = {}
+        for ing in ingredients:
+            category_by_product.setdefault(ing['product_name'], ing.get('category', 'Other'))
+
+        names = list(category_by_product)
+        product_ids = dict(self.session.query(Product.name, Product.id)
+                           .filter(Product.name.in_(names))
+                           .all())
+        missing = [name for name in names if name not in product_ids]
+
+        if missing:
+            self._on_commit(stats_cache.invalidate)
+            category_ids = self._resolve_categories(
+                list(dict.fromkeys(category_by_product[name] for name in missing))
+            )
+            self.session.execute(
+                self._dialect_insert(Product).on_conflict_do_nothing(),
+                [{'name': name, 'category_id': category_ids[category_by_product[name]]} for name in missing]
+            )
+            product_ids.update(self.session.query(Product.name, Product.id)
+                               .filter(Product.name.in_(missing))
+                               .all())
+
+        return product_ids
+
+    def _insert_ingredients(self, recipe_id: int, ingredients: List[dict]):
+        """Inserts recipe ingredients with a single executemany, without committing."""
+        if not ingredients:
+            return
+
+        product_ids = self._resolve_products(ingredients)
+        self.session.execute(insert(RecipeIngredient), [
+            {
+                'recipe_id': recipe_id,
+                'product_id': product_ids[ing['product_name']],
+                'quantity': ing['quantity'],
+                'unit': ing.get('unit', 'g')
+            }
+            for ing in ingredients
+        ])
+
     def create_recipe(self, name: str, user_id: str, ingredients: List[dict]) -> Recipe:
-        """Creates new recipe with ingredients."""
+        """Creates new recipe with ingredients in one transaction."""
         recipe = Recipe(name=name, user_id=user_id)
         self.session.add(recipe)
         self.session.flush()
+        self._on_commit(stats_cache.invalidate)
 
-        for ing in ingredients:
-            product = self.get_product_by_name(ing['product_name'])
-            if not product:
-                category = self.get_category_by_name(ing.get('category', 'Other'))
-                if not category:
-                    category = self.create_category(ing.get('category', 'Other'))
-                product = self.create_product(ing['product_name'], category.id)
-
-            recipe_ingredient = RecipeIngredient(
-                recipe_id=recipe.id,
-                product_id=product.id,
-                quantity=ing['quantity'],
-                unit=ing.get('unit', 'g')
-            )
-            self.session.add(recipe_ingredient)
+        self._insert_ingredients(recipe.id, ingredients)
 
-        self.session.commit()
+        self._commit()
         return recipe
 
     def update_recipe(self, recipe_id: int, name: str, ingredients: List[dict]):
-        """Updates existing recipe with new ingredients."""
+        """Updates existing recipe, writing only the ingredient rows that changed.
+
+        Stored ingredients are matched to the new ones by product, so unchanged
+        rows keep their ids and are not rewritten; only the needed UPDATE,
+        INSERT and DELETE statements are issued.
+        """
         recipe = self.session.query(Recipe).filter(Recipe.id == recipe_id).first()
-        if recipe:
+        if not recipe:
+            return
+
+        if recipe.name != name:
             recipe.name = name
-            self.session.query(RecipeIngredient).filter(RecipeIngredient.recipe_id == recipe_id).delete()
-
-            for ing in ingredients:
-                product = self.get_product_by_name(ing['product_name'])
-                if not product:
-                    category = self.get_category_by_name(ing.get('category', 'Other'))
-                    if not category:
-                        category = self.create_category(ing.get('category', 'Other'))
-                    product = self.create_product(ing['product_name'], category.id)
-
-                recipe_ingredient = RecipeIngredient(
-                    recipe_id=recipe.id,
-                    product_id=product.id,
-                    quantity=ing['quantity'],
-                    unit=ing.get('unit', 'g')
-                )
-                self.session.add(recipe_ingredient)
 
-            self.session.commit()
+        stored_by_product = {}
+        for row in (self.session.query(RecipeIngredient.id, RecipeIngredient.product_id,
+                                       RecipeIngredient.quantity, RecipeIngredient.unit)
+                    .filter(RecipeIngredient.recipe_id == recipe_id)
+                    .order_by(RecipeIngredient.id)):
+            stored_by_product.setdefault(row.product_id, []).append(row)
+
+        product_ids = self._resolve_products(ingredients) if ingredients else {}
+        updates = []
+        inserts = []
+
+        for ing in ingredients:
+            product_id = product_ids[ing['product_name']]
+            unit = ing.get('unit', 'g')
+            stored_rows = stored_by_product.get(product_id)
+
+            if stored_rows:
+                row = stored_rows.pop(0)
+                if row.quantity != ing['quantity'] or row.unit != unit:
+                    updates.append({'id': row.id, 'quantity': ing['quantity'], 'unit': unit})
+            else:
+                inserts.append({
+                    'recipe_id': recipe_id,
+                    'product_id': product_id,
+                    'quantity': ing['quantity'],
+                    'unit': unit
+                })
+
+        deletes = [row.id for rows in stored_by_product.values() for row in rows]
+
+        if updates:
+            self.session.execute(update(RecipeIngredient), updates)
+        if inserts:
+            self.session.execute(insert(RecipeIngredient), inserts)
+        if deletes:
+            (self.session.query(RecipeIngredient)
+             .filter(RecipeIngredient.id.in_(deletes))
+             .delete(synchronize_session=False))
+
+        self._commit()
 
     def delete_recipe(self, recipe_id: int) -> bool:
         """Deletes recipe and all related records."""
         try:
-            recipe = self.session.query(Recipe).filter(Recipe.id == recipe_id).first()
-            if recipe:
+            with self.session.begin_nested():
+                # All three are bulk deletes: an ORM delete of the recipe would cascade
+                # again to ingredients already loaded by the handler and removed here.
                 self.session.query(RecipeIngredient).filter(RecipeIngredient.recipe_id == recipe_id).delete()
                 self.session.query(SelectedRecipe).filter(SelectedRecipe.recipe_id == recipe_id).delete()
-                self.session.delete(recipe)
-                self.session.commit()
-                return True
-            return False
+                deleted = self.session.query(Recipe).filter(Recipe.id == recipe_id).delete()
         except Exception as e:
-            self.session.rollback()
             print(f"Error deleting recipe: {e}")
             return False
 
+        if deleted:
+            self._on_commit(stats_cache.invalidate)
+        self._commit()
+        return bool(deleted)
+
     def get_shopping_list(self, user_id: str) -> List[ShoppingListItem]:
         """Gets user's shopping list ordered by category."""
         return (self.session.query(ShoppingListItem)
@@ -262,12 +635,25 @@ class DatabaseManager:
                 .join(Product)
                 .join(Category)
                 .order_by(Category.order, Product.name)
+                .populate_existing()
                 .all())
 
+    def has_shopping_list(self, user_id: str) -> bool:
+        """Checks if user's shopping list has items, cached until it changes."""
+        has_items = shopping_list_flags.get(user_id)
+        if has_items is None:
+            version = shopping_list_flags.version
+            has_items = self.session.query(
+                self.session.query(ShoppingListItem).filter(ShoppingListItem.user_id == user_id).exists()
+            ).scalar()
+            shopping_list_flags.load(user_id, has_items, version)
+        return has_items
+
     def clear_shopping_list(self, user_id: str):
         """Clears user's shopping list."""
         self.session.query(ShoppingListItem).filter(ShoppingListItem.user_id == user_id).delete()
-        self.session.commit()
+        self._on_commit(lambda: shopping_list_flags.set(user_id, False))
+        self._commit()
 
     def toggle_shopping_item(self, item_id: int, user_id: str):
         """Toggles shopping item bought status."""
@@ -276,7 +662,22 @@ class DatabaseManager:
                 .first())
         if item:
             item.is_bought = not item.is_bought
-            self.session.commit()
+            self._commit()
+
+    def toggle_shopping_items(self, item_ids: List[int], user_id: str) -> int:
+        """Toggles bought status of several items with one UPDATE, returns number of toggled items."""
+        if not item_ids:
+            return 0
+        toggled = (self.session.query(ShoppingListItem)
+                   .filter(ShoppingListItem.id.in_(item_ids), ShoppingListItem.user_id == user_id)
+                   .update({ShoppingListItem.is_bought: ~ShoppingListItem.is_bought}, synchronize_session=False))
+        self._commit()
+        return toggled
+
+    def toggle_shopping_items_and_get_list(self, item_ids: List[int], user_id: str) -> List[ShoppingListItem]:
+        """Toggles bought status of several items and gets the updated shopping list."""
+        self.toggle_shopping_items(item_ids, user_id)
+        return self.get_shopping_list(user_id)
 
     def delete_shopping_item(self, item_id: int, user_id: str):
         """Deletes item from shopping list."""
@@ -285,28 +686,27 @@ class DatabaseManager:
                 .first())
         if item:
             self.session.delete(item)
-            self.session.commit()
+            self._on_commit(lambda: shopping_list_flags.invalidate(user_id))
+            self._commit()
 
     def get_selected_recipes(self, user_id: str) -> List[SelectedRecipe]:
         """Gets user's selected recipes."""
         return (self.session.query(SelectedRecipe)
                 .options(joinedload(SelectedRecipe.recipe))
                 .filter(SelectedRecipe.user_id == user_id)
+                .populate_existing()
                 .all())
 
     def add_selected_recipe(self, user_id: str, recipe_id: int):
         """Adds recipe to selection or increases count."""
-        existing = (self.session.query(SelectedRecipe)
-                    .filter(SelectedRecipe.user_id == user_id, SelectedRecipe.recipe_id == recipe_id)
-                    .first())
-
-        if existing:
-            existing.count += 1
-        else:
-            selected = SelectedRecipe(user_id=user_id, recipe_id=recipe_id, count=1)
-            self.session.add(selected)
-
-        self.session.commit()
+        statement = (self._dialect_insert(SelectedRecipe)
+                     .values(user_id=user_id, recipe_id=recipe_id, count=1)
+                     .on_conflict_do_update(
+                         index_elements=['user_id', 'recipe_id'],
+                         set_={'count': SelectedRecipe.count + 1}
+                     ))
+        self.session.execute(statement)
+        self._commit()
 
     def remove_selected_recipe(self, user_id: str, recipe_id: int):
         """Removes recipe from selection or decreases count."""
@@ -319,95 +719,311 @@ class DatabaseManager:
                 selected.count -= 1
             else:
                 self.session.delete(selected)
-            self.session.commit()
+            self._commit()
 
     def clear_selected_recipes(self, user_id: str):
         """Clears all selected recipes for user."""
         self.session.query(SelectedRecipe).filter(SelectedRecipe.user_id == user_id).delete()
-        self.session.commit()
+        self._commit()
 
     def create_shopping_list_from_selected(self, user_id: str):
-        """Creates shopping list from selected recipes."""
-        self.clear_shopping_list(user_id)
+        """Creates shopping list from selected recipes in a single transaction.
 
-        selected_recipes = (self.session.query(SelectedRecipe)
-                            .options(
-            joinedload(SelectedRecipe.recipe)
-            .joinedload(Recipe.ingredients)
-            .joinedload(RecipeIngredient.product)
-        )
-                            .filter(SelectedRecipe.user_id == user_id)
-                            .all())
+        Quantities are summed in SQL with one INSERT ... SELECT grouped by
+        product and unit, so no recipe or ingredient objects are loaded.
+        """
+        total_quantity = func.sum(RecipeIngredient.quantity * SelectedRecipe.count)
+        aggregated = (select(RecipeIngredient.product_id,
+                             total_quantity,
+                             RecipeIngredient.unit,
+                             literal(user_id, String),
+                             literal(False, Boolean))
+                      .select_from(SelectedRecipe)
+                      .join(RecipeIngredient, RecipeIngredient.recipe_id == SelectedRecipe.recipe_id)
+                      .filter(SelectedRecipe.user_id == user_id)
+                      .group_by(RecipeIngredient.product_id, RecipeIngredient.unit))
 
-        ingredients_dict = {}
-
-        for selected in selected_recipes:
-            recipe = selected.recipe
-            if recipe:
-                for ingredient in recipe.ingredients:
-                    product_name = ingredient.product.name
-                    key = (product_name, ingredient.unit)
-
-                    total_quantity = ingredient.quantity * selected.count
-
-                    if key in ingredients_dict:
-                        ingredients_dict[key]['quantity'] += total_quantity
-                    else:
-                        ingredients_dict[key] = {
-                            'product_id': ingredient.product_id,
-                            'quantity': total_quantity,
-                            'unit': ingredient.unit
-                        }
-
-        for (product_name, unit), data in ingredients_dict.items():
-            shopping_item = ShoppingListItem(
-                product_id=data['product_id'],
-                quantity=data['quantity'],
-                unit=unit,
-                user_id=user_id
-            )
-            self.session.add(shopping_item)
+        with self.session.begin_nested():
+            self.session.query(ShoppingListItem).filter(ShoppingListItem.user_id == user_id).delete()
+            inserted = self.session.execute(
+                insert(ShoppingListItem).from_select(
+                    ['product_id', 'quantity', 'unit', 'user_id', 'is_bought'],
+                    aggregated
+                )
+            ).rowcount
+            self.session.query(SelectedRecipe).filter(SelectedRecipe.user_id == user_id).delete()
 
-        self.clear_selected_recipes(user_id)
-        self.session.commit()
+        if inserted >= 0:
+            self._on_commit(lambda: shopping_list_flags.set(user_id, inserted > 0))
+        else:
+            self._on_commit(lambda: shopping_list_flags.invalidate(user_id))
+        self._commit()
 
     def add_recipe_ingredients_to_shopping_list(self, user_id: str, ingredients: list):
-        """Adds recipe ingredients to existing shopping list."""
-        for ingredient in ingredients:
-            existing_item = self.session.query(ShoppingListItem).join(Product).filter(
-                ShoppingListItem.user_id == user_id,
-                Product.name == ingredient['product_name']
-            ).first()
-
-            if existing_item:
-                existing_item.quantity += ingredient['quantity']
-            else:
-                product = self.get_or_create_product(
-                    name=ingredient['product_name'],
-                    category_name=ingredient['category']
-                )
+        """Adds recipe ingredients to existing shopping list.
 
-                new_item = ShoppingListItem(
-                    user_id=user_id,
-                    product_id=product.id,
-                    quantity=ingredient['quantity'],
-                    unit=ingredient['unit'],
-                    is_bought=False
-                )
-                self.session.add(new_item)
+        Products are resolved and the user's items for them loaded with one IN
+        query each, so the statements don't grow with the number of
+        ingredients. Quantities go to the first item of a product.
+        """
+        if ingredients:
+            product_ids = self._resolve_products(ingredients)
+            items_by_product = {}
+            for item in (self.session.query(ShoppingListItem)
+                         .filter(ShoppingListItem.user_id == user_id,
+                                 ShoppingListItem.product_id.in_(set(product_ids.values())))
+                         .order_by(ShoppingListItem.id)):
+                items_by_product.setdefault(item.product_id, item)
+
+            for ingredient in ingredients:
+                product_id = product_ids[ingredient['product_name']]
+                existing_item = items_by_product.get(product_id)
 
-        self.session.commit()
+                if existing_item:
+                    existing_item.quantity += ingredient['quantity']
+                else:
+                    new_item = ShoppingListItem(
+                        user_id=user_id,
+                        product_id=product_id,
+                        quantity=ingredient['quantity'],
+                        unit=ingredient['unit'],
+                        is_bought=False
+                    )
+                    self.session.add(new_item)
+                    items_by_product[product_id] = new_item
+
+            self._on_commit(lambda: shopping_list_flags.set(user_id, True))
+        self._commit()
 
     def update_product_name(self, product_id: int, new_name: str) -> bool:
         """Updates product name."""
+        product = self.session.query(Product).filter(Product.id == product_id).first()
+        if not product:
+            return False
+
         try:
-            product = self.session.query(Product).filter(Product.id == product_id).first()
-            if product:
+            with self.session.begin_nested():
                 product.name = new_name
-                self.session.commit()
-                return True
-            return False
         except Exception as e:
-            self.session.rollback()
             print(f"Error updating product name: {e}")
             return False
+
+        self._commit()
+        return True
+
+class AsyncDatabaseManager:
+    """Async database operations manager over AsyncSession.
+
+    Exposes the same methods as DatabaseManager, but runs them through
+    AsyncSession.run_sync so that the database I/O is awaited on aiosqlite
+    instead of blocking the event loop. Given a DatabaseExecutor, it runs
+    every method as a transaction of its own on the executor's threads
+    instead, and has no session. Given a read_executor, read methods run
+    there, so building their ORM objects doesn't take event loop time,
+    while the session has no uncommitted writes they would have to see.
+    """
+
+    def __init__(self, session: Optional[AsyncSession] = None, autocommit: bool = True, executor=None,
+                 read_executor=None):
+        self.executor = executor
+        self.read_executor = read_executor
+        self.session = None if executor is not None else session or AsyncSessionLocal()
+        self.autocommit = autocommit
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def commit(self):
+        """Commits the current transaction."""
+        if self.session is not None:
+            await self.session.commit()
+
+    async def rollback(self):
+        """Rolls back the current transaction."""
+        if self.session is not None:
+            await self.session.rollback()
+
+    async def close(self):
+        """Closes the session, returning its connection to the pool."""
+        if self.session is not None:
+            await self.session.close()
+
+    async def _run(self, method, *args, **kwargs):
+        """Runs a DatabaseManager method against the underlying sync session, or on the executor."""
+        if self.executor is not None:
+            return await self.executor.run(method, *args, **kwargs)
+        return await self.session.run_sync(
+            lambda session: method(DatabaseManager(session, self.autocommit), *args, **kwargs)
+        )
+
+    async def _read(self, method, *args, **kwargs):
+        """Runs a read-only DatabaseManager method on the read executor, if the session has nothing to show it."""
+        if self.read_executor is not None and self.session is not None and not self.session.info.get('has_writes'):
+            return await self.read_executor.run(method, *args, **kwargs)
+        return await self._run(method, *args, **kwargs)
+
+    async def get_categories(self) -> List[Category]:
+        """Gets all categories ordered by their order field."""
+        return await self._read(DatabaseManager.get_categories)
+
+    async def get_category_by_name(self, name: str) -> Optional[Category]:
+        """Gets category by name."""
+        return await self._read(DatabaseManager.get_category_by_name, name)
+
+    async def get_category_by_id(self, category_id: int) -> Optional[Category]:
+        """Gets category by ID."""
+        return await self._read(DatabaseManager.get_category_by_id, category_id)
+
+    async def get_categories_with_product_counts(self) -> List[Tuple[Category, int]]:
+        """Gets all categories with their product counts in one query."""
+        return await self._read(DatabaseManager.get_categories_with_product_counts)
+
+    async def create_category(self, name: str) -> Category:
+        """Creates new category with auto-incremented order."""
+        return await self._run(DatabaseManager.create_category, name)
+
+    async def update_category_order(self, category_id: int, new_order: int):
+        """Updates category display order."""
+        await self._run(DatabaseManager.update_category_order, category_id, new_order)
+
+    async def delete_category(self, category_id: int) -> bool:
+        """Deletes category if it has no products."""
+        return await self._run(DatabaseManager.delete_category, category_id)
+
+    async def count_recipes(self) -> int:
+        """Counts total number of recipes."""
+        return await self._read(DatabaseManager.count_recipes)
+
+    async def count_products(self) -> int:
+        """Counts total number of products."""
+        return await self._read(DatabaseManager.count_products)
+
+    async def count_categories(self) -> int:
+        """Counts total number of categories."""
+        return await self._read(DatabaseManager.count_categories)
+
+    async def get_stats(self) -> Dict[str, int]:
+        """Gets recipes, products and categories counters, cached until they change."""
+        return await self._read(DatabaseManager.get_stats)
+
+    async def count_products_in_category(self, category_id: int) -> int:
+        """Counts products in specific category."""
+        return await self._read(DatabaseManager.count_products_in_category, category_id)
+
+    async def get_products(self) -> List[Product]:
+        """Gets all products with categories, ordered by category and name."""
+        return await self._read(DatabaseManager.get_products)
+
+    async def get_all_products(self) -> List[Product]:
+        """Gets all products from database."""
+        return await self._read(DatabaseManager.get_all_products)
+
+    async def get_product_by_name(self, name: str) -> Optional[Product]:
+        """Gets product by name with category info."""
+        return await self._read(DatabaseManager.get_product_by_name, name)
+
+    async def get_product_by_id(self, product_id: int) -> Optional[Product]:
+        """Gets product by ID with category info."""
+        return await self._read(DatabaseManager.get_product_by_id, product_id)
+
+    async def create_product(self, name: str, category_id: int) -> Product:
+        """Creates new product in specified category."""
+        return await self._run(DatabaseManager.create_product, name, category_id)
+
+    async def get_or_create_product(self, name: str, category_name: str) -> Product:
+        """Gets existing product or creates new one."""
+        return await self._run(DatabaseManager.get_or_create_product, name, category_name)
+
+    async def count_recipes_with_product(self, product_id: int) -> int:
+        """Counts recipes using specific product."""
+        return await self._read(DatabaseManager.count_recipes_with_product, product_id)
+
+    async def get_recipes_with_product(self, product_id: int) -> List[Recipe]:
+        """Gets all recipes using specific product."""
+        return await self._read(DatabaseManager.get_recipes_with_product, product_id)
+
+    async def delete_product(self, product_id: int) -> bool:
+        """Deletes product and all related records."""
+        return await self._run(DatabaseManager.delete_product, product_id)
+
+    async def get_recipes(self, user_id: str = None) -> List[Recipe]:
+        """Gets all recipes, optionally filtered by user."""
+        return await self._read(DatabaseManager.get_recipes, user_id)
+
+    async def get_recipe_by_id(self, recipe_id: int) -> Optional[Recipe]:
+        """Gets recipe by ID with all related data."""
+        return await self._read(DatabaseManager.get_recipe_by_id, recipe_id)
+
+    async def create_recipe(self, name: str, user_id: str, ingredients: List[dict]) -> Recipe:
+        """Creates new recipe with ingredients."""
+        return await self._run(DatabaseManager.create_recipe, name, user_id, ingredients)
+
+    async def update_recipe(self, recipe_id: int, name: str, ingredients: List[dict]):
+        """Updates existing recipe, writing only the ingredient rows that changed."""
+        await self._run(DatabaseManager.update_recipe, recipe_id, name, ingredients)
+
+    async def delete_recipe(self, recipe_id: int) -> bool:
+        """Deletes recipe and all related records."""
+        return await self._run(DatabaseManager.delete_recipe, recipe_id)
+
+    async def get_shopping_list(self, user_id: str) -> List[ShoppingListItem]:
+        """Gets user's shopping list ordered by category."""
+        return await self._read(DatabaseManager.get_shopping_list, user_id)
+
+    async def has_shopping_list(self, user_id: str) -> bool:
+        """Checks if user's shopping list has items, cached until it changes."""
+        has_items = shopping_list_flags.get(user_id)
+        if has_items is not None:
+            return has_items
+        return await self._read(DatabaseManager.has_shopping_list, user_id)
+
+    async def clear_shopping_list(self, user_id: str):
+        """Clears user's shopping list."""
+        await self._run(DatabaseManager.clear_shopping_list, user_id)
+
+    async def toggle_shopping_item(self, item_id: int, user_id: str):
+        """Toggles shopping item bought status."""
+        await self._run(DatabaseManager.toggle_shopping_item, item_id, user_id)
+
+    async def toggle_shopping_items(self, item_ids: List[int], user_id: str) -> int:
+        """Toggles bought status of several items with one UPDATE, returns number of toggled items."""
+        return await self._run(DatabaseManager.toggle_shopping_items, item_ids, user_id)
+
+    async def toggle_shopping_items_and_get_list(self, item_ids: List[int], user_id: str) -> List[ShoppingListItem]:
+        """Toggles bought status of several items and gets the updated shopping list."""
+        return await self._run(DatabaseManager.toggle_shopping_items_and_get_list, item_ids, user_id)
+
+    async def delete_shopping_item(self, item_id: int, user_id: str):
+        """Deletes item from shopping list."""
+        await self._run(DatabaseManager.delete_shopping_item, item_id, user_id)
+
+    async def get_selected_recipes(self, user_id: str) -> List[SelectedRecipe]:
+        """Gets user's selected recipes."""
+        return await self._read(DatabaseManager.get_selected_recipes, user_id)
+
+    async def add_selected_recipe(self, user_id: str, recipe_id: int):
+        """Adds recipe to selection or increases count."""
+        await self._run(DatabaseManager.add_selected_recipe, user_id, recipe_id)
+
+    async def remove_selected_recipe(self, user_id: str, recipe_id: int):
+        """Removes recipe from selection or decreases count."""
+        await self._run(DatabaseManager.remove_selected_recipe, user_id, recipe_id)
+
+    async def clear_selected_recipes(self, user_id: str):
+        """Clears all selected recipes for user."""
+        await self._run(DatabaseManager.clear_selected_recipes, user_id)
+
+    async def create_shopping_list_from_selected(self, user_id: str):
+        """Creates shopping list from selected recipes."""
+        await self._run(DatabaseManager.create_shopping_list_from_selected, user_id)
+
+    async def add_recipe_ingredients_to_shopping_list(self, user_id: str, ingredients: list):
+        """Adds recipe ingredients to existing shopping list."""
+        await self._run(DatabaseManager.add_recipe_ingredients_to_shopping_list, user_id, ingredients)
+
+    async def update_product_name(self, product_id: int, new_name: str) -> bool:
+        """Updates product name."""
+        return await self._run(DatabaseManager.update_product_name, product_id, new_name)
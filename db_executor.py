@@ -0,0 +1,184 @@
+import asyncio
+import contextvars
+import threading
+import time
+import weakref
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional
+
+from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import SingletonThreadPool
+
+from config import config
+from database import DatabaseManager, apply_sqlite_profile
+
+class DatabaseTimeoutError(Exception):
+    """Raised when a DatabaseExecutor call didn't finish within its timeout."""
+
+class _Call:
+    """Connection a call runs on, so that it can be interrupted from the event loop."""
+
+    def __init__(self):
+        self.connection = None
+        self.finished = False
+        self.lock = threading.Lock()
+
+    def interrupt(self):
+        """Aborts the statement the call is running, if it still runs on SQLite."""
+        with self.lock:
+            if not self.finished and hasattr(self.connection, 'interrupt'):
+                self.connection.interrupt()
+
+class DatabaseExecutor:
+    """Runs synchronous DatabaseManager methods on a bounded pool of threads.
+
+    Both the queries and the ORM work of a call happen on a pool thread, so
+    the event loop keeps receiving updates and answering callbacks while
+    heavy calls run. Every thread keeps one connection of its own
+    (SingletonThreadPool), the way SQLite wants connections used. A call is
+    one transaction, committed when the method returns and rolled back when
+    it raises; returned objects keep their loaded attributes.
+
+    Handlers' reads come here through DatabaseMiddleware, and the toggle
+    coalescer's flushes. At most threads calls run and max_queued wait for
+    a thread, counted per event loop. Further callers wait for a free slot, which slows producers down instead of
+    growing the queue. A call that doesn't finish within timeout, waiting
+    included, raises DatabaseTimeoutError, and its SQLite statement is
+    interrupted.
+    """
+
+    def __init__(self, url: str = config.DATABASE_URL, threads: int = config.DB_EXECUTOR_THREADS,
+                 max_queued: int = config.DB_EXECUTOR_QUEUE, timeout: float = config.DB_EXECUTOR_TIMEOUT):
+        self.threads = threads
+        self.max_queued = max_queued
+        self.timeout = timeout
+        self.calls = 0
+        self.completed = 0
+        self.failed = 0
+        self.timeouts = 0
+        self.backpressured = 0
+        self.queued = 0
+        self.running = 0
+        self.max_queue_depth = 0
+        self.total_queue_wait = 0.0
+        self.max_queue_wait = 0.0
+        self.total_run_time = 0.0
+        self.max_run_time = 0.0
+        self._lock = threading.Lock()
+        # Slots of each event loop: an asyncio.Semaphore works within the loop that first waits on it.
+        self._slots: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = \
+            weakref.WeakKeyDictionary()
+
+        if make_url(url).get_backend_name() == "sqlite":
+            # Each connection is used by its own thread; other threads only close them in dispose.
+            self.engine = create_engine(url, poolclass=SingletonThreadPool, pool_size=threads,
+                                        connect_args={'check_same_thread': False})
+            apply_sqlite_profile(self.engine)
+        else:
+            self.engine = create_engine(url, pool_size=threads, max_overflow=0)
+        self._sessions = sessionmaker(bind=self.engine, autoflush=False, expire_on_commit=False)
+        self._pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="db")
+
+    async def run(self, method, *args, timeout: Optional[float] = None, **kwargs):
+        """Runs a DatabaseManager method with the given arguments on a pool thread, returns its result."""
+        timeout = self.timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        loop = asyncio.get_running_loop()
+        slots = self._slots.get(loop)
+        if slots is None:
+            slots = self._slots[loop] = asyncio.Semaphore(self.threads + self.max_queued)
+
+        if not slots.locked():
+            await slots.acquire()
+        else:
+            self.backpressured += 1
+            try:
+                await asyncio.wait_for(slots.acquire(), timeout)
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                raise DatabaseTimeoutError(f"No free database thread for {method.__name__} in {timeout} s")
+
+        call = _Call()
+        with self._lock:
+            self.calls += 1
+            self.queued += 1
+            self.max_queue_depth = max(self.max_queue_depth, self.queued)
+        # The context carries statement_counter of the update into the thread.
+        future = self._pool.submit(contextvars.copy_context().run, self._execute,
+                                   call, time.monotonic(), method, args, kwargs)
+        # The slot is free once the thread is done with the call, not when the caller gives up.
+        future.add_done_callback(lambda done: self._release(loop, slots, done))
+
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), max(0.0, deadline - time.monotonic()))
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            call.interrupt()
+            raise DatabaseTimeoutError(f"{method.__name__} didn't finish in {timeout} s")
+
+    def _release(self, loop: asyncio.AbstractEventLoop, slots: asyncio.Semaphore, future: Future):
+        if future.cancelled():
+            with self._lock:
+                self.queued -= 1
+        if not loop.is_closed():
+            loop.call_soon_threadsafe(slots.release)
+
+    def _execute(self, call: _Call, submitted: float, method, args: tuple, kwargs: dict):
+        started = time.monotonic()
+        with self._lock:
+            self.queued -= 1
+            self.running += 1
+            self.total_queue_wait += started - submitted
+            self.max_queue_wait = max(self.max_queue_wait, started - submitted)
+
+        session = self._sessions()
+        try:
+            with call.lock:
+                call.connection = session.connection().connection.dbapi_connection
+            result = method(DatabaseManager(session), *args, **kwargs)
+            session.commit()
+            return result
+        except Exception:
+            session.rollback()
+            with self._lock:
+                self.failed += 1
+            raise
+        finally:
+            with call.lock:
+                call.finished = True
+            session.close()
+            elapsed = time.monotonic() - started
+            with self._lock:
+                self.running -= 1
+                self.completed += 1
+                self.total_run_time += elapsed
+                self.max_run_time = max(self.max_run_time, elapsed)
+
+    async def close(self):
+        """Waits for running calls, drops queued ones and closes the connections."""
+        await asyncio.get_running_loop().run_in_executor(
+            None, lambda: self._pool.shutdown(wait=True, cancel_futures=True)
+        )
+        self.engine.dispose()
+
+    def get_stats(self) -> dict:
+        """Gets call counters and queue depth."""
+        with self._lock:
+            completed = self.completed
+            return {
+                'calls': self.calls,
+                'failed': self.failed,
+                'timeouts': self.timeouts,
+                'backpressured': self.backpressured,
+                'queued': self.queued,
+                'running': self.running,
+                'max_queue_depth': self.max_queue_depth,
+                'avg_queue_wait_ms': round(self.total_queue_wait / completed * 1000, 1) if completed else 0,
+                'max_queue_wait_ms': round(self.max_queue_wait * 1000, 1),
+                'avg_run_ms': round(self.total_run_time / completed * 1000, 1) if completed else 0,
+                'max_run_ms': round(self.max_run_time * 1000, 1),
+            }
+
+db_executor = DatabaseExecutor()
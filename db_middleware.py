@@ -0,0 +1,86 @@
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.methods import TelegramMethod
+from aiogram.types import TelegramObject
+
+from config import config
+from database import AsyncDatabaseManager, StatementCounter, statement_counter, unit_of_work_session
+from db_executor import db_executor
+
+class DatabaseMiddleware(BaseMiddleware):
+    """Middleware that runs every update as one unit of work.
+
+    Handlers get an AsyncDatabaseManager as the db argument. Its session
+    checks out a connection only when the first query runs, and write
+    methods only flush. Reads run on db_executor's threads until the update
+    writes something, then on the session so that they see the writes. The FSM storage writes through the same session, so
+    state changes commit together with the data. The transaction is
+    committed after the handler returns and rolled back if it raises; it is
+    also committed before each Bot API call (see CommitBeforeRequest), so a
+    handler failing after a call only rolls back what it wrote since.
+    SQL statements of each update are counted, updates running more than
+    warn_threshold of them are printed. The counter, with the time spent in
+    the statements, is left in data['statement_counter'] for the metrics.
+    """
+
+    def __init__(self, warn_threshold: int = config.DB_UPDATE_STATEMENTS_WARN):
+        self.warn_threshold = warn_threshold
+        self.updates = 0
+        self.statements = 0
+        self.max_statements = 0
+
+    async def __call__(self, handler, event: TelegramObject, data: dict):
+        counter = StatementCounter()
+        db = AsyncDatabaseManager(autocommit=False, read_executor=db_executor)
+        counter_token = statement_counter.set(counter)
+        session_token = unit_of_work_session.set(db.session)
+        data['db'] = db
+        data['statement_counter'] = counter
+
+        try:
+            result = await handler(event, data)
+            await db.commit()
+            return result
+        except Exception:
+            await db.rollback()
+            raise
+        finally:
+            await db.close()
+            unit_of_work_session.reset(session_token)
+            statement_counter.reset(counter_token)
+            self._record(event, data, counter.statements)
+
+    def _record(self, event: TelegramObject, data: dict, statements: int):
+        self.updates += 1
+        self.statements += statements
+        self.max_statements = max(self.max_statements, statements)
+
+        if statements > self.warn_threshold:
+            handler = data.get('callback_handler') or data.get('handler')
+            name = handler.callback.__name__ if handler else type(event).__name__
+            print(f"⚠️ {name} ran {statements} SQL statements in one update")
+
+    def get_stats(self) -> dict:
+        """Gets statement counters."""
+        return {
+            'updates': self.updates,
+            'statements': self.statements,
+            'max_statements': self.max_statements,
+            'avg_statements': round(self.statements / self.updates, 2) if self.updates else 0,
+        }
+
+class CommitBeforeRequest(BaseRequestMiddleware):
+    """Bot session middleware that commits the update's unit of work before a Bot API call.
+
+    A call can wait in the request scheduler for seconds, and an open SQLite
+    write transaction would keep the writers of every other user waiting on
+    its lock until busy_timeout runs out.
+    """
+
+    async def __call__(self, make_request, bot, method: TelegramMethod):
+        session = unit_of_work_session.get()
+        if session is not None and session.in_transaction():
+            await session.commit()
+        return await make_request(bot, method)
+
+commit_before_request = CommitBeforeRequest()
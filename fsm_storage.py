@@ -0,0 +1,172 @@
+import json
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional, Tuple
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+from sqlalchemy import select, delete
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from config import config
+from database import AsyncSessionLocal, async_engine, unit_of_work_session
+from models import FSMRecord
+
+EMPTY_DATA = "{}"
+
+class DatabaseStorage(BaseStorage):
+    """FSM storage kept in the bot's database, so unfinished dialogs survive restarts.
+
+    Every write goes straight to the fsm_states table. Reads are served from
+    an LRU cache of at most max_cached keys; keys that fell out of it are
+    loaded back from the database. States idle for longer than ttl read as
+    empty, cached or not, and are deleted by the next sweep; a cleared
+    state removes its row. A write that doesn't
+    change the cached value is skipped, and clearing runs a DELETE only when
+    the key is known to have a row. Inside an update handled
+    by DatabaseMiddleware the storage uses the update's session, so state
+    is committed or rolled back together with the handler's writes.
+    """
+
+    def __init__(self, session_factory=AsyncSessionLocal, max_cached: int = config.FSM_CACHE_SIZE,
+                 ttl: timedelta = timedelta(hours=config.FSM_STATE_TTL_HOURS)):
+        self.session_factory = session_factory
+        self.max_cached = max_cached
+        self.ttl = ttl
+        self.sweep_interval = min(ttl / 10, timedelta(hours=1)).total_seconds()
+        self.hits = 0
+        self.misses = 0
+        # storage key -> (state, data, written_at, whether a row exists)
+        self._cache: "OrderedDict[str, Tuple[Optional[str], str, float, bool]]" = OrderedDict()
+        self._last_sweep = time.monotonic()
+        self._insert = postgresql_insert if async_engine.dialect.name == "postgresql" else sqlite_insert
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        """Sets state for the key."""
+        state = state.state if isinstance(state, State) else state
+        _, data = await self._get(key)
+        await self._write(key, state, data)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        """Gets state of the key."""
+        state, _ = await self._get(key)
+        return state
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        """Replaces data of the key."""
+        state, _ = await self._get(key)
+        await self._write(key, state, json.dumps(data, ensure_ascii=False))
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        """Gets a copy of the key data."""
+        _, data = await self._get(key)
+        return json.loads(data)
+
+    async def close(self) -> None:
+        """Drops cached states, the database engine is disposed by main."""
+        self._cache.clear()
+
+    async def evict_idle(self) -> int:
+        """Deletes states idle for longer than ttl, returns number of deleted rows."""
+        self._last_sweep = time.monotonic()
+        cutoff = self._last_sweep - self.ttl.total_seconds()
+        for storage_key in [k for k, (_, _, written_at, _) in self._cache.items() if written_at < cutoff]:
+            del self._cache[storage_key]
+
+        async with self._session() as session:
+            result = await session.execute(
+                delete(FSMRecord).where(FSMRecord.updated_at < datetime.utcnow() - self.ttl)
+            )
+            return result.rowcount
+
+    @asynccontextmanager
+    async def _session(self):
+        """Yields the session of the current update, or a new one committed on exit."""
+        session = unit_of_work_session.get()
+        if session is not None:
+            yield session
+            return
+
+        async with self.session_factory() as session:
+            yield session
+            await session.commit()
+
+    async def _get(self, key: StorageKey) -> Tuple[Optional[str], str]:
+        storage_key = _storage_key(key)
+        cached = self._cache.get(storage_key)
+        if cached is not None and cached[2] < time.monotonic() - self.ttl.total_seconds() and \
+                (cached[0], cached[1]) != (None, EMPTY_DATA):
+            # Idle for longer than ttl: evicted, and read back as expired below.
+            del self._cache[storage_key]
+            cached = None
+        if cached is not None:
+            self.hits += 1
+            self._cache.move_to_end(storage_key)
+            return cached[0], cached[1]
+
+        self.misses += 1
+        async with self._session() as session:
+            record = (await session.execute(
+                select(FSMRecord.state, FSMRecord.data, FSMRecord.updated_at).where(FSMRecord.key == storage_key)
+            )).first()
+
+        if record is None:
+            state, data, written_at = None, EMPTY_DATA, time.monotonic()
+        elif record.updated_at < datetime.utcnow() - self.ttl:
+            # The expired row is still there until the next sweep, so clearing deletes it.
+            state, data, written_at = None, EMPTY_DATA, time.monotonic() - self.ttl.total_seconds()
+        else:
+            age = (datetime.utcnow() - record.updated_at).total_seconds()
+            state, data, written_at = record.state, record.data, time.monotonic() - age
+
+        self._remember(storage_key, state, data, written_at, record is not None)
+        return state, data
+
+    async def _write(self, key: StorageKey, state: Optional[str], data: str):
+        storage_key = _storage_key(key)
+        empty = state is None and data == EMPTY_DATA
+        cached = self._cache.get(storage_key)
+        if cached is not None:
+            cached_state, cached_data, written_at, stored = cached
+            if empty and not stored:
+                return
+            # An unchanged state is only written again to keep it from expiring.
+            if (cached_state, cached_data) == (state, data) and \
+                    time.monotonic() - written_at < self.ttl.total_seconds() / 2:
+                return
+
+        async with self._session() as session:
+            if empty:
+                await session.execute(delete(FSMRecord).where(FSMRecord.key == storage_key))
+            else:
+                now = datetime.utcnow()
+                await session.execute(
+                    self._insert(FSMRecord)
+                    .values(key=storage_key, state=state, data=data, updated_at=now)
+                    .on_conflict_do_update(index_elements=['key'],
+                                           set_={'state': state, 'data': data, 'updated_at': now})
+                )
+            if session is unit_of_work_session.get():
+                session.sync_session.info.setdefault('on_rollback', []).append(
+                    lambda: self._cache.pop(storage_key, None)
+                )
+
+        self._remember(storage_key, state, data, time.monotonic(), not empty)
+
+        if time.monotonic() - self._last_sweep > self.sweep_interval:
+            await self.evict_idle()
+
+    def _remember(self, storage_key: str, state: Optional[str], data: str, written_at: float, stored: bool):
+        self._cache[storage_key] = (state, data, written_at, stored)
+        self._cache.move_to_end(storage_key)
+        while len(self._cache) > self.max_cached:
+            self._cache.popitem(last=False)
+
+def _storage_key(key: StorageKey) -> str:
+    """Serializes a storage key into the fsm_states primary key."""
+    return ":".join(str(part) if part is not None else "" for part in (
+        key.bot_id, key.chat_id, key.user_id, key.thread_id, key.business_connection_id, key.destiny
+    ))
@@ -1,33 +1,25 @@
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, ReplyKeyboardMarkup, KeyboardButton, ReplyKeyboardRemove
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from typing import List
-from models import Recipe, Category, Product, ShoppingListItem, SelectedRecipe
+from callbacks import Op, pack
+from models import Recipe, Product, SelectedRecipe
 
 def get_main_menu() -> ReplyKeyboardRemove:
     """Removes keyboard for main menu - using only inline buttons."""
     return ReplyKeyboardRemove()
 
-def get_main_menu_inline() -> InlineKeyboardMarkup:
-    """Inline keyboard for main menu."""
+def get_main_menu_inline(has_shopping_list: bool = False) -> InlineKeyboardMarkup:
+    """Inline keyboard for main menu, "Compose menu" is shown while there is no shopping list."""
     buttons = [
-        [InlineKeyboardButton(text="🛒 Shopping menu", callback_data="shopping_menu")]
+        [InlineKeyboardButton(text="🛒 Shopping menu", callback_data=pack(Op.SHOPPING_MENU))]
     ]
 
-    has_shopping_list = False
-    try:
-        from database import DatabaseManager
-        with DatabaseManager() as db:
-            shopping_items = db.get_shopping_list("")
-            has_shopping_list = len(shopping_items) > 0
-    except:
-        pass
-
     if not has_shopping_list:
-        buttons.append([InlineKeyboardButton(text="🧾 Compose menu", callback_data="compose_menu")])
+        buttons.append([InlineKeyboardButton(text="🧾 Compose menu", callback_data=pack(Op.COMPOSE_MENU))])
 
     buttons.extend([
-        [InlineKeyboardButton(text="🍽️ Recipes", callback_data="recipes_menu")],
-        [InlineKeyboardButton(text="📚 Saved", callback_data="saved_menu")]
+        [InlineKeyboardButton(text="🍽️ Recipes", callback_data=pack(Op.RECIPES_MENU))],
+        [InlineKeyboardButton(text="📚 Saved", callback_data=pack(Op.SAVED_MENU))]
     ])
 
     return InlineKeyboardMarkup(inline_keyboard=buttons)
@@ -60,20 +52,20 @@ def get_cancel_keyboard() -> ReplyKeyboardMarkup:
 def get_recipes_menu() -> InlineKeyboardMarkup:
     """Recipes management menu."""
     keyboard = [
-        [InlineKeyboardButton(text="➕ Add recipe", callback_data="add_recipe")],
-        [InlineKeyboardButton(text="✏️ Edit recipe", callback_data="edit_recipe")],
-        [InlineKeyboardButton(text="❌ Delete recipe", callback_data="delete_recipe")],
-        [InlineKeyboardButton(text="🏠 Main menu", callback_data="main_menu")]
+        [InlineKeyboardButton(text="➕ Add recipe", callback_data=pack(Op.ADD_RECIPE))],
+        [InlineKeyboardButton(text="✏️ Edit recipe", callback_data=pack(Op.RECIPES_TO_EDIT))],
+        [InlineKeyboardButton(text="❌ Delete recipe", callback_data=pack(Op.RECIPES_TO_DELETE))],
+        [InlineKeyboardButton(text="🏠 Main menu", callback_data=pack(Op.MAIN_MENU))]
     ]
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
 def get_categories_menu() -> InlineKeyboardMarkup:
     """Categories management menu."""
     keyboard = [
-        [InlineKeyboardButton(text="➕ Add category", callback_data="add_category")],
-        [InlineKeyboardButton(text="📋 Categories list", callback_data="list_categories")],
-        [InlineKeyboardButton(text="🔄 Change order", callback_data="reorder_categories")],
-        [InlineKeyboardButton(text="🏠 Main menu", callback_data="main_menu")]
+        [InlineKeyboardButton(text="➕ Add category", callback_data=pack(Op.ADD_CATEGORY))],
+        [InlineKeyboardButton(text="📋 Categories list", callback_data=pack(Op.LIST_CATEGORIES))],
+        [InlineKeyboardButton(text="🔄 Change order", callback_data=pack(Op.REORDER_CATEGORIES))],
+        [InlineKeyboardButton(text="🏠 Main menu", callback_data=pack(Op.MAIN_MENU))]
     ]
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
@@ -83,31 +75,31 @@ def get_recipes_list(recipes: List[Recipe], action: str = "select") -> InlineKey
 
     for recipe in recipes:
         if action == "select":
-            builder.button(text=recipe.name, callback_data=f"select_recipe_{recipe.id}")
+            builder.button(text=recipe.name, callback_data=pack(Op.SELECT_RECIPE, recipe.id))
         elif action == "edit":
-            builder.button(text=recipe.name, callback_data=f"edit_recipe_{recipe.id}")
+            builder.button(text=recipe.name, callback_data=pack(Op.EDIT_RECIPE, recipe.id))
         elif action == "delete":
-            builder.button(text=recipe.name, callback_data=f"delete_recipe_{recipe.id}")
+            builder.button(text=recipe.name, callback_data=pack(Op.DELETE_RECIPE, recipe.id))
 
     builder.adjust(1)
 
     if action == "select":
-        builder.row(InlineKeyboardButton(text="📋 Manage selected", callback_data="manage_selected"))
-        builder.row(InlineKeyboardButton(text="🛍️ Add products", callback_data="add_temp_products"))
-        builder.row(InlineKeyboardButton(text="✅ Create shopping list", callback_data="create_shopping_list"))
-        builder.row(InlineKeyboardButton(text="🔄 Clear selection", callback_data="clear_selection"))
+        builder.row(InlineKeyboardButton(text="📋 Manage selected", callback_data=pack(Op.MANAGE_SELECTED)))
+        builder.row(InlineKeyboardButton(text="🛍️ Add products", callback_data=pack(Op.ADD_TEMP_PRODUCTS)))
+        builder.row(InlineKeyboardButton(text="✅ Create shopping list", callback_data=pack(Op.CREATE_SHOPPING_LIST)))
+        builder.row(InlineKeyboardButton(text="🔄 Clear selection", callback_data=pack(Op.CLEAR_SELECTION)))
 
-    builder.row(InlineKeyboardButton(text="🏠 Main menu", callback_data="main_menu"))
+    builder.row(InlineKeyboardButton(text="🏠 Main menu", callback_data=pack(Op.MAIN_MENU)))
 
     return builder.as_markup()
 
 def get_saved_menu() -> InlineKeyboardMarkup:
     """Saved data menu."""
     keyboard = [
-        [InlineKeyboardButton(text="🍽️ Recipes", callback_data="saved_recipes")],
-        [InlineKeyboardButton(text="🥕 Products", callback_data="saved_products")],
-        [InlineKeyboardButton(text="📦 Categories", callback_data="saved_categories")],
-        [InlineKeyboardButton(text="🏠 Main menu", callback_data="main_menu")]
+        [InlineKeyboardButton(text="🍽️ Recipes", callback_data=pack(Op.SAVED_RECIPES))],
+        [InlineKeyboardButton(text="🥕 Products", callback_data=pack(Op.SAVED_PRODUCTS))],
+        [InlineKeyboardButton(text="📦 Categories", callback_data=pack(Op.SAVED_CATEGORIES))],
+        [InlineKeyboardButton(text="🏠 Main menu", callback_data=pack(Op.MAIN_MENU))]
     ]
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
@@ -116,94 +108,23 @@ def get_saved_recipes_list(recipes: List[Recipe]) -> InlineKeyboardMarkup:
     builder = InlineKeyboardBuilder()
 
     for recipe in recipes:
-        builder.button(text=recipe.name, callback_data=f"view_recipe_{recipe.id}")
+        builder.button(text=recipe.name, callback_data=pack(Op.VIEW_RECIPE, recipe.id))
 
     builder.adjust(1)
-    builder.row(InlineKeyboardButton(text="◀️ Back", callback_data="saved_menu"))
-    builder.row(InlineKeyboardButton(text="🏠 Main menu", callback_data="main_menu"))
+    builder.row(InlineKeyboardButton(text="◀️ Back", callback_data=pack(Op.SAVED_MENU)))
+    builder.row(InlineKeyboardButton(text="🏠 Main menu", callback_data=pack(Op.MAIN_MENU)))
 
     return builder.as_markup()
 
 def get_recipe_view_menu(recipe_id: int) -> InlineKeyboardMarkup:
     """Menu for specific recipe view."""
     keyboard = [
-        [InlineKeyboardButton(text="🗑 Delete recipe", callback_data=f"delete_saved_recipe_{recipe_id}")],
-        [InlineKeyboardButton(text="◀️ Back to list", callback_data="saved_recipes")],
-        [InlineKeyboardButton(text="🏠 Main menu", callback_data="main_menu")]
+        [InlineKeyboardButton(text="🗑 Delete recipe", callback_data=pack(Op.DELETE_SAVED_RECIPE, recipe_id))],
+        [InlineKeyboardButton(text="◀️ Back to list", callback_data=pack(Op.SAVED_RECIPES))],
+        [InlineKeyboardButton(text="🏠 Main menu", callback_data=pack(Op.MAIN_MENU))]
     ]
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
-def get_categories_list(categories: List[Category], action: str = "view") -> InlineKeyboardMarkup:
-    """Creates categories list keyboard based on action."""
-    builder = InlineKeyboardBuilder()
-
-    for category in categories:
-        if action == "view":
-            builder.button(text=f"{category.order}. {category.name}", callback_data=f"view_category_{category.id}")
-        elif action == "delete":
-            builder.button(text=category.name, callback_data=f"delete_category_{category.id}")
-        elif action == "reorder":
-            builder.button(text=f"{category.order}. {category.name}", callback_data=f"reorder_category_{category.id}")
-
-    builder.adjust(1)
-    builder.row(InlineKeyboardButton(text="🏠 Main menu", callback_data="main_menu"))
-
-    return builder.as_markup()
-
-def get_shopping_list_keyboard(items: List[ShoppingListItem]) -> InlineKeyboardMarkup:
-    """Keyboard for shopping list management."""
-    builder = InlineKeyboardBuilder()
-
-    for item in items:
-        status = "✅" if item.is_bought else "⭕"
-        text = f"{status} {item.product.name} ({item.quantity} {item.unit})"
-
-        builder.row(
-            InlineKeyboardButton(text=text, callback_data=f"toggle_item_{item.id}"),
-            InlineKeyboardButton(text="🗑", callback_data=f"delete_item_{item.id}")
-        )
-
-    if items:
-        builder.row(InlineKeyboardButton(text="🛍️ Add products", callback_data="add_temp_products"))
-        builder.row(InlineKeyboardButton(text="🏁 Finish shopping", callback_data="finish_shopping"))
-
-    builder.row(InlineKeyboardButton(text="🏠 Main menu", callback_data="main_menu"))
-
-    return builder.as_markup()
-
-def get_shopping_list_with_temp_keyboard(shopping_items: List[ShoppingListItem], temp_products: List[dict]) -> InlineKeyboardMarkup:
-    """Keyboard for shopping list with temporary products."""
-    builder = InlineKeyboardBuilder()
-
-    for item in shopping_items:
-        status = "✅" if item.is_bought else "⭕"
-        text = f"{status} {item.product.name} ({item.quantity} {item.unit})"
-
-        builder.row(
-            InlineKeyboardButton(text=text, callback_data=f"toggle_item_{item.id}"),
-            InlineKeyboardButton(text="🗑", callback_data=f"delete_item_{item.id}")
-        )
-
-    for temp_product in temp_products:
-        status = "✅" if temp_product['is_bought'] else "⭕"
-        text = f"{status} {temp_product['name']} ({temp_product['quantity']} {temp_product['unit']}) 🛍️"
-
-        builder.row(
-            InlineKeyboardButton(text=text, callback_data=f"toggle_temp_{temp_product['temp_id']}"),
-            InlineKeyboardButton(text="🗑", callback_data=f"delete_temp_{temp_product['temp_id']}")
-        )
-
-    if shopping_items or temp_products:
-        builder.row(
-            InlineKeyboardButton(text="🍽️ Add recipe", callback_data="add_recipe_to_list"),
-            InlineKeyboardButton(text="🛍️ Add products", callback_data="add_temp_products")
-        )
-        builder.row(InlineKeyboardButton(text="🏁 Finish shopping", callback_data="finish_shopping"))
-
-    builder.row(InlineKeyboardButton(text="🏠 Main menu", callback_data="main_menu"))
-
-    return builder.as_markup()
-
 def get_selected_recipes_keyboard(selected: List[SelectedRecipe]) -> InlineKeyboardMarkup:
     """Keyboard for selected recipes management."""
     builder = InlineKeyboardBuilder()
@@ -211,29 +132,22 @@ def get_selected_recipes_keyboard(selected: List[SelectedRecipe]) -> InlineKeybo
     for sel in selected:
         count_text = f" (x{sel.count})" if sel.count > 1 else ""
         builder.row(
-            InlineKeyboardButton(text=f"➖", callback_data=f"remove_selected_{sel.recipe_id}"),
-            InlineKeyboardButton(text=f"{sel.recipe.name}{count_text}", callback_data=f"view_selected_{sel.recipe_id}"),
-            InlineKeyboardButton(text=f"➕", callback_data=f"add_selected_{sel.recipe_id}")
+            InlineKeyboardButton(text=f"➖", callback_data=pack(Op.REMOVE_SELECTED, sel.recipe_id)),
+            InlineKeyboardButton(text=f"{sel.recipe.name}{count_text}", callback_data=pack(Op.VIEW_SELECTED, sel.recipe_id)),
+            InlineKeyboardButton(text=f"➕", callback_data=pack(Op.ADD_SELECTED, sel.recipe_id))
         )
 
     if selected:
-        builder.row(InlineKeyboardButton(text="🛍️ Add products", callback_data="add_temp_products"))
-        builder.row(InlineKeyboardButton(text="✅ Create shopping list", callback_data="create_shopping_list"))
+        builder.row(InlineKeyboardButton(text="🛍️ Add products", callback_data=pack(Op.ADD_TEMP_PRODUCTS)))
+        builder.row(InlineKeyboardButton(text="✅ Create shopping list", callback_data=pack(Op.CREATE_SHOPPING_LIST)))
 
-    builder.row(InlineKeyboardButton(text="🔄 Clear selection", callback_data="clear_selection"))
-    builder.row(InlineKeyboardButton(text="🏠 Main menu", callback_data="main_menu"))
+    builder.row(InlineKeyboardButton(text="🔄 Clear selection", callback_data=pack(Op.CLEAR_SELECTION)))
+    builder.row(InlineKeyboardButton(text="🏠 Main menu", callback_data=pack(Op.MAIN_MENU)))
 
     return builder.as_markup()
 
-def get_confirmation_keyboard(action: str, item_id: int = None) -> InlineKeyboardMarkup:
+def get_confirmation_keyboard(confirm_data: str, cancel_data: str) -> InlineKeyboardMarkup:
     """Creates confirmation keyboard for actions."""
-    confirm_data = f"confirm_{action}"
-    cancel_data = f"cancel_{action}"
-
-    if item_id:
-        confirm_data += f"_{item_id}"
-        cancel_data += f"_{item_id}"
-
     keyboard = [
         [
             InlineKeyboardButton(text="✅ Yes", callback_data=confirm_data),
@@ -248,17 +162,19 @@ def get_units_keyboard() -> InlineKeyboardMarkup:
     builder = InlineKeyboardBuilder()
 
     for unit in units:
-        builder.button(text=unit, callback_data=f"unit_{unit}")
+        builder.button(text=unit, callback_data=pack(Op.UNIT, unit))
 
     builder.adjust(4)
     return builder.as_markup()
 
-def get_ingredient_actions_keyboard() -> InlineKeyboardMarkup:
+def get_ingredient_actions_keyboard(allow_reset: bool = False) -> InlineKeyboardMarkup:
     """Keyboard for ingredient management actions."""
     keyboard = [
-        [InlineKeyboardButton(text="➕ Add more ingredient", callback_data="add_ingredient")],
-        [InlineKeyboardButton(text="✅ Finish recipe", callback_data="finish_recipe")]
+        [InlineKeyboardButton(text="➕ Add more ingredient", callback_data=pack(Op.ADD_INGREDIENT))],
+        [InlineKeyboardButton(text="✅ Finish recipe", callback_data=pack(Op.FINISH_RECIPE))]
     ]
+    if allow_reset:
+        keyboard.insert(1, [InlineKeyboardButton(text="🔄 Re-enter ingredients", callback_data=pack(Op.RESET_INGREDIENTS))])
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
 def get_no_keyboard() -> ReplyKeyboardRemove:
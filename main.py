@@ -1,47 +1,153 @@
 import asyncio
 import logging
+from typing import Optional, Tuple
+
 from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.filters import ExceptionTypeFilter
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 
 from config import config
-from database import create_tables
+from cache import disable_shared_caches
+from callbacks import callback_dispatcher
+from database import create_tables, warm_shopping_list_flags, async_engine
+from db_executor import db_executor
 from handlers import router
 from additional_handlers import additional_router
-from products_handlers import products_router
+from product_handlers import products_router
 from saved_data_handlers import saved_data_router
 from access_middleware import AccessMiddleware
+from user_middleware import UserIdMiddleware
+from db_middleware import DatabaseMiddleware, commit_before_request
+from repeated_queries import RepeatedQueriesMiddleware
+from metrics import MetricsServer, registry
+from metrics_middleware import HandlerMetricsMiddleware, api_call_metrics
+from messaging import message_state
+from fsm_storage import DatabaseStorage
+from temp_product_store import temp_product_store
+from toggle_coalescer import toggle_coalescer
+from telegram_scheduler import request_scheduler
+from webhook import run_webhook
+from supervisor import Shard, run_supervisor
+from user_isolation import UserBusyError, UserEventIsolation, drop_busy_update
 
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 
-async def main():
-    """Main bot initialization and startup function."""
-    create_tables()
+def create_bot() -> Bot:
+    """Creates the bot; API calls commit the update's writes, are counted and go through the request scheduler."""
+    session = AiohttpSession(api=TelegramAPIServer.from_base(config.TELEGRAM_API_URL)) if config.TELEGRAM_API_URL else None
+    bot = Bot(token=config.BOT_TOKEN, session=session)
+    bot.session.middleware(commit_before_request)
+    bot.session.middleware(api_call_metrics)
+    bot.session.middleware(request_scheduler)
+    return bot
+
+def create_dispatcher(storage=None) -> Tuple[Dispatcher, DatabaseMiddleware, HandlerMetricsMiddleware]:
+    """Creates the dispatcher with all middlewares and routers.
 
-    bot = Bot(token=config.BOT_TOKEN)
-    storage = MemoryStorage()
-    dp = Dispatcher(storage=storage)
+    Updates of one user are handled one at a time (see UserEventIsolation).
+    With DB_REPEATED_QUERIES set, statements repeated within an update are
+    reported (see RepeatedQueriesMiddleware).
+    """
+    dp = Dispatcher(storage=storage, events_isolation=UserEventIsolation())
+    dp.errors.register(drop_busy_update, ExceptionTypeFilter(UserBusyError))
 
+    metrics_middleware = HandlerMetricsMiddleware()
+    dp.message.middleware(metrics_middleware)
+    dp.callback_query.middleware(metrics_middleware)
     dp.message.middleware(AccessMiddleware())
     dp.callback_query.middleware(AccessMiddleware())
+    dp.message.middleware(UserIdMiddleware())
+    dp.callback_query.middleware(UserIdMiddleware())
 
+    db_middleware = DatabaseMiddleware()
+    dp.message.middleware(db_middleware)
+    dp.callback_query.middleware(db_middleware)
+    if config.DB_REPEATED_QUERIES != "off":
+        repeated_queries = RepeatedQueriesMiddleware()
+        dp.message.middleware(repeated_queries)
+        dp.callback_query.middleware(repeated_queries)
+    dp.message.middleware(toggle_coalescer)
+    dp.callback_query.middleware(toggle_coalescer)
+
+    dp.include_router(callback_dispatcher.router)
     dp.include_router(additional_router)
     dp.include_router(products_router)
     dp.include_router(saved_data_router)
     dp.include_router(router)
+    return dp, db_middleware, metrics_middleware
 
-    try:
-        print("🤖 Bot started!")
-        if config.ALLOWED_USERS:
-            print(f"🔒 Access allowed for users: {config.ALLOWED_USERS}")
-        else:
-            print("🌍 Access open for all users")
+async def run_bot(receive, shard: Optional[Shard] = None):
+    """Runs the bot until receive(bot, dp) returns.
+
+    In a worker process shard tells which users it handles: only their
+    temporary products are loaded, caches shared between users are off and
+    the process gets its share of the global API budget.
+    """
+    if shard is None:
+        warm_shopping_list_flags()
+    else:
+        disable_shared_caches()
+        request_scheduler.set_global_rate(config.TG_GLOBAL_RATE / shard.count)
+
+    bot = create_bot()
+    storage = DatabaseStorage()
+    await storage.evict_idle()
+    await temp_product_store.load(owns=shard.owns if shard else None)
+    temp_product_store.start()
+    dp, db_middleware, metrics_middleware = create_dispatcher(storage)
 
-        await dp.start_polling(bot)
+    registry.add_stats("db", db_middleware.get_stats)
+    registry.add_stats("db_threads", db_executor.get_stats)
+    registry.add_stats("api", request_scheduler.get_stats)
+    registry.add_stats("toggles", toggle_coalescer.get_stats)
+    registry.add_stats("edits", message_state.get_stats)
+    registry.add_stats("user_updates", dp.fsm.events_isolation.get_stats)
+    metrics_server = None
+    if config.METRICS_PORT:
+        metrics_server = MetricsServer(registry)
+        await metrics_server.start(port=config.METRICS_PORT + (shard.index if shard else 0))
+
+    try:
+        await receive(bot, dp)
     finally:
+        if metrics_server is not None:
+            await metrics_server.stop()
+        await toggle_coalescer.close()
+        print(f"✉️ Message edits: {message_state.get_stats()}")
+        print(f"☑️ Shopping list toggles: {toggle_coalescer.get_stats()}")
+        print(f"🗄️ SQL statements per update: {db_middleware.get_stats()}")
+        print(f"📤 Telegram API calls: {request_scheduler.get_stats()}")
+        print(f"🔐 Updates per user: {dp.fsm.events_isolation.get_stats()}")
+        print(f"🧵 Database threads: {db_executor.get_stats()}")
+        print(f"⏱️ Slowest handlers: {metrics_middleware.get_stats()}")
+        await request_scheduler.close()
         await bot.session.close()
+        await storage.close()
+        await temp_product_store.close()
+        await db_executor.close()
+        await async_engine.dispose()
+
+async def main():
+    """Main bot initialization and startup function."""
+    create_tables()
+
+    print("🤖 Bot started!")
+    if config.ALLOWED_USERS:
+        print(f"🔒 Access allowed for users: {config.ALLOWED_USERS}")
+    else:
+        print("🌍 Access open for all users")
+
+    if config.WORKERS > 1:
+        dp, _, _ = create_dispatcher()
+        await run_supervisor(dp.resolve_used_update_types())
+    elif config.BOT_MODE == "webhook":
+        await run_bot(run_webhook)
+    else:
+        await run_bot(lambda bot, dp: dp.start_polling(bot))
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -0,0 +1,160 @@
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.fsm.context import FSMContext
+from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup
+
+# Telegram answers with one of these when the old message can't be edited
+# and a new one has to be sent instead.
+RESEND_ERRORS = (
+    "message to edit not found",
+    "message can't be edited",
+    "there is no text in the message to edit",
+    "message_id_invalid",
+)
+NOT_MODIFIED_ERROR = "message is not modified"
+
+class MessageState:
+    """Remembers what each bot message currently shows.
+
+    A hash of the last text and markup is kept per (chat_id, message_id), so
+    an edit that would not change anything is skipped without calling the API.
+    """
+
+    def __init__(self, max_messages: int = 10000):
+        self.max_messages = max_messages
+        self.edits = 0
+        self.skipped_edits = 0
+        self.fallbacks = 0
+        self.api_calls_saved = 0
+        self._hashes: "OrderedDict[Tuple[int, int], int]" = OrderedDict()
+
+    def is_current(self, chat_id: int, message_id: int, content_hash: int) -> bool:
+        """Checks if the message already shows this content."""
+        key = (chat_id, message_id)
+        if self._hashes.get(key) != content_hash:
+            return False
+        self._hashes.move_to_end(key)
+        return True
+
+    def remember(self, chat_id: int, message_id: int, content_hash: int):
+        """Stores the content hash of a message."""
+        key = (chat_id, message_id)
+        self._hashes[key] = content_hash
+        self._hashes.move_to_end(key)
+        while len(self._hashes) > self.max_messages:
+            self._hashes.popitem(last=False)
+
+    def forget(self, chat_id: int, message_id: int):
+        """Drops a message, e.g. after it was deleted."""
+        self._hashes.pop((chat_id, message_id), None)
+
+    def get_stats(self) -> dict:
+        """Gets edit counters."""
+        return {
+            'edits': self.edits,
+            'skipped_edits': self.skipped_edits,
+            'fallbacks': self.fallbacks,
+            'api_calls_saved': self.api_calls_saved,
+        }
+
+message_state = MessageState()
+
+def content_hash(text: str, reply_markup: Optional[InlineKeyboardMarkup] = None) -> int:
+    """Gets a hash of message text and markup."""
+    markup = reply_markup.model_dump_json(exclude_none=True) if reply_markup is not None else ""
+    return hash((text, markup))
+
+def _needs_resend(error: TelegramBadRequest) -> bool:
+    message = error.message.lower()
+    return any(reason in message for reason in RESEND_ERRORS)
+
+async def safe_delete_message(message: Message):
+    """Safely deletes a message, returns success status."""
+    try:
+        await message.delete()
+        message_state.forget(message.chat.id, message.message_id)
+        return True
+    except Exception as e:
+        print(f"Failed to delete message: {e}")
+        return False
+
+async def _send(message: Message, text: str, reply_markup, new_hash: int) -> Message:
+    sent = await message.answer(text, reply_markup=reply_markup)
+    message_state.remember(sent.chat.id, sent.message_id, new_hash)
+    return sent
+
+async def safe_edit_or_send(message_or_callback, text: str, reply_markup=None):
+    """Universal function for editing or sending a new message.
+
+    Identical edits are skipped, "message is not modified" counts as success,
+    and the message is re-sent only when Telegram can't edit it.
+    """
+    new_hash = content_hash(text, reply_markup)
+
+    if not isinstance(message_or_callback, CallbackQuery):
+        await _send(message_or_callback, text, reply_markup, new_hash)
+        return
+
+    message = message_or_callback.message
+    chat_id, message_id = message.chat.id, message.message_id
+
+    if message_state.is_current(chat_id, message_id, new_hash):
+        message_state.skipped_edits += 1
+        message_state.api_calls_saved += 1
+        return
+
+    try:
+        await message.edit_text(text, reply_markup=reply_markup)
+        message_state.edits += 1
+        message_state.remember(chat_id, message_id, new_hash)
+    except TelegramBadRequest as e:
+        if NOT_MODIFIED_ERROR in e.message.lower():
+            # The old fallback deleted and re-sent the message here.
+            message_state.api_calls_saved += 2
+            message_state.remember(chat_id, message_id, new_hash)
+        elif _needs_resend(e):
+            message_state.fallbacks += 1
+            await safe_delete_message(message)
+            await _send(message, text, reply_markup, new_hash)
+        else:
+            print(f"Failed to edit message: {e}")
+    except Exception as e:
+        print(f"Failed to edit message: {e}")
+
+async def update_main_message(bot, chat_id: int, state: FSMContext, text: str, reply_markup=None):
+    """Universal function for updating main message."""
+    data = await state.get_data()
+
+    if 'main_message_id' not in data:
+        return False
+
+    message_id = data['main_message_id']
+    new_hash = content_hash(text, reply_markup)
+
+    if message_state.is_current(chat_id, message_id, new_hash):
+        message_state.skipped_edits += 1
+        message_state.api_calls_saved += 1
+        return True
+
+    try:
+        await bot.edit_message_text(
+            chat_id=chat_id,
+            message_id=message_id,
+            text=text,
+            reply_markup=reply_markup
+        )
+        message_state.edits += 1
+        message_state.remember(chat_id, message_id, new_hash)
+        return True
+    except TelegramBadRequest as e:
+        if NOT_MODIFIED_ERROR in e.message.lower():
+            message_state.api_calls_saved += 1
+            message_state.remember(chat_id, message_id, new_hash)
+            return True
+        print(f"Failed to edit message: {e}")
+        return False
+    except Exception as e:
+        print(f"Failed to edit message: {e}")
+        return False
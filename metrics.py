@@ -0,0 +1,176 @@
+from typing import Callable, Dict, List, Optional, Tuple
+
+from aiohttp import web
+
+from config import config
+
+SUB_BUCKET_BITS = 6
+
+# Prometheus bucket bounds, in the unit of the exported value.
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536)
+
+class Histogram:
+    """Histogram of non-negative integers with a bounded relative error, HDR style.
+
+    Values below 2**SUB_BUCKET_BITS get a bucket each; larger ones share
+    buckets whose width grows with the value, so every bucket is within
+    about 1/2**(SUB_BUCKET_BITS - 1) (3%) of the values it counts. Memory
+    depends on the range of values, not their number.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.max = 0
+        self._buckets: Dict[int, int] = {}
+
+    def record(self, value: int):
+        """Counts one value."""
+        value = max(0, int(value))
+        index = _bucket_index(value)
+        self._buckets[index] = self._buckets.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def percentile(self, percent: float) -> int:
+        """Gets the value below which percent of the recorded values are, 0 if none were."""
+        if not self.count:
+            return 0
+        rank = max(1, round(self.count * percent / 100))
+        seen = 0
+        for index in sorted(self._buckets):
+            seen += self._buckets[index]
+            if seen >= rank:
+                return min(_bucket_top(index), self.max)
+        return self.max
+
+    def count_up_to(self, bound: float) -> int:
+        """Gets how many recorded values were at most bound."""
+        return sum(count for index, count in self._buckets.items() if _bucket_bottom(index) <= bound)
+
+def _bucket_index(value: int) -> int:
+    shift = max(0, value.bit_length() - SUB_BUCKET_BITS)
+    return (shift << (SUB_BUCKET_BITS - 1)) + (value >> shift)
+
+def _bucket_range(index: int) -> Tuple[int, int]:
+    shift = max(0, (index >> (SUB_BUCKET_BITS - 1)) - 1)
+    base = index - (shift << (SUB_BUCKET_BITS - 1))
+    return base << shift, ((base + 1) << shift) - 1
+
+def _bucket_bottom(index: int) -> int:
+    return _bucket_range(index)[0]
+
+def _bucket_top(index: int) -> int:
+    return _bucket_range(index)[1]
+
+class HistogramFamily:
+    """Histograms of one metric, one per label value."""
+
+    def __init__(self, name: str, help_text: str, label: str, scale: float, buckets: Tuple[float, ...]):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self.scale = scale
+        self.buckets = buckets
+        self.histograms: Dict[str, Histogram] = {}
+
+    def get(self, label_value: str) -> Histogram:
+        """Gets the histogram of a label value, creating it on first use."""
+        histogram = self.histograms.get(label_value)
+        if histogram is None:
+            histogram = self.histograms[label_value] = Histogram()
+        return histogram
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for label_value, histogram in sorted(self.histograms.items()):
+            label = f'{self.label}="{_escape(label_value)}"'
+            for bound in self.buckets:
+                # Recorded values are integers in 1/scale units of the exported value.
+                count = histogram.count_up_to(bound / self.scale)
+                lines.append(f'{self.name}_bucket{{{label},le="{bound}"}} {count}')
+            lines.append(f'{self.name}_bucket{{{label},le="+Inf"}} {histogram.count}')
+            lines.append(f"{self.name}_sum{{{label}}} {histogram.total * self.scale:g}")
+            lines.append(f"{self.name}_count{{{label}}} {histogram.count}")
+        return lines
+
+class MetricsRegistry:
+    """Metrics of the bot, rendered as Prometheus text.
+
+    Holds labelled histograms and counters, and get_stats functions of
+    other components, whose numeric values are exported as gauges named
+    bot_<prefix>_<key>.
+    """
+
+    def __init__(self):
+        self.families: Dict[str, HistogramFamily] = {}
+        self.counters: Dict[str, Tuple[str, str, Dict[str, float]]] = {}
+        self.stats: Dict[str, Callable[[], dict]] = {}
+
+    def histogram(self, name: str, help_text: str, label: str, scale: float = 1.0,
+                  buckets: Tuple[float, ...] = COUNT_BUCKETS) -> HistogramFamily:
+        """Gets a histogram family, registering it on first use."""
+        family = self.families.get(name)
+        if family is None:
+            family = self.families[name] = HistogramFamily(name, help_text, label, scale, buckets)
+        return family
+
+    def counter(self, name: str, help_text: str, label: str) -> Dict[str, float]:
+        """Gets the values of a labelled counter, registering it on first use."""
+        if name not in self.counters:
+            self.counters[name] = (help_text, label, {})
+        return self.counters[name][2]
+
+    def add_stats(self, prefix: str, get_stats: Callable[[], dict]):
+        """Exports the numeric values returned by get_stats as gauges."""
+        self.stats[prefix] = get_stats
+
+    def render(self) -> str:
+        """Gets all metrics in the Prometheus text format."""
+        lines = []
+        for family in self.families.values():
+            lines.extend(family.render())
+        for name, (help_text, label, values) in self.counters.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} counter")
+            for label_value, value in sorted(values.items()):
+                lines.append(f'{name}{{{label}="{_escape(label_value)}"}} {value:g}')
+        for prefix, get_stats in self.stats.items():
+            for key, value in get_stats().items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    lines.append(f"# TYPE bot_{prefix}_{key} gauge")
+                    lines.append(f"bot_{prefix}_{key} {value:g}")
+        return "\n".join(lines) + "\n"
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+class MetricsServer:
+    """HTTP server that serves the registry at /metrics for Prometheus to scrape."""
+
+    def __init__(self, registry: MetricsRegistry):
+        self.registry = registry
+        self._runner: Optional[web.AppRunner] = None
+
+    async def start(self, host: str = config.METRICS_HOST, port: int = config.METRICS_PORT):
+        """Starts the HTTP server."""
+        app = web.Application()
+        app.router.add_get("/metrics", self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+
+    async def stop(self):
+        """Stops the HTTP server."""
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        return web.Response(body=self.registry.render().encode(),
+                            headers={'Content-Type': "text/plain; version=0.0.4; charset=utf-8"})
+
+registry = MetricsRegistry()
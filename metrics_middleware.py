@@ -0,0 +1,120 @@
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.methods import TelegramMethod
+from aiogram.types import TelegramObject
+
+from metrics import BYTES_BUCKETS, SECONDS_BUCKETS, MetricsRegistry, registry
+
+class UpdateSample:
+    """What handling one update cost."""
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_time = 0.0
+        self.api_calls = 0
+        self.api_bytes = 0
+
+# Sample of the update being handled, set by HandlerMetricsMiddleware.
+current_sample: ContextVar[Optional[UpdateSample]] = ContextVar('current_sample', default=None)
+
+def handler_name(event: TelegramObject, data: dict) -> str:
+    """Gets the name of the function that handles the event."""
+    handler = data.get('callback_handler') or data.get('handler')
+    return handler.callback.__name__ if handler else type(event).__name__
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Middleware that records what every handler costs.
+
+    Registered first, so the wall time covers the other middlewares and the
+    commit too. Time in SQL and the number of statements come from the
+    counter DatabaseMiddleware leaves in data['statement_counter'], Telegram
+    API calls and the bytes sent from ApiCallMetrics. Every value goes to a histogram labelled with the
+    handler's name.
+    """
+
+    def __init__(self, metrics: MetricsRegistry = registry):
+        self.duration = metrics.histogram("bot_handler_duration_seconds", "Time to handle an update.",
+                                          "handler", 1e-6, SECONDS_BUCKETS)
+        self.sql_time = metrics.histogram("bot_handler_sql_seconds", "Time spent in SQL statements per update.",
+                                          "handler", 1e-6, SECONDS_BUCKETS)
+        self.queries = metrics.histogram("bot_handler_sql_queries", "SQL statements per update.", "handler")
+        self.api_calls = metrics.histogram("bot_handler_api_calls", "Telegram API calls per update.", "handler")
+        self.api_bytes = metrics.histogram("bot_handler_api_bytes", "Bytes sent to the Telegram API per update.",
+                                           "handler", 1.0, BYTES_BUCKETS)
+        self.errors = metrics.counter("bot_handler_errors_total", "Updates whose handler raised.", "handler")
+
+    async def __call__(self, handler, event: TelegramObject, data: dict):
+        sample = UpdateSample()
+        token = current_sample.set(sample)
+        started = time.perf_counter()
+        failed = False
+        try:
+            return await handler(event, data)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            current_sample.reset(token)
+            counter = data.get('statement_counter')
+            if counter is not None:
+                sample.queries = counter.statements
+                sample.sql_time = counter.seconds
+            self._record(handler_name(event, data), sample, time.perf_counter() - started, failed)
+
+    def _record(self, name: str, sample: UpdateSample, elapsed: float, failed: bool):
+        self.duration.get(name).record(elapsed * 1e6)
+        self.sql_time.get(name).record(sample.sql_time * 1e6)
+        self.queries.get(name).record(sample.queries)
+        self.api_calls.get(name).record(sample.api_calls)
+        self.api_bytes.get(name).record(sample.api_bytes)
+        if failed:
+            self.errors[name] = self.errors.get(name, 0) + 1
+
+    def get_stats(self, top: int = 5) -> dict:
+        """Gets the handlers with the highest p99 time."""
+        slowest = sorted(self.duration.histograms.items(), key=lambda item: item[1].percentile(99), reverse=True)
+        stats = {}
+        for name, duration in slowest[:top]:
+            stats[name] = {
+                'updates': duration.count,
+                'p50_ms': round(duration.percentile(50) / 1000, 1),
+                'p99_ms': round(duration.percentile(99) / 1000, 1),
+                'sql_p99_ms': round(self.sql_time.get(name).percentile(99) / 1000, 1),
+                'queries_p99': self.queries.get(name).percentile(99),
+                'api_calls_p99': self.api_calls.get(name).percentile(99),
+            }
+        return stats
+
+class ApiCallMetrics(BaseRequestMiddleware):
+    """Bot session middleware that counts Telegram API calls and the bytes they send."""
+
+    def __init__(self, metrics: MetricsRegistry = registry):
+        self.calls = metrics.counter("bot_api_calls_total", "Telegram API calls.", "method")
+        self.sent = metrics.counter("bot_api_sent_bytes_total", "Bytes sent to the Telegram API.", "method")
+
+    async def __call__(self, make_request, bot, method: TelegramMethod):
+        size = _payload_size(bot, method)
+        name = method.__api_method__
+        self.calls[name] = self.calls.get(name, 0) + 1
+        self.sent[name] = self.sent.get(name, 0) + size
+
+        sample = current_sample.get()
+        if sample is not None:
+            sample.api_calls += 1
+            sample.api_bytes += size
+        return await make_request(bot, method)
+
+def _payload_size(bot, method: TelegramMethod) -> int:
+    """Gets the size of the form fields the session sends for the method, uploaded files left out."""
+    size = 0
+    for key, value in method.model_dump(warnings=False).items():
+        value = bot.session.prepare_value(value, bot=bot, files={})
+        if value:
+            size += len(key) + len(value)
+    return size
+
+api_call_metrics = ApiCallMetrics()
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, Text, Boolean
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, Text, Boolean, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -18,6 +18,9 @@ class Category(Base):
 class Product(Base):
     """Product model."""
     __tablename__ = 'products'
+    __table_args__ = (
+        Index('ix_products_category_id', 'category_id'),
+    )
 
     id = Column(Integer, primary_key=True)
     name = Column(String(200), unique=True, nullable=False)
@@ -29,6 +32,9 @@ class Product(Base):
 class Recipe(Base):
     """Recipe model."""
     __tablename__ = 'recipes'
+    __table_args__ = (
+        Index('ix_recipes_user_id_name', 'user_id', 'name'),
+    )
 
     id = Column(Integer, primary_key=True)
     name = Column(String(200), nullable=False)
@@ -40,6 +46,10 @@ class Recipe(Base):
 class RecipeIngredient(Base):
     """Recipe ingredient model linking recipes with products."""
     __tablename__ = 'recipe_ingredients'
+    __table_args__ = (
+        Index('ix_recipe_ingredients_recipe_id_product_id', 'recipe_id', 'product_id'),
+        Index('ix_recipe_ingredients_product_id', 'product_id'),
+    )
 
     id = Column(Integer, primary_key=True)
     recipe_id = Column(Integer, ForeignKey('recipes.id'))
@@ -53,6 +63,10 @@ class RecipeIngredient(Base):
 class ShoppingListItem(Base):
     """Shopping list item model."""
     __tablename__ = 'shopping_list'
+    __table_args__ = (
+        Index('ix_shopping_list_user_id_product_id', 'user_id', 'product_id'),
+        Index('ix_shopping_list_product_id', 'product_id'),
+    )
 
     id = Column(Integer, primary_key=True)
     product_id = Column(Integer, ForeignKey('products.id'))
@@ -66,6 +80,10 @@ class ShoppingListItem(Base):
 class SelectedRecipe(Base):
     """Selected recipe model for menu composition."""
     __tablename__ = 'selected_recipes'
+    __table_args__ = (
+        Index('uq_selected_recipes_user_id_recipe_id', 'user_id', 'recipe_id', unique=True),
+        Index('ix_selected_recipes_recipe_id', 'recipe_id'),
+    )
 
     id = Column(Integer, primary_key=True)
     recipe_id = Column(Integer, ForeignKey('recipes.id'))
@@ -73,3 +91,32 @@ class SelectedRecipe(Base):
     count = Column(Integer, default=1)
 
     recipe = relationship("Recipe")
+
+class FSMRecord(Base):
+    """Persisted FSM state and data of one storage key."""
+    __tablename__ = 'fsm_states'
+    __table_args__ = (
+        Index('ix_fsm_states_updated_at', 'updated_at'),
+    )
+
+    key = Column(String(200), primary_key=True)
+    state = Column(String(200))
+    data = Column(Text, nullable=False, default="{}")
+    updated_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+class TempProduct(Base):
+    """Extra product added to a shopping list without a recipe."""
+    __tablename__ = 'temp_products'
+    __table_args__ = (
+        Index('ix_temp_products_user_id_position', 'user_id', 'position'),
+    )
+
+    temp_id = Column(String(36), primary_key=True)
+    user_id = Column(String(50), nullable=False)
+    position = Column(Integer, nullable=False, default=0)
+    name = Column(String(200), nullable=False)
+    quantity = Column(Float, nullable=False)
+    unit = Column(String(20), default="g")
+    category = Column(String(100), nullable=False)
+    is_bought = Column(Boolean, default=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, nullable=False)
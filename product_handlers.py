@@ -1,84 +1,49 @@
-from aiogram import Router, F
+from aiogram import Router
 from aiogram.types import Message, CallbackQuery
 from aiogram.fsm.context import FSMContext
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-from database import DatabaseManager
+from callbacks import Op, pack, callback_dispatcher
+from database import AsyncDatabaseManager
 from keyboards import *
+from messaging import safe_delete_message, safe_edit_or_send, update_main_message
+from shopping_list_renderer import shopping_list_renderer, CREATED_HEADER
 from states import *
-import uuid
+from temp_product_store import temp_product_store, new_temp_id
+from typing import Optional
 
 products_router = Router()
 
-TEMP_PRODUCTS_STORAGE = {}
-
-async def safe_delete_message(message: Message):
-    """Safely deletes a message, returns success status."""
-    try:
-        await message.delete()
-        return True
-    except Exception as e:
-        print(f"Failed to delete message: {e}")
-        return False
-
-async def safe_edit_or_send(message_or_callback, text: str, reply_markup=None):
-    """Universal function for editing or sending a new message."""
-    if isinstance(message_or_callback, CallbackQuery):
-        try:
-            await message_or_callback.message.edit_text(text, reply_markup=reply_markup)
-        except Exception:
-            await safe_delete_message(message_or_callback.message)
-            await message_or_callback.message.answer(text, reply_markup=reply_markup)
-    else:
-        await message_or_callback.answer(text, reply_markup=reply_markup)
-
-async def update_main_message(bot, chat_id: int, state: FSMContext, text: str, reply_markup=None):
-    """Universal function for updating main message."""
-    data = await state.get_data()
-
-    if 'main_message_id' not in data:
-        return False
-
-    try:
-        await bot.edit_message_text(
-            chat_id=chat_id,
-            message_id=data['main_message_id'],
-            text=text,
-            reply_markup=reply_markup
-        )
-        return True
-    except Exception as e:
-        print(f"Failed to edit message: {e}")
-        return False
-
 def get_user_temp_products(user_id: str) -> list:
     """Get user's temporary products."""
-    return TEMP_PRODUCTS_STORAGE.get(user_id, [])
+    return temp_product_store.get_all(user_id)
+
+def get_user_temp_product(user_id: str, temp_id: str) -> Optional[dict]:
+    """Get user's temporary product by ID."""
+    return temp_product_store.get(user_id, temp_id)
 
-def add_user_temp_product(user_id: str, product: dict):
-    """Add temporary product for user."""
-    if user_id not in TEMP_PRODUCTS_STORAGE:
-        TEMP_PRODUCTS_STORAGE[user_id] = []
-    TEMP_PRODUCTS_STORAGE[user_id].append(product)
+def add_user_temp_product(user_id: str, product: dict) -> bool:
+    """Add temporary product for user, returns False if the limit is reached."""
+    return temp_product_store.add(user_id, product)
 
 def clear_user_temp_products(user_id: str):
     """Clear user's temporary products."""
-    if user_id in TEMP_PRODUCTS_STORAGE:
-        del TEMP_PRODUCTS_STORAGE[user_id]
+    temp_product_store.clear(user_id)
 
 def update_user_temp_products(user_id: str, products: list):
     """Update user's temporary products."""
-    TEMP_PRODUCTS_STORAGE[user_id] = products
+    temp_product_store.replace(user_id, products)
 
-def remove_temp_product_by_id(user_id: str, temp_id: str):
+def toggle_user_temp_product(user_id: str, temp_id: str) -> bool:
+    """Toggle bought status of temporary product."""
+    return temp_product_store.toggle(user_id, temp_id)
+
+def remove_temp_product_by_id(user_id: str, temp_id: str) -> bool:
     """Remove temporary product by ID."""
-    temp_products = get_user_temp_products(user_id)
-    temp_products = [p for p in temp_products if p['temp_id'] != temp_id]
-    update_user_temp_products(user_id, temp_products)
+    return temp_product_store.remove(user_id, temp_id)
 
-@products_router.callback_query(F.data == "add_temp_products")
-async def add_temp_products_start(callback: CallbackQuery, state: FSMContext):
-    user_id = ""
+@callback_dispatcher.handler(Op.ADD_TEMP_PRODUCTS)
+async def add_temp_products_start(callback: CallbackQuery, state: FSMContext, user_id: str):
     temp_products = get_user_temp_products(user_id)
 
     text = "🛍️ Adding additional products\n\n"
@@ -95,8 +60,8 @@ async def add_temp_products_start(callback: CallbackQuery, state: FSMContext):
         callback,
         text,
         reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="📋 Manage products", callback_data="manage_temp_products")] if temp_products else [],
-            [InlineKeyboardButton(text="❌ Cancel", callback_data="cancel_temp_products")]
+            [InlineKeyboardButton(text="📋 Manage products", callback_data=pack(Op.MANAGE_TEMP_PRODUCTS))] if temp_products else [],
+            [InlineKeyboardButton(text="❌ Cancel", callback_data=pack(Op.CANCEL_TEMP_PRODUCTS))]
         ])
     )
 
@@ -121,7 +86,7 @@ async def temp_product_name_received(message: Message, state: FSMContext):
         f"🛍️ Product: {product_name}\n\n"
         "⚖️ Enter quantity (numbers only):",
         reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="❌ Cancel", callback_data="cancel_temp_products")]
+            [InlineKeyboardButton(text="❌ Cancel", callback_data=pack(Op.CANCEL_TEMP_PRODUCTS))]
         ])
     )
 
@@ -130,7 +95,7 @@ async def temp_product_name_received(message: Message, state: FSMContext):
             f"🛍️ Product: {product_name}\n\n"
             "⚖️ Enter quantity (numbers only):",
             reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="❌ Cancel", callback_data="cancel_temp_products")]
+                [InlineKeyboardButton(text="❌ Cancel", callback_data=pack(Op.CANCEL_TEMP_PRODUCTS))]
             ])
         )
         await state.update_data(main_message_id=new_msg.message_id)
@@ -164,50 +129,39 @@ async def temp_product_quantity_received(message: Message, state: FSMContext):
         reply_markup=get_units_keyboard()
     )
 
-@products_router.callback_query(F.data.startswith("unit_"), TempProductStates.waiting_for_product_quantity)
-async def temp_product_unit_selected(callback: CallbackQuery, state: FSMContext):
-    unit = callback.data.split("_")[1]
+@callback_dispatcher.handler(Op.UNIT, TempProductStates.waiting_for_product_quantity)
+async def temp_product_unit_selected(callback: CallbackQuery, state: FSMContext, db: AsyncDatabaseManager, unit: str):
     data = await state.get_data()
 
     await state.update_data(temp_product_unit=unit)
 
-    with DatabaseManager() as db:
-        categories = db.get_categories()
+    categories = await db.get_categories_with_product_counts()
 
     text = f"🛍️ Product: {data['temp_product_name']}\n"
     text += f"⚖️ Quantity: {data['temp_product_quantity']} {unit}\n\n"
     text += "Select category for this product:"
 
     builder = InlineKeyboardBuilder()
-    for category in categories:
-        builder.button(text=category.name, callback_data=f"temp_category_{category.id}")
+    for category, products_count in categories:
+        builder.button(text=f"{category.name} ({products_count})", callback_data=pack(Op.TEMP_CATEGORY, category.id))
     builder.adjust(2)
-    builder.row(InlineKeyboardButton(text="❌ Cancel", callback_data="cancel_temp_products"))
+    builder.row(InlineKeyboardButton(text="❌ Cancel", callback_data=pack(Op.CANCEL_TEMP_PRODUCTS)))
 
     await safe_edit_or_send(callback, text, reply_markup=builder.as_markup())
     await state.set_state(TempProductStates.waiting_for_product_category)
 
-@products_router.callback_query(F.data.startswith("temp_category_"), TempProductStates.waiting_for_product_category)
-async def temp_product_category_selected(callback: CallbackQuery, state: FSMContext):
-    category_id = int(callback.data.split("_")[2])
-
-    with DatabaseManager() as db:
-        categories = db.get_categories()
-        category = None
-        for cat in categories:
-            if cat.id == category_id:
-                category = cat
-                break
+@callback_dispatcher.handler(Op.TEMP_CATEGORY, TempProductStates.waiting_for_product_category)
+async def temp_product_category_selected(callback: CallbackQuery, state: FSMContext, user_id: str, db: AsyncDatabaseManager, category_id: int):
+    category = await db.get_category_by_id(category_id)
 
     if not category:
         await callback.answer("❌ Category not found!", show_alert=True)
         return
 
     data = await state.get_data()
-    user_id = ""
 
     temp_product = {
-        'temp_id': str(uuid.uuid4()),
+        'temp_id': new_temp_id(),
         'name': data['temp_product_name'],
         'quantity': data['temp_product_quantity'],
         'unit': data['temp_product_unit'],
@@ -215,7 +169,13 @@ async def temp_product_category_selected(callback: CallbackQuery, state: FSMCont
         'is_bought': False
     }
 
-    add_user_temp_product(user_id, temp_product)
+    if not add_user_temp_product(user_id, temp_product):
+        await callback.answer(
+            f"❌ You can't add more than {temp_product_store.max_per_user} additional products!",
+            show_alert=True
+        )
+        return
+
     temp_products = get_user_temp_products(user_id)
 
     text = "🛍️ Additional products:\n\n"
@@ -225,18 +185,17 @@ async def temp_product_category_selected(callback: CallbackQuery, state: FSMCont
     text += "\nWhat would you like to do next?"
 
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="➕ Add more product", callback_data="add_temp_products")],
-        [InlineKeyboardButton(text="📋 Manage products", callback_data="manage_temp_products")],
-        [InlineKeyboardButton(text="✅ Create list with products", callback_data="create_list_with_temp")],
-        [InlineKeyboardButton(text="🗑 Clear additional products", callback_data="clear_temp_products")],
-        [InlineKeyboardButton(text="🏠 Main menu", callback_data="main_menu")]
+        [InlineKeyboardButton(text="➕ Add more product", callback_data=pack(Op.ADD_TEMP_PRODUCTS))],
+        [InlineKeyboardButton(text="📋 Manage products", callback_data=pack(Op.MANAGE_TEMP_PRODUCTS))],
+        [InlineKeyboardButton(text="✅ Create list with products", callback_data=pack(Op.CREATE_LIST_WITH_TEMP))],
+        [InlineKeyboardButton(text="🗑 Clear additional products", callback_data=pack(Op.CLEAR_TEMP_PRODUCTS))],
+        [InlineKeyboardButton(text="🏠 Main menu", callback_data=pack(Op.MAIN_MENU))]
     ])
 
     await safe_edit_or_send(callback, text, reply_markup=keyboard)
 
-@products_router.callback_query(F.data == "manage_temp_products")
-async def manage_temp_products(callback: CallbackQuery):
-    user_id = ""
+@callback_dispatcher.handler(Op.MANAGE_TEMP_PRODUCTS)
+async def manage_temp_products(callback: CallbackQuery, user_id: str):
     temp_products = get_user_temp_products(user_id)
 
     if not temp_products:
@@ -252,27 +211,32 @@ async def manage_temp_products(callback: CallbackQuery):
     for product in temp_products:
         product_text = f"{product['name']} ({product['quantity']} {product['unit']})"
         builder.row(
-            InlineKeyboardButton(text=product_text, callback_data=f"view_temp_{product['temp_id']}"),
-            InlineKeyboardButton(text="🗑", callback_data=f"delete_temp_{product['temp_id']}")
+            InlineKeyboardButton(text=product_text, callback_data=pack(Op.VIEW_TEMP, product['temp_id'])),
+            InlineKeyboardButton(text="🗑", callback_data=pack(Op.DELETE_TEMP, product['temp_id']))
         )
 
-    builder.row(InlineKeyboardButton(text="➕ Add product", callback_data="add_temp_products"))
-    builder.row(InlineKeyboardButton(text="🗑 Clear all", callback_data="clear_temp_products"))
-    builder.row(InlineKeyboardButton(text="◀️ Back", callback_data="temp_products_back"))
+    builder.row(InlineKeyboardButton(text="➕ Add product", callback_data=pack(Op.ADD_TEMP_PRODUCTS)))
+    builder.row(InlineKeyboardButton(text="🗑 Clear all", callback_data=pack(Op.CLEAR_TEMP_PRODUCTS)))
+    builder.row(InlineKeyboardButton(text="◀️ Back", callback_data=pack(Op.TEMP_PRODUCTS_BACK)))
 
     await safe_edit_or_send(callback, text, reply_markup=builder.as_markup())
 
-@products_router.callback_query(F.data.startswith("delete_temp_"))
-async def delete_temp_product_confirm(callback: CallbackQuery):
-    temp_id = callback.data.split("_")[2]
-    user_id = ""
+@callback_dispatcher.handler(Op.VIEW_TEMP)
+async def view_temp_product(callback: CallbackQuery, user_id: str, temp_id: str):
+    product = get_user_temp_product(user_id, temp_id)
 
-    temp_products = get_user_temp_products(user_id)
-    product = None
-    for p in temp_products:
-        if p['temp_id'] == temp_id:
-            product = p
-            break
+    if not product:
+        await callback.answer("❌ Product not found!", show_alert=True)
+        return
+
+    await callback.answer(
+        f"🛍️ {product['name']} - {product['quantity']} {product['unit']}\n📂 Category: {product['category']}",
+        show_alert=True
+    )
+
+@callback_dispatcher.handler(Op.DELETE_TEMP)
+async def delete_temp_product_confirm(callback: CallbackQuery, user_id: str, temp_id: str):
+    product = get_user_temp_product(user_id, temp_id)
 
     if not product:
         await callback.answer("❌ Product not found!", show_alert=True)
@@ -283,27 +247,23 @@ async def delete_temp_product_confirm(callback: CallbackQuery):
 
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
         [
-            InlineKeyboardButton(text="✅ Yes, delete", callback_data=f"confirm_delete_temp_{temp_id}"),
-            InlineKeyboardButton(text="❌ Cancel", callback_data="manage_temp_products")
+            InlineKeyboardButton(text="✅ Yes, delete", callback_data=pack(Op.CONFIRM_DELETE_TEMP, temp_id)),
+            InlineKeyboardButton(text="❌ Cancel", callback_data=pack(Op.MANAGE_TEMP_PRODUCTS))
         ]
     ])
 
     await safe_edit_or_send(callback, text, reply_markup=keyboard)
 
-@products_router.callback_query(F.data.startswith("confirm_delete_temp_"))
-async def confirm_delete_temp_product(callback: CallbackQuery):
-    temp_id = callback.data.split("_")[3]
-    user_id = ""
-
+@callback_dispatcher.handler(Op.CONFIRM_DELETE_TEMP)
+async def confirm_delete_temp_product(callback: CallbackQuery, user_id: str, db: AsyncDatabaseManager, temp_id: str):
     remove_temp_product_by_id(user_id, temp_id)
 
     await callback.answer("✅ Product deleted!", show_alert=True)
 
-    await back_to_shopping_list(callback)
+    await back_to_shopping_list(callback, user_id, db)
 
-@products_router.callback_query(F.data == "clear_temp_products")
-async def clear_temp_products(callback: CallbackQuery, state: FSMContext):
-    user_id = ""
+@callback_dispatcher.handler(Op.CLEAR_TEMP_PRODUCTS)
+async def clear_temp_products(callback: CallbackQuery, state: FSMContext, user_id: str):
     temp_products = get_user_temp_products(user_id)
 
     if not temp_products:
@@ -316,40 +276,37 @@ async def clear_temp_products(callback: CallbackQuery, state: FSMContext):
 
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
         [
-            InlineKeyboardButton(text="✅ Yes, clear all", callback_data="confirm_clear_temp"),
-            InlineKeyboardButton(text="❌ Cancel", callback_data="manage_temp_products")
+            InlineKeyboardButton(text="✅ Yes, clear all", callback_data=pack(Op.CONFIRM_CLEAR_TEMP)),
+            InlineKeyboardButton(text="❌ Cancel", callback_data=pack(Op.MANAGE_TEMP_PRODUCTS))
         ]
     ])
 
     await safe_edit_or_send(callback, text, reply_markup=keyboard)
 
-@products_router.callback_query(F.data == "confirm_clear_temp")
-async def confirm_clear_temp_products(callback: CallbackQuery):
-    user_id = ""
+@callback_dispatcher.handler(Op.CONFIRM_CLEAR_TEMP)
+async def confirm_clear_temp_products(callback: CallbackQuery, user_id: str):
     clear_user_temp_products(user_id)
 
     await safe_edit_or_send(
         callback,
         "✅ All additional products deleted!",
         reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="➕ Add product", callback_data="add_temp_products")],
-            [InlineKeyboardButton(text="🏠 Main menu", callback_data="main_menu")]
+            [InlineKeyboardButton(text="➕ Add product", callback_data=pack(Op.ADD_TEMP_PRODUCTS))],
+            [InlineKeyboardButton(text="🏠 Main menu", callback_data=pack(Op.MAIN_MENU))]
         ])
     )
 
-@products_router.callback_query(F.data == "temp_products_back")
-async def temp_products_back(callback: CallbackQuery):
-    user_id = ""
-    with DatabaseManager() as db:
-        recipes = db.get_recipes()
-        selected_recipes = db.get_selected_recipes(user_id)
+@callback_dispatcher.handler(Op.TEMP_PRODUCTS_BACK)
+async def temp_products_back(callback: CallbackQuery, user_id: str, db: AsyncDatabaseManager):
+    recipes = await db.get_recipes()
+    selected_recipes = await db.get_selected_recipes(user_id)
 
-        selected_data = []
-        for sel in selected_recipes:
-            selected_data.append({
-                'recipe_name': sel.recipe.name,
-                'count': sel.count
-            })
+    selected_data = []
+    for sel in selected_recipes:
+        selected_data.append({
+            'recipe_name': sel.recipe.name,
+            'count': sel.count
+        })
 
     text = "🧾 Composing menu\n\n"
 
@@ -364,147 +321,45 @@ async def temp_products_back(callback: CallbackQuery):
 
     await safe_edit_or_send(callback, text, reply_markup=get_recipes_list(recipes, "select"))
 
-@products_router.callback_query(F.data == "create_list_with_temp")
-async def create_shopping_list_with_temp(callback: CallbackQuery, state: FSMContext):
-    user_id = ""
+@callback_dispatcher.handler(Op.CREATE_LIST_WITH_TEMP)
+async def create_shopping_list_with_temp(callback: CallbackQuery, state: FSMContext, user_id: str, db: AsyncDatabaseManager):
     temp_products = get_user_temp_products(user_id)
 
-    with DatabaseManager() as db:
-        selected_recipes = db.get_selected_recipes(user_id)
+    selected_recipes = await db.get_selected_recipes(user_id)
 
-        if selected_recipes:
-            db.create_shopping_list_from_selected(user_id)
+    if selected_recipes:
+        await db.create_shopping_list_from_selected(user_id)
 
-        shopping_items = db.get_shopping_list(user_id)
+    shopping_items = await db.get_shopping_list(user_id)
 
     await state.clear()
 
-    categories = {}
-
-    for item in shopping_items:
-        category_name = item.product.category.name
-        if category_name not in categories:
-            categories[category_name] = []
-        categories[category_name].append({
-            'type': 'recipe',
-            'item': item
-        })
-
-    for temp_product in temp_products:
-        category_name = temp_product['category']
-        if category_name not in categories:
-            categories[category_name] = []
-        categories[category_name].append({
-            'type': 'temp',
-            'item': temp_product
-        })
-
-    text = "✅ Shopping list created!\n\n🛒 Your list:\n\n"
-
-    for category_name, items in categories.items():
-        text += f"📦 {category_name}:\n"
-        for item_data in items:
-            if item_data['type'] == 'recipe':
-                item = item_data['item']
-                text += f"• {item.product.name} - {item.quantity} {item.unit}\n"
-            else:
-                item = item_data['item']
-                text += f"• {item['name']} - {item['quantity']} {item['unit']} 🛍️\n"
-        text += "\n"
-
-    keyboard = get_shopping_list_with_temp_keyboard(shopping_items, temp_products)
-
-    await safe_edit_or_send(callback, text, reply_markup=keyboard)
-
-@products_router.callback_query(F.data.startswith("toggle_temp_"))
-async def toggle_temp_product(callback: CallbackQuery, state: FSMContext):
-    temp_id = callback.data.split("_")[2]
-    user_id = ""
-
-    temp_products = get_user_temp_products(user_id)
-
-    for product in temp_products:
-        if product['temp_id'] == temp_id:
-            product['is_bought'] = not product['is_bought']
-            break
-
-    update_user_temp_products(user_id, temp_products)
-
-    await update_shopping_list_display(callback, user_id)
-
-@products_router.callback_query(F.data.startswith("delete_temp_from_list_"))
-async def delete_temp_product_from_list(callback: CallbackQuery, state: FSMContext):
-    temp_id = callback.data.split("_")[4]
-    user_id = ""
-
-    temp_products = get_user_temp_products(user_id)
-
-    temp_products = [p for p in temp_products if p['temp_id'] != temp_id]
-    update_user_temp_products(user_id, temp_products)
-
-    await update_shopping_list_display(callback, user_id)
-
-async def update_shopping_list_display(callback: CallbackQuery, user_id: str):
-    """Updates shopping list display with temporary products."""
-    temp_products = get_user_temp_products(user_id)
-
-    with DatabaseManager() as db:
-        shopping_items = db.get_shopping_list(user_id)
-
-    categories = {}
-
-    for item in shopping_items:
-        category_name = item.product.category.name
-        if category_name not in categories:
-            categories[category_name] = []
-        categories[category_name].append({
-            'type': 'recipe',
-            'item': item
-        })
-
-    for temp_product in temp_products:
-        category_name = temp_product['category']
-        if category_name not in categories:
-            categories[category_name] = []
-        categories[category_name].append({
-            'type': 'temp',
-            'item': temp_product
-        })
-
-    text = "🛒 Shopping list:\n\n"
-
-    for category_name, items in categories.items():
-        text += f"📦 {category_name}:\n"
-        for item_data in items:
-            if item_data['type'] == 'recipe':
-                item = item_data['item']
-                status = "✅" if item.is_bought else "⭕"
-                text += f"{status} {item.product.name} - {item.quantity} {item.unit}\n"
-            else:
-                item = item_data['item']
-                status = "✅" if item['is_bought'] else "⭕"
-                text += f"{status} {item['name']} - {item['quantity']} {item['unit']} 🛍️\n"
-        text += "\n"
-
-    keyboard = get_shopping_list_with_temp_keyboard(shopping_items, temp_products)
+    text, keyboard = shopping_list_renderer.render(
+        user_id,
+        shopping_items,
+        temp_products,
+        header=CREATED_HEADER,
+        show_status=False,
+        with_temp_keyboard=True
+    )
 
     await safe_edit_or_send(callback, text, reply_markup=keyboard)
 
-@products_router.callback_query(F.data == "cancel_temp_products")
-async def cancel_temp_products(callback: CallbackQuery, state: FSMContext):
+@callback_dispatcher.handler(Op.CANCEL_TEMP_PRODUCTS)
+async def cancel_temp_products(callback: CallbackQuery, state: FSMContext, user_id: str, db: AsyncDatabaseManager):
     await state.clear()
 
+    has_shopping_list = await db.has_shopping_list(user_id)
+
     await safe_edit_or_send(
         callback,
         "🏠 Main menu\n\nSelect action:",
-        reply_markup=get_main_menu_inline()
+        reply_markup=get_main_menu_inline(has_shopping_list)
     )
 
-@products_router.callback_query(F.data == "add_recipe_to_list")
-async def add_recipe_to_existing_list(callback: CallbackQuery, state: FSMContext):
-    user_id = ""
-    with DatabaseManager() as db:
-        recipes = db.get_recipes()
+@callback_dispatcher.handler(Op.RECIPES_FOR_LIST)
+async def add_recipe_to_existing_list(callback: CallbackQuery, state: FSMContext, user_id: str, db: AsyncDatabaseManager):
+    recipes = await db.get_recipes()
 
     if not recipes:
         await callback.answer("❌ No available recipes!", show_alert=True)
@@ -516,86 +371,49 @@ async def add_recipe_to_existing_list(callback: CallbackQuery, state: FSMContext
     builder = InlineKeyboardBuilder()
 
     for recipe in recipes:
-        builder.button(text=recipe.name, callback_data=f"add_recipe_to_list_{recipe.id}")
+        builder.button(text=recipe.name, callback_data=pack(Op.ADD_RECIPE_TO_LIST, recipe.id))
 
     builder.adjust(1)
-    builder.row(InlineKeyboardButton(text="❌ Cancel", callback_data="back_to_shopping_list"))
+    builder.row(InlineKeyboardButton(text="❌ Cancel", callback_data=pack(Op.BACK_TO_SHOPPING_LIST)))
 
     await safe_edit_or_send(callback, text, reply_markup=builder.as_markup())
 
-@products_router.callback_query(F.data.startswith("add_recipe_to_list_"))
-async def add_specific_recipe_to_list(callback: CallbackQuery):
-    recipe_id = int(callback.data.split("_")[4])
-    user_id = ""
-    with DatabaseManager() as db:
-        recipe = db.get_recipe_by_id(recipe_id)
-
-        if not recipe:
-            await callback.answer("❌ Recipe not found!", show_alert=True)
-            return
+@callback_dispatcher.handler(Op.ADD_RECIPE_TO_LIST)
+async def add_specific_recipe_to_list(callback: CallbackQuery, user_id: str, db: AsyncDatabaseManager, recipe_id: int):
+    recipe = await db.get_recipe_by_id(recipe_id)
 
-        recipe_name = recipe.name
+    if not recipe:
+        await callback.answer("❌ Recipe not found!", show_alert=True)
+        return
 
-        recipe_ingredients = []
-        for ingredient in recipe.ingredients:
-            recipe_ingredients.append({
-                'product_name': ingredient.product.name,
-                'quantity': ingredient.quantity,
-                'unit': ingredient.unit,
-                'category': ingredient.product.category.name
-            })
+    recipe_name = recipe.name
 
-        db.add_recipe_ingredients_to_shopping_list(user_id, recipe_ingredients)
+    recipe_ingredients = []
+    for ingredient in recipe.ingredients:
+        recipe_ingredients.append({
+            'product_name': ingredient.product.name,
+            'quantity': ingredient.quantity,
+            'unit': ingredient.unit,
+            'category': ingredient.product.category.name
+        })
 
-        shopping_items = db.get_shopping_list(user_id)
+    await db.add_recipe_ingredients_to_shopping_list(user_id, recipe_ingredients)
 
     await callback.answer(f"✅ Recipe '{recipe_name}' added to list!", show_alert=True)
 
-    await back_to_shopping_list(callback)
+    await back_to_shopping_list(callback, user_id, db)
 
-@products_router.callback_query(F.data == "back_to_shopping_list")
-async def back_to_shopping_list(callback: CallbackQuery):
-    user_id = ""
+@callback_dispatcher.handler(Op.BACK_TO_SHOPPING_LIST)
+async def back_to_shopping_list(callback: CallbackQuery, user_id: str, db: AsyncDatabaseManager):
     temp_products = get_user_temp_products(user_id)
 
-    with DatabaseManager() as db:
-        shopping_items = db.get_shopping_list(user_id)
+    shopping_items = await db.get_shopping_list(user_id)
 
-    categories = {}
-
-    for item in shopping_items:
-        category_name = item.product.category.name
-        if category_name not in categories:
-            categories[category_name] = []
-        categories[category_name].append({
-            'type': 'recipe',
-            'item': item
-        })
-
-    for temp_product in temp_products:
-        category_name = temp_product['category']
-        if category_name not in categories:
-            categories[category_name] = []
-        categories[category_name].append({
-            'type': 'temp',
-            'item': temp_product
-        })
-
-    text = "🛒 Shopping list:\n\n"
-
-    for category_name, items in categories.items():
-        text += f"📦 {category_name}:\n"
-        for item_data in items:
-            if item_data['type'] == 'recipe':
-                item = item_data['item']
-                status = "✅" if item.is_bought else "⭕"
-                text += f"{status} {item.product.name} - {item.quantity} {item.unit}\n"
-            else:
-                item = item_data['item']
-                status = "✅" if item['is_bought'] else "⭕"
-                text += f"{status} {item['name']} - {item['quantity']} {item['unit']} 🛍️\n"
-        text += "\n"
-
-    keyboard = get_shopping_list_with_temp_keyboard(shopping_items, temp_products)
+    text, keyboard = shopping_list_renderer.render(
+        user_id,
+        shopping_items,
+        temp_products,
+        with_temp_keyboard=True
+    )
 
     await safe_edit_or_send(callback, text, reply_markup=keyboard)
@@ -0,0 +1,90 @@
+import re
+from collections import Counter
+from contextvars import ContextVar
+from typing import Optional
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from config import config
+from metrics_middleware import handler_name
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_PARAMETERS = re.compile(r"%\(\w+\)s|%s|\$\d+")
+_PARAMETER_LISTS = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+# Transaction control runs once per transaction, and an update may commit several.
+_TRANSACTION_CONTROL = ("BEGIN", "SAVEPOINT", "RELEASE", "ROLLBACK")
+
+class RepeatedQueryError(Exception):
+    """Raised when an update ran the same SQL statement more often than allowed."""
+
+# Statements of the update being handled by normalized text, set by RepeatedQueriesMiddleware.
+statement_log: ContextVar[Optional[Counter]] = ContextVar('statement_log', default=None)
+
+def normalize_statement(statement: str) -> str:
+    """Gets the statement with literals and parameters replaced by ? and whitespace collapsed."""
+    statement = _LITERALS.sub("?", statement)
+    statement = _PARAMETERS.sub("?", statement)
+    # Expanding IN lists render one parameter per value.
+    statement = _PARAMETER_LISTS.sub("(?...)", statement)
+    return " ".join(statement.split())
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _log_statement(conn, cursor, statement, parameters, context, executemany):
+    """Counts the statement for the update that is being checked, if any."""
+    log = statement_log.get()
+    if log is not None and not statement.lstrip().upper().startswith(_TRANSACTION_CONTROL):
+        log[normalize_statement(statement)] += 1
+
+class RepeatedQueriesMiddleware(BaseMiddleware):
+    """Debug middleware that finds queries run once per loop iteration.
+
+    Statements of each update are grouped by their text with literals and
+    parameters left out, so a lookup issued for every ingredient shows up
+    as one statement run many times. An executemany counts once. When a
+    statement runs more than limit times, mode "warn" prints it and mode
+    "fail" raises RepeatedQueryError. Registered after DatabaseMiddleware,
+    so a failed update is rolled back.
+    """
+
+    def __init__(self, mode: str = config.DB_REPEATED_QUERIES, limit: int = config.DB_REPEATED_QUERY_LIMIT):
+        self.mode = mode
+        self.limit = limit
+        self.updates = 0
+        self.flagged = 0
+        self.max_repeats = 0
+
+    async def __call__(self, handler, event: TelegramObject, data: dict):
+        log = Counter()
+        token = statement_log.set(log)
+        try:
+            result = await handler(event, data)
+        finally:
+            statement_log.reset(token)
+        self._check(handler_name(event, data), log)
+        return result
+
+    def _check(self, name: str, log: Counter):
+        self.updates += 1
+        if not log:
+            return
+        statement, count = log.most_common(1)[0]
+        self.max_repeats = max(self.max_repeats, count)
+        if count <= self.limit:
+            return
+
+        self.flagged += 1
+        message = f"{name} ran the same SQL statement {count} times in one update: {statement}"
+        if self.mode == "fail":
+            raise RepeatedQueryError(message)
+        print(f"⚠️ {message}")
+
+    def get_stats(self) -> dict:
+        """Gets the number of checked and flagged updates."""
+        return {
+            'updates': self.updates,
+            'flagged': self.flagged,
+            'max_repeats': self.max_repeats,
+        }
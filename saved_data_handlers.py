@@ -1,75 +1,35 @@
-from aiogram import Router, F
+from aiogram import Router
 from aiogram.types import CallbackQuery, Message
 from aiogram.fsm.context import FSMContext
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-from database import DatabaseManager
+from callbacks import Op, pack, callback_dispatcher
+from database import AsyncDatabaseManager
 from keyboards import *
+from messaging import safe_delete_message, safe_edit_or_send, update_main_message
 from states import *
 
 saved_data_router = Router()
 
-async def safe_delete_message(message: Message):
-    """Safely deletes a message, returns success status."""
-    try:
-        await message.delete()
-        return True
-    except Exception as e:
-        print(f"Failed to delete message: {e}")
-        return False
-
-async def safe_edit_or_send(message_or_callback, text: str, reply_markup=None):
-    """Universal function for editing or sending a new message."""
-    if isinstance(message_or_callback, CallbackQuery):
-        try:
-            await message_or_callback.message.edit_text(text, reply_markup=reply_markup)
-        except Exception:
-            await message_or_callback.message.answer(text, reply_markup=reply_markup)
-    else:
-        await message_or_callback.answer(text, reply_markup=reply_markup)
-
-async def update_main_message(bot, chat_id: int, state: FSMContext, text: str, reply_markup=None):
-    """Universal function for updating main message."""
-    data = await state.get_data()
-
-    if 'main_message_id' not in data:
-        return False
-
-    try:
-        await bot.edit_message_text(
-            chat_id=chat_id,
-            message_id=data['main_message_id'],
-            text=text,
-            reply_markup=reply_markup
-        )
-        return True
-    except Exception as e:
-        print(f"Failed to edit message: {e}")
-        return False
-
-@saved_data_router.callback_query(F.data == "saved_menu")
-async def saved_menu_callback(callback: CallbackQuery):
+@callback_dispatcher.handler(Op.SAVED_MENU)
+async def saved_menu_callback(callback: CallbackQuery, db: AsyncDatabaseManager):
     await callback.answer()
 
-    with DatabaseManager() as db:
-        recipes_count = db.count_recipes()
-        products_count = db.count_products()
-        categories_count = db.count_categories()
+    stats = await db.get_stats()
 
     text = "📚 Saved data\n\n"
-    text += f"🍽️ Recipes: {recipes_count}\n"
-    text += f"🥕 Products: {products_count}\n"
-    text += f"📦 Categories: {categories_count}\n\n"
+    text += f"🍽️ Recipes: {stats['recipes']}\n"
+    text += f"🥕 Products: {stats['products']}\n"
+    text += f"📦 Categories: {stats['categories']}\n\n"
     text += "Select section to view:"
 
     await safe_edit_or_send(callback, text, reply_markup=get_saved_menu())
 
-@saved_data_router.callback_query(F.data == "saved_recipes")
-async def saved_recipes_callback(callback: CallbackQuery):
+@callback_dispatcher.handler(Op.SAVED_RECIPES)
+async def saved_recipes_callback(callback: CallbackQuery, db: AsyncDatabaseManager):
     await callback.answer()
 
-    with DatabaseManager() as db:
-        recipes = db.get_recipes()
+    recipes = await db.get_recipes()
 
     if not recipes:
         await safe_edit_or_send(
@@ -77,8 +37,8 @@ async def saved_recipes_callback(callback: CallbackQuery):
             "🍽️ Saved recipes\n\n"
             "📝 You don't have any saved recipes yet!",
             reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="◀️ Back", callback_data="saved_menu")],
-                [InlineKeyboardButton(text="🏠 Main menu", callback_data="main_menu")]
+                [InlineKeyboardButton(text="◀️ Back", callback_data=pack(Op.SAVED_MENU))],
+                [InlineKeyboardButton(text="🏠 Main menu", callback_data=pack(Op.MAIN_MENU))]
             ])
         )
         return
@@ -88,26 +48,24 @@ async def saved_recipes_callback(callback: CallbackQuery):
 
     await safe_edit_or_send(callback, text, reply_markup=get_saved_recipes_list(recipes))
 
-@saved_data_router.callback_query(F.data.startswith("view_recipe_"))
-async def view_recipe_details(callback: CallbackQuery):
+@callback_dispatcher.handler(Op.VIEW_RECIPE)
+async def view_recipe_details(callback: CallbackQuery, db: AsyncDatabaseManager, recipe_id: int):
     await callback.answer()
-    recipe_id = int(callback.data.split("_")[2])
 
-    with DatabaseManager() as db:
-        recipe = db.get_recipe_by_id(recipe_id)
+    recipe = await db.get_recipe_by_id(recipe_id)
 
-        if not recipe:
-            await callback.answer("❌ Recipe not found!", show_alert=True)
-            return
+    if not recipe:
+        await callback.answer("❌ Recipe not found!", show_alert=True)
+        return
 
-        recipe_name = recipe.name
-        ingredients = []
-        for ingredient in recipe.ingredients:
-            ingredients.append({
-                'name': ingredient.product.name,
-                'quantity': ingredient.quantity,
-                'unit': ingredient.unit
-            })
+    recipe_name = recipe.name
+    ingredients = []
+    for ingredient in recipe.ingredients:
+        ingredients.append({
+            'name': ingredient.product.name,
+            'quantity': ingredient.quantity,
+            'unit': ingredient.unit
+        })
 
     text = f"🍽️ {recipe_name}\n\n"
     text += "📋 Ingredients:\n"
@@ -117,19 +75,17 @@ async def view_recipe_details(callback: CallbackQuery):
 
     await safe_edit_or_send(callback, text, reply_markup=get_recipe_view_menu(recipe_id))
 
-@saved_data_router.callback_query(F.data.startswith("delete_saved_recipe_"))
-async def delete_saved_recipe_confirm(callback: CallbackQuery):
+@callback_dispatcher.handler(Op.DELETE_SAVED_RECIPE)
+async def delete_saved_recipe_confirm(callback: CallbackQuery, db: AsyncDatabaseManager, recipe_id: int):
     await callback.answer()
-    recipe_id = int(callback.data.split("_")[3])
 
-    with DatabaseManager() as db:
-        recipe = db.get_recipe_by_id(recipe_id)
+    recipe = await db.get_recipe_by_id(recipe_id)
 
-        if not recipe:
-            await callback.answer("❌ Recipe not found!", show_alert=True)
-            return
+    if not recipe:
+        await callback.answer("❌ Recipe not found!", show_alert=True)
+        return
 
-        recipe_name = recipe.name
+    recipe_name = recipe.name
 
     text = f"🗑 Deleting recipe\n\n"
     text += f"📝 Recipe: {recipe_name}\n\n"
@@ -138,46 +94,43 @@ async def delete_saved_recipe_confirm(callback: CallbackQuery):
 
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
         [
-            InlineKeyboardButton(text="✅ Yes, delete", callback_data=f"confirm_delete_saved_recipe_{recipe_id}"),
-            InlineKeyboardButton(text="❌ Cancel", callback_data=f"view_recipe_{recipe_id}")
+            InlineKeyboardButton(text="✅ Yes, delete", callback_data=pack(Op.CONFIRM_DELETE_SAVED_RECIPE, recipe_id)),
+            InlineKeyboardButton(text="❌ Cancel", callback_data=pack(Op.VIEW_RECIPE, recipe_id))
         ]
     ])
 
     await safe_edit_or_send(callback, text, reply_markup=keyboard)
 
-@saved_data_router.callback_query(F.data.startswith("confirm_delete_saved_recipe_"))
-async def confirm_delete_saved_recipe(callback: CallbackQuery):
+@callback_dispatcher.handler(Op.CONFIRM_DELETE_SAVED_RECIPE)
+async def confirm_delete_saved_recipe(callback: CallbackQuery, db: AsyncDatabaseManager, recipe_id: int):
     await callback.answer()
-    recipe_id = int(callback.data.split("_")[4])
 
-    with DatabaseManager() as db:
-        recipe = db.get_recipe_by_id(recipe_id)
+    recipe = await db.get_recipe_by_id(recipe_id)
 
-        if not recipe:
-            await callback.answer("❌ Recipe not found!", show_alert=True)
-            return
+    if not recipe:
+        await callback.answer("❌ Recipe not found!", show_alert=True)
+        return
 
-        recipe_name = recipe.name
-        success = db.delete_recipe(recipe_id)
+    recipe_name = recipe.name
+    success = await db.delete_recipe(recipe_id)
 
     if success:
         await safe_edit_or_send(
             callback,
             f"✅ Recipe '{recipe_name}' successfully deleted!",
             reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="◀️ Back to recipes", callback_data="saved_recipes")],
-                [InlineKeyboardButton(text="🏠 Main menu", callback_data="main_menu")]
+                [InlineKeyboardButton(text="◀️ Back to recipes", callback_data=pack(Op.SAVED_RECIPES))],
+                [InlineKeyboardButton(text="🏠 Main menu", callback_data=pack(Op.MAIN_MENU))]
             ])
         )
     else:
         await callback.answer("❌ Error deleting recipe!", show_alert=True)
 
-@saved_data_router.callback_query(F.data == "saved_products")
-async def saved_products_callback(callback: CallbackQuery):
+@callback_dispatcher.handler(Op.SAVED_PRODUCTS)
+async def saved_products_callback(callback: CallbackQuery, db: AsyncDatabaseManager):
     await callback.answer()
 
-    with DatabaseManager() as db:
-        products = db.get_all_products()
+    products = await db.get_all_products()
 
     if not products:
         await safe_edit_or_send(
@@ -186,8 +139,8 @@ async def saved_products_callback(callback: CallbackQuery):
             "📋 Product database is empty!\n\n"
             "Products will appear automatically when creating recipes.",
             reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="◀️ Back", callback_data="saved_menu")],
-                [InlineKeyboardButton(text="🏠 Main menu", callback_data="main_menu")]
+                [InlineKeyboardButton(text="◀️ Back", callback_data=pack(Op.SAVED_MENU))],
+                [InlineKeyboardButton(text="🏠 Main menu", callback_data=pack(Op.MAIN_MENU))]
             ])
         )
         return
@@ -214,31 +167,29 @@ async def saved_products_callback(callback: CallbackQuery):
     for product in products:
         builder.button(
             text=f"{product.name} ({product.category.name})",
-            callback_data=f"view_saved_product_{product.id}"
+            callback_data=pack(Op.VIEW_SAVED_PRODUCT, product.id)
         )
 
     builder.adjust(1)
-    builder.row(InlineKeyboardButton(text="◀️ Back", callback_data="saved_menu"))
-    builder.row(InlineKeyboardButton(text="🏠 Main menu", callback_data="main_menu"))
+    builder.row(InlineKeyboardButton(text="◀️ Back", callback_data=pack(Op.SAVED_MENU)))
+    builder.row(InlineKeyboardButton(text="🏠 Main menu", callback_data=pack(Op.MAIN_MENU)))
 
     await safe_edit_or_send(callback, text, reply_markup=builder.as_markup())
 
-@saved_data_router.callback_query(F.data.startswith("view_saved_product_"))
-async def view_saved_product_details(callback: CallbackQuery):
+@callback_dispatcher.handler(Op.VIEW_SAVED_PRODUCT)
+async def view_saved_product_details(callback: CallbackQuery, db: AsyncDatabaseManager, product_id: int):
     await callback.answer()
-    product_id = int(callback.data.split("_")[3])
 
-    with DatabaseManager() as db:
-        product = db.get_product_by_id(product_id)
+    product = await db.get_product_by_id(product_id)
 
-        if not product:
-            await callback.answer("❌ Product not found!", show_alert=True)
-            return
+    if not product:
+        await callback.answer("❌ Product not found!", show_alert=True)
+        return
 
-        product_name = product.name
-        category_name = product.category.name
-        recipes_count = db.count_recipes_with_product(product_id)
-        recipes_with_product = db.get_recipes_with_product(product_id)
+    product_name = product.name
+    category_name = product.category.name
+    recipes_count = await db.count_recipes_with_product(product_id)
+    recipes_with_product = await db.get_recipes_with_product(product_id)
 
     text = f"🥕 {product_name}\n\n"
     text += f"📂 Category: {category_name}\n"
@@ -253,27 +204,25 @@ async def view_saved_product_details(callback: CallbackQuery):
             text += f"... and {len(recipes_with_product) - 10} more recipes\n"
 
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="✏️ Change name", callback_data=f"edit_product_name_{product_id}")],
-        [InlineKeyboardButton(text="🗑 Delete product", callback_data=f"delete_product_confirm_{product_id}")],
-        [InlineKeyboardButton(text="◀️ Back to list", callback_data="saved_products")],
-        [InlineKeyboardButton(text="🏠 Main menu", callback_data="main_menu")]
+        [InlineKeyboardButton(text="✏️ Change name", callback_data=pack(Op.EDIT_PRODUCT_NAME, product_id))],
+        [InlineKeyboardButton(text="🗑 Delete product", callback_data=pack(Op.DELETE_PRODUCT, product_id))],
+        [InlineKeyboardButton(text="◀️ Back to list", callback_data=pack(Op.SAVED_PRODUCTS))],
+        [InlineKeyboardButton(text="🏠 Main menu", callback_data=pack(Op.MAIN_MENU))]
     ])
 
     await safe_edit_or_send(callback, text, reply_markup=keyboard)
 
-@saved_data_router.callback_query(F.data.startswith("edit_product_name_"))
-async def edit_product_name_start(callback: CallbackQuery, state: FSMContext):
+@callback_dispatcher.handler(Op.EDIT_PRODUCT_NAME)
+async def edit_product_name_start(callback: CallbackQuery, state: FSMContext, db: AsyncDatabaseManager, product_id: int):
     await callback.answer()
-    product_id = int(callback.data.split("_")[3])
 
-    with DatabaseManager() as db:
-        product = db.get_product_by_id(product_id)
+    product = await db.get_product_by_id(product_id)
 
-        if not product:
-            await callback.answer("❌ Product not found!", show_alert=True)
-            return
+    if not product:
+        await callback.answer("❌ Product not found!", show_alert=True)
+        return
 
-        product_name = product.name
+    product_name = product.name
 
     await state.update_data(
         editing_product_id=product_id,
@@ -288,27 +237,25 @@ async def edit_product_name_start(callback: CallbackQuery, state: FSMContext):
         callback,
         text,
         reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="❌ Cancel", callback_data=f"view_saved_product_{product_id}")]
+            [InlineKeyboardButton(text="❌ Cancel", callback_data=pack(Op.VIEW_SAVED_PRODUCT, product_id))]
         ])
     )
 
     await state.set_state(ProductEditStates.waiting_for_new_name)
 
-@saved_data_router.callback_query(F.data.startswith("delete_product_confirm_"))
-async def delete_product_confirmation(callback: CallbackQuery):
+@callback_dispatcher.handler(Op.DELETE_PRODUCT)
+async def delete_product_confirmation(callback: CallbackQuery, db: AsyncDatabaseManager, product_id: int):
     await callback.answer()
-    product_id = int(callback.data.split("_")[3])
 
-    with DatabaseManager() as db:
-        product = db.get_product_by_id(product_id)
+    product = await db.get_product_by_id(product_id)
 
-        if not product:
-            await callback.answer("❌ Product not found!", show_alert=True)
-            return
+    if not product:
+        await callback.answer("❌ Product not found!", show_alert=True)
+        return
 
-        product_name = product.name
-        category_name = product.category.name
-        recipes_count = db.count_recipes_with_product(product_id)
+    product_name = product.name
+    category_name = product.category.name
+    recipes_count = await db.count_recipes_with_product(product_id)
 
     text = f"🗑 Deleting product\n\n"
     text += f"📦 Product: {product_name}\n"
@@ -323,15 +270,15 @@ async def delete_product_confirmation(callback: CallbackQuery):
 
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
         [
-            InlineKeyboardButton(text="✅ Yes, delete", callback_data=f"confirm_delete_saved_product_{product_id}"),
-            InlineKeyboardButton(text="❌ Cancel", callback_data=f"view_saved_product_{product_id}")
+            InlineKeyboardButton(text="✅ Yes, delete", callback_data=pack(Op.CONFIRM_DELETE_SAVED_PRODUCT, product_id)),
+            InlineKeyboardButton(text="❌ Cancel", callback_data=pack(Op.VIEW_SAVED_PRODUCT, product_id))
         ]
     ])
 
     await safe_edit_or_send(callback, text, reply_markup=keyboard)
 
 @saved_data_router.message(ProductEditStates.waiting_for_new_name)
-async def handle_new_product_name(message: Message, state: FSMContext):
+async def handle_new_product_name(message: Message, state: FSMContext, db: AsyncDatabaseManager):
     await safe_delete_message(message)
 
     data = await state.get_data()
@@ -345,8 +292,7 @@ async def handle_new_product_name(message: Message, state: FSMContext):
     if len(new_name) < 2:
         return
 
-    with DatabaseManager() as db:
-        success = db.update_product_name(product_id, new_name)
+    success = await db.update_product_name(product_id, new_name)
 
     if success:
         success = await update_main_message(
@@ -356,7 +302,7 @@ async def handle_new_product_name(message: Message, state: FSMContext):
             f"✅ Product name successfully changed!\n\n"
             f"📦 New name: {new_name}",
             reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="📋 Return to product", callback_data=f"view_saved_product_{product_id}")]
+                [InlineKeyboardButton(text="📋 Return to product", callback_data=pack(Op.VIEW_SAVED_PRODUCT, product_id))]
             ])
         )
 
@@ -365,7 +311,7 @@ async def handle_new_product_name(message: Message, state: FSMContext):
                 f"✅ Product name successfully changed!\n\n"
                 f"📦 New name: {new_name}",
                 reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                    [InlineKeyboardButton(text="📋 Return to product", callback_data=f"view_saved_product_{product_id}")]
+                    [InlineKeyboardButton(text="📋 Return to product", callback_data=pack(Op.VIEW_SAVED_PRODUCT, product_id))]
                 ])
             )
     else:
@@ -373,21 +319,19 @@ async def handle_new_product_name(message: Message, state: FSMContext):
 
     await state.clear()
 
-@saved_data_router.callback_query(F.data.startswith("confirm_delete_saved_product_"))
-async def confirm_delete_saved_product(callback: CallbackQuery):
+@callback_dispatcher.handler(Op.CONFIRM_DELETE_SAVED_PRODUCT)
+async def confirm_delete_saved_product(callback: CallbackQuery, db: AsyncDatabaseManager, product_id: int):
     await callback.answer()
-    product_id = int(callback.data.split("_")[4])
 
-    with DatabaseManager() as db:
-        product = db.get_product_by_id(product_id)
+    product = await db.get_product_by_id(product_id)
 
-        if not product:
-            await callback.answer("❌ Product not found!", show_alert=True)
-            return
+    if not product:
+        await callback.answer("❌ Product not found!", show_alert=True)
+        return
 
-        product_name = product.name
-        recipes_count = db.count_recipes_with_product(product_id)
-        success = db.delete_product(product_id)
+    product_name = product.name
+    recipes_count = await db.count_recipes_with_product(product_id)
+    success = await db.delete_product(product_id)
 
     if success:
         message = f"✅ Product '{product_name}' successfully deleted!"
@@ -398,32 +342,30 @@ async def confirm_delete_saved_product(callback: CallbackQuery):
             callback,
             message,
             reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="◀️ Back to products", callback_data="saved_products")],
-                [InlineKeyboardButton(text="🏠 Main menu", callback_data="main_menu")]
+                [InlineKeyboardButton(text="◀️ Back to products", callback_data=pack(Op.SAVED_PRODUCTS))],
+                [InlineKeyboardButton(text="🏠 Main menu", callback_data=pack(Op.MAIN_MENU))]
             ])
         )
     else:
         await callback.answer("❌ Error deleting product!", show_alert=True)
 
-@saved_data_router.callback_query(F.data == "saved_categories")
-async def saved_categories_callback(callback: CallbackQuery):
+@callback_dispatcher.handler(Op.SAVED_CATEGORIES)
+async def saved_categories_callback(callback: CallbackQuery, db: AsyncDatabaseManager):
     await callback.answer()
 
-    with DatabaseManager() as db:
-        categories = db.get_categories()
+    categories = await db.get_categories_with_product_counts()
 
     text = f"📦 Saved categories ({len(categories)} items)\n\n"
 
-    for category in categories:
-        products_count = db.count_products_in_category(category.id)
+    for category, products_count in categories:
         text += f"{category.order}. {category.name} ({products_count} products)\n"
 
     text += "\nUse standard category menu for category management."
 
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="⚙️ Manage categories", callback_data="categories_menu")],
-        [InlineKeyboardButton(text="◀️ Back", callback_data="saved_menu")],
-        [InlineKeyboardButton(text="🏠 Main menu", callback_data="main_menu")]
+        [InlineKeyboardButton(text="⚙️ Manage categories", callback_data=pack(Op.CATEGORIES_MENU))],
+        [InlineKeyboardButton(text="◀️ Back", callback_data=pack(Op.SAVED_MENU))],
+        [InlineKeyboardButton(text="🏠 Main menu", callback_data=pack(Op.MAIN_MENU))]
     ])
 
     await safe_edit_or_send(callback, text, reply_markup=keyboard)
@@ -0,0 +1,123 @@
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+
+from callbacks import Op, pack
+from models import ShoppingListItem
+
+LIST_HEADER = "🛒 Shopping list:\n\n"
+CREATED_HEADER = "✅ Shopping list created!\n\n🛒 Your list:\n\n"
+
+class ShoppingListRenderer:
+    """Turns shopping list items and temp products into message text and keyboard.
+
+    Items are grouped by category. For every list the rendered text and
+    keyboard rows of each category block are cached together with a signature
+    of the items they were built from, so toggling one item re-renders only
+    the block it belongs to.
+    """
+
+    def __init__(self, max_lists: int = 1000):
+        self.max_lists = max_lists
+        self.blocks_reused = 0
+        self.blocks_rendered = 0
+        self._lists: "OrderedDict[str, Dict[str, tuple]]" = OrderedDict()
+
+    def render(self, list_key: str, shopping_items: List[ShoppingListItem], temp_products: List[dict],
+               header: str = LIST_HEADER, show_status: bool = True,
+               with_temp_keyboard: Optional[bool] = None) -> Tuple[str, InlineKeyboardMarkup]:
+        """Renders the list, reusing cached category blocks whose items did not change."""
+        if with_temp_keyboard is None:
+            with_temp_keyboard = bool(temp_products)
+
+        cached_blocks = self._lists.pop(list_key, {})
+        blocks = {}
+        text_parts = [header]
+        item_rows = []
+        temp_rows = []
+
+        for category_name, entries in _group_by_category(shopping_items, temp_products).items():
+            signature = (show_status, tuple(entries))
+            block = cached_blocks.get(category_name)
+
+            if block is None or block[0] != signature:
+                block = (signature, *_render_block(category_name, entries, show_status))
+                self.blocks_rendered += 1
+            else:
+                self.blocks_reused += 1
+
+            blocks[category_name] = block
+            text_parts.append(block[1])
+            item_rows.extend(block[2])
+            temp_rows.extend(block[3])
+
+        self._lists[list_key] = blocks
+        while len(self._lists) > self.max_lists:
+            self._lists.popitem(last=False)
+
+        rows = item_rows + temp_rows
+        if with_temp_keyboard:
+            if rows:
+                rows.append([
+                    InlineKeyboardButton(text="🍽️ Add recipe", callback_data=pack(Op.RECIPES_FOR_LIST)),
+                    InlineKeyboardButton(text="🛍️ Add products", callback_data=pack(Op.ADD_TEMP_PRODUCTS))
+                ])
+                rows.append([InlineKeyboardButton(text="🏁 Finish shopping", callback_data=pack(Op.FINISH_SHOPPING))])
+        elif item_rows:
+            rows.append([InlineKeyboardButton(text="🛍️ Add products", callback_data=pack(Op.ADD_TEMP_PRODUCTS))])
+            rows.append([InlineKeyboardButton(text="🏁 Finish shopping", callback_data=pack(Op.FINISH_SHOPPING))])
+        rows.append([InlineKeyboardButton(text="🏠 Main menu", callback_data=pack(Op.MAIN_MENU))])
+
+        return "".join(text_parts), InlineKeyboardMarkup(inline_keyboard=rows)
+
+    def forget(self, list_key: str):
+        """Drops cached blocks of a list."""
+        self._lists.pop(list_key, None)
+
+def _group_by_category(shopping_items: List[ShoppingListItem], temp_products: List[dict]) -> Dict[str, list]:
+    """Groups items by category as plain tuples: (is_temp, id, name, quantity, unit, is_bought)."""
+    categories = {}
+
+    for item in shopping_items:
+        categories.setdefault(item.product.category.name, []).append(
+            (False, item.id, item.product.name, item.quantity, item.unit, item.is_bought)
+        )
+
+    for temp_product in temp_products:
+        categories.setdefault(temp_product['category'], []).append(
+            (True, temp_product['temp_id'], temp_product['name'], temp_product['quantity'],
+             temp_product['unit'], temp_product['is_bought'])
+        )
+
+    return categories
+
+def _render_block(category_name: str, entries: list, show_status: bool) -> Tuple[str, list, list]:
+    """Renders text and keyboard rows of one category block."""
+    lines = [f"📦 {category_name}:\n"]
+    item_rows = []
+    temp_rows = []
+
+    for is_temp, entry_id, name, quantity, unit, is_bought in entries:
+        status = "✅" if is_bought else "⭕"
+        marker = " 🛍️" if is_temp else ""
+        prefix = status if show_status else "•"
+        lines.append(f"{prefix} {name} - {quantity} {unit}{marker}\n")
+
+        if is_temp:
+            temp_rows.append([
+                InlineKeyboardButton(text=f"{status} {name} ({quantity} {unit}){marker}",
+                                     callback_data=pack(Op.TOGGLE_TEMP, entry_id)),
+                InlineKeyboardButton(text="🗑", callback_data=pack(Op.DELETE_LIST_TEMP, entry_id))
+            ])
+        else:
+            item_rows.append([
+                InlineKeyboardButton(text=f"{status} {name} ({quantity} {unit})",
+                                     callback_data=pack(Op.TOGGLE_ITEM, entry_id)),
+                InlineKeyboardButton(text="🗑", callback_data=pack(Op.DELETE_ITEM, entry_id))
+            ])
+
+    lines.append("\n")
+    return "".join(lines), item_rows, temp_rows
+
+shopping_list_renderer = ShoppingListRenderer()
@@ -0,0 +1,168 @@
+import asyncio
+import multiprocessing
+import queue
+import signal
+from typing import List, Optional
+
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.types import Update
+
+from config import config
+from update_queue import UpdateQueue, sender_id
+from webhook import WebhookServer, set_webhook, wait_for_stop_signal
+
+POLL_TIMEOUT = 30
+RESTART_CHECK_SECONDS = 1.0
+
+class Shard:
+    """Part of the users handled by one worker process: those whose id % count == index."""
+
+    def __init__(self, index: int, count: int):
+        self.index = index
+        self.count = count
+
+    def owns(self, user_id: str) -> bool:
+        """Checks if the user's updates are routed to this worker."""
+        return user_id.isdigit() and int(user_id) % self.count == self.index
+
+class Supervisor:
+    """Receives updates and routes them to worker processes by sender.
+
+    Every worker runs the whole bot (see main.run_bot) and gets the updates
+    of its shard of users through a process queue, so a user's updates are
+    always handled by the same process, in order. The processes share the
+    database: FSM states and temporary products are stored there, and the
+    in-memory caches in front of them only hold a worker's own users.
+    Workers that exit are started again.
+    """
+
+    def __init__(self, workers: int = config.WORKERS, queue_size: int = config.UPDATE_QUEUE_SIZE):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.routed = [0] * workers
+        self.restarts = 0
+        self._context = multiprocessing.get_context("spawn")
+        self._queues = [self._context.Queue(maxsize=queue_size) for _ in range(workers)]
+        self._processes: List[Optional[multiprocessing.Process]] = [None] * workers
+        self._stopping = False
+
+    def start(self):
+        """Starts all worker processes."""
+        for index in range(self.workers):
+            self._start_worker(index)
+
+    async def stop(self):
+        """Lets workers finish queued updates and waits for them to exit."""
+        self._stopping = True
+        loop = asyncio.get_running_loop()
+        for index, updates in enumerate(self._queues):
+            await loop.run_in_executor(None, updates.put, None)
+        for process in self._processes:
+            await loop.run_in_executor(None, process.join)
+
+    def put_nowait(self, update: Update):
+        """Routes an update, raises asyncio.QueueFull if its worker is behind."""
+        index = self._shard_of(update)
+        try:
+            self._queues[index].put_nowait(_serialize(update))
+        except queue.Full:
+            raise asyncio.QueueFull
+        self.routed[index] += 1
+
+    async def put(self, update: Update):
+        """Routes an update, waiting while its worker is behind."""
+        index = self._shard_of(update)
+        await asyncio.get_running_loop().run_in_executor(None, self._queues[index].put, _serialize(update))
+        self.routed[index] += 1
+
+    async def watch(self):
+        """Restarts workers that exited, until stop is called."""
+        while not self._stopping:
+            await asyncio.sleep(RESTART_CHECK_SECONDS)
+            for index, process in enumerate(self._processes):
+                if not self._stopping and not process.is_alive():
+                    print(f"⚠️ Worker {index} exited with code {process.exitcode}, restarting")
+                    self.restarts += 1
+                    self._start_worker(index)
+
+    def _shard_of(self, update: Update) -> int:
+        return sender_id(update) % self.workers
+
+    def _start_worker(self, index: int):
+        process = self._context.Process(target=worker_main, args=(index, self.workers, self._queues[index]),
+                                        name=f"bot-worker-{index}")
+        process.start()
+        self._processes[index] = process
+
+    def get_stats(self) -> dict:
+        """Gets routing counters."""
+        return {'routed': list(self.routed), 'restarts': self.restarts}
+
+def _serialize(update: Update) -> str:
+    return update.model_dump_json(exclude_unset=True)
+
+async def poll(bot: Bot, supervisor: Supervisor, allowed_updates: list):
+    """Long-polls Telegram and routes every update."""
+    offset = None
+    while True:
+        try:
+            updates = await bot.get_updates(offset=offset, timeout=POLL_TIMEOUT, allowed_updates=allowed_updates)
+        except Exception as e:
+            print(f"Failed to get updates: {e}")
+            await asyncio.sleep(1)
+            continue
+        for update in updates:
+            await supervisor.put(update)
+            offset = update.update_id + 1
+
+async def run_supervisor(allowed_updates: list):
+    """Runs WORKERS worker processes and feeds them updates until SIGINT or SIGTERM."""
+    session = AiohttpSession(api=TelegramAPIServer.from_base(config.TELEGRAM_API_URL)) if config.TELEGRAM_API_URL else None
+    bot = Bot(token=config.BOT_TOKEN, session=session)
+    supervisor = Supervisor()
+    supervisor.start()
+    watcher = asyncio.create_task(supervisor.watch())
+    print(f"👷 Started {supervisor.workers} worker processes")
+
+    server = None
+    receiver = None
+    if config.BOT_MODE == "webhook":
+        server = WebhookServer(bot, supervisor)
+        await server.start()
+        await set_webhook(bot, allowed_updates)
+    else:
+        receiver = asyncio.create_task(poll(bot, supervisor, allowed_updates))
+
+    try:
+        await wait_for_stop_signal()
+    finally:
+        if receiver is not None:
+            receiver.cancel()
+        if server is not None:
+            await server.stop()
+        await supervisor.stop()
+        watcher.cancel()
+        print(f"👷 Supervisor: {supervisor.get_stats()}")
+        await bot.session.close()
+
+def worker_main(index: int, workers: int, updates):
+    """Entry point of a worker process: runs the bot on updates from the supervisor."""
+    # Ctrl+C reaches the whole process group; workers stop when the supervisor says so.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    from main import run_bot
+
+    async def receive(bot: Bot, dp):
+        queued = UpdateQueue(bot, dp)
+        queued.start()
+        loop = asyncio.get_running_loop()
+        while True:
+            data = await loop.run_in_executor(None, updates.get)
+            if data is None:
+                break
+            await queued.put(Update.model_validate_json(data, context={"bot": bot}))
+        await queued.stop()
+        print(f"👷 Worker {index}: {queued.get_stats()}")
+
+    asyncio.run(run_bot(receive, shard=Shard(index, workers)))
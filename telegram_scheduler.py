@@ -0,0 +1,203 @@
+import asyncio
+import bisect
+import itertools
+import time
+from typing import Dict, List, Optional, Tuple
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import (AnswerCallbackQuery, DeleteMessage, EditMessageReplyMarkup, EditMessageText,
+                             SendMessage, TelegramMethod)
+
+from config import config
+
+# Lower runs first: a pressed button waits for its answer, edits can wait.
+PRIORITIES = {
+    AnswerCallbackQuery: 0,
+    SendMessage: 1,
+    EditMessageText: 2,
+    EditMessageReplyMarkup: 2,
+    DeleteMessage: 3,
+}
+DEFAULT_PRIORITY = 2
+
+class TokenBucket:
+    """Allows rate events per second on average, with bursts of up to burst events."""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def ready_at(self, now: float) -> float:
+        """Gets the moment the next event is allowed."""
+        self._refill(now)
+        ready = now if self.tokens >= 1 else now + (1 - self.tokens) / self.rate
+        return max(ready, self.paused_until)
+
+    def take(self, now: float):
+        """Spends one event."""
+        self._refill(now)
+        self.tokens -= 1
+
+    def pause(self, until: float):
+        """Allows no events until the given moment."""
+        self.paused_until = max(self.paused_until, until)
+
+    def is_idle(self, now: float) -> bool:
+        """Checks if the bucket is full and not paused, i.e. carries no state."""
+        self._refill(now)
+        return self.tokens >= self.burst and self.paused_until <= now
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+class RequestScheduler(BaseRequestMiddleware):
+    """Bot session middleware that keeps outgoing calls within Telegram limits.
+
+    Calls addressed to a chat, and callback answers, wait in one queue
+    ordered by priority (see PRIORITIES) and arrival. A call is sent when
+    both the global bucket (global_rate per second) and its chat's bucket
+    (chat_rate per second, bursts of chat_burst) allow it, so a busy chat
+    doesn't hold back calls to other chats. On RetryAfter the chat, or the
+    whole bot for calls without a chat, is paused for the time Telegram
+    asked for, and the call is queued again up to max_retries times.
+    Other calls (getUpdates, getMe, ...) are sent right away.
+    """
+
+    def __init__(self, global_rate: float = config.TG_GLOBAL_RATE, chat_rate: float = config.TG_CHAT_RATE,
+                 chat_burst: float = config.TG_CHAT_BURST, max_retries: int = config.TG_MAX_RETRIES,
+                 max_chats: int = 10000):
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.max_chats = max_chats
+        self.requests = 0
+        self.delayed = 0
+        self.retries = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.max_queue = 0
+        self._global = TokenBucket(global_rate, global_rate)
+        self._chats: Dict[int, TokenBucket] = {}
+        self._queue: List[Tuple[int, int, Optional[int], asyncio.Future]] = []
+        self._sequence = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def __call__(self, make_request, bot, method: TelegramMethod):
+        chat_id = getattr(method, 'chat_id', None)
+        if chat_id is None and not isinstance(method, AnswerCallbackQuery):
+            return await make_request(bot, method)
+
+        priority = PRIORITIES.get(type(method), DEFAULT_PRIORITY)
+        for attempt in range(self.max_retries + 1):
+            await self._acquire(priority, chat_id)
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                self.retries += 1
+                bucket = self._chat_bucket(chat_id) if chat_id is not None else self._global
+                bucket.pause(time.monotonic() + e.retry_after)
+                if attempt == self.max_retries:
+                    raise
+
+    def set_global_rate(self, rate: float):
+        """Changes the global budget, e.g. to a share of it in one of several processes."""
+        self._global = TokenBucket(rate, rate)
+
+    async def close(self):
+        """Stops the scheduling loop, failing calls still waiting in the queue."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for _, _, _, future in self._queue:
+            future.cancel()
+        self._queue.clear()
+
+    async def _acquire(self, priority: int, chat_id: Optional[int]):
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+        future = asyncio.get_running_loop().create_future()
+        bisect.insort(self._queue, (priority, next(self._sequence), chat_id, future))
+        self.requests += 1
+        self.max_queue = max(self.max_queue, len(self._queue))
+        self._wakeup.set()
+
+        queued_at = time.monotonic()
+        await future
+        waited = time.monotonic() - queued_at
+        self.total_wait += waited
+        self.max_wait = max(self.max_wait, waited)
+        if waited > 0.001:
+            self.delayed += 1
+
+    async def _run(self):
+        while True:
+            delay = self._grant()
+            self._wakeup.clear()
+            if delay is None:
+                await self._wakeup.wait()
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+    def _grant(self) -> Optional[float]:
+        """Releases every call allowed now, returns seconds until the next one may be, None if idle."""
+        while self._queue:
+            now = time.monotonic()
+            global_ready = self._global.ready_at(now)
+            if global_ready > now:
+                return global_ready - now
+
+            next_ready = None
+            for index, (_, _, chat_id, future) in enumerate(self._queue):
+                if future.done():
+                    continue
+                bucket = self._chat_bucket(chat_id) if chat_id is not None else None
+                ready = bucket.ready_at(now) if bucket is not None else now
+                if ready <= now:
+                    del self._queue[index]
+                    self._global.take(now)
+                    if bucket is not None:
+                        bucket.take(now)
+                    future.set_result(None)
+                    break
+                next_ready = ready if next_ready is None else min(next_ready, ready)
+            else:
+                self._queue = [entry for entry in self._queue if not entry[3].done()]
+                return None if next_ready is None else next_ready - now
+        return None
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= self.max_chats:
+                now = time.monotonic()
+                self._chats = {key: value for key, value in self._chats.items() if not value.is_idle(now)}
+            bucket = self._chats[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        return bucket
+
+    def get_stats(self) -> dict:
+        """Gets scheduling counters."""
+        return {
+            'requests': self.requests,
+            'delayed': self.delayed,
+            'retries': self.retries,
+            'avg_wait_ms': round(self.total_wait / self.requests * 1000, 1) if self.requests else 0,
+            'max_wait_ms': round(self.max_wait * 1000, 1),
+            'max_queue': self.max_queue,
+        }
+
+request_scheduler = RequestScheduler()
@@ -0,0 +1,189 @@
+import asyncio
+import secrets
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import bindparam, select, delete, insert, update
+
+from config import config
+from database import AsyncSessionLocal
+from models import TempProduct
+
+PRODUCT_FIELDS = ('temp_id', 'name', 'quantity', 'unit', 'category', 'is_bought')
+TEMP_ID_BYTES = 8
+
+def new_temp_id() -> str:
+    """Gets a random hex temp_id, short enough to keep callback data small."""
+    return secrets.token_hex(TEMP_ID_BYTES)
+
+class TempProductStore:
+    """Extra shopping list products of every user, indexed by temp_id.
+
+    Products live in memory, one ordered dict per user, so lookups by
+    temp_id don't scan the list. Changes are written to the temp_products
+    table in the background every flush_interval seconds; users whose
+    products were only read get just their updated_at moved forward. Users
+    untouched for longer than ttl are dropped from memory and from the table.
+    """
+
+    def __init__(self, session_factory=AsyncSessionLocal, max_per_user: int = config.TEMP_PRODUCTS_PER_USER,
+                 ttl: timedelta = timedelta(hours=config.TEMP_PRODUCTS_TTL_HOURS),
+                 flush_interval: float = config.TEMP_PRODUCTS_FLUSH_SECONDS):
+        self.session_factory = session_factory
+        self.max_per_user = max_per_user
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self._products: Dict[str, "OrderedDict[str, dict]"] = {}
+        self._touched: Dict[str, datetime] = {}
+        self._dirty = set()
+        self._read = set()
+        self._task: Optional[asyncio.Task] = None
+
+    def get_all(self, user_id: str) -> List[dict]:
+        """Gets user's products in the order they were added."""
+        products = self._products.get(user_id)
+        if not products:
+            return []
+        self._touched[user_id] = datetime.utcnow()
+        self._read.add(user_id)
+        return list(products.values())
+
+    def get(self, user_id: str, temp_id: str) -> Optional[dict]:
+        """Gets one product by temp_id."""
+        return self._products.get(user_id, {}).get(temp_id)
+
+    def add(self, user_id: str, product: dict) -> bool:
+        """Adds a product, returns False if the user reached the limit."""
+        products = self._products.setdefault(user_id, OrderedDict())
+        if product['temp_id'] not in products and len(products) >= self.max_per_user:
+            return False
+        products[product['temp_id']] = product
+        self._changed(user_id)
+        return True
+
+    def toggle(self, user_id: str, temp_id: str) -> bool:
+        """Toggles bought status, returns False if the product is not found."""
+        product = self.get(user_id, temp_id)
+        if product is None:
+            return False
+        product['is_bought'] = not product['is_bought']
+        self._changed(user_id)
+        return True
+
+    def remove(self, user_id: str, temp_id: str) -> bool:
+        """Removes a product, returns False if it is not found."""
+        if self._products.get(user_id, {}).pop(temp_id, None) is None:
+            return False
+        self._changed(user_id)
+        return True
+
+    def replace(self, user_id: str, products: List[dict]):
+        """Replaces all user's products, keeping at most max_per_user of them."""
+        self._products[user_id] = OrderedDict(
+            (product['temp_id'], product) for product in products[:self.max_per_user]
+        )
+        self._changed(user_id)
+
+    def clear(self, user_id: str):
+        """Removes all user's products."""
+        self._products.pop(user_id, None)
+        self._touched.pop(user_id, None)
+        self._dirty.add(user_id)
+
+    async def load(self, owns: Optional[Callable[[str], bool]] = None):
+        """Loads products saved before restart, dropping expired ones.
+
+        A worker process passes owns to load only users it handles, so it
+        never evicts or overwrites products of another worker's users.
+        """
+        cutoff = datetime.utcnow() - self.ttl
+        async with self.session_factory() as session:
+            rows = (await session.execute(
+                select(TempProduct).order_by(TempProduct.user_id, TempProduct.position)
+            )).scalars().all()
+            rows = [row for row in rows if owns is None or owns(row.user_id)]
+            expired = {row.user_id for row in rows if row.updated_at < cutoff}
+            if expired:
+                await session.execute(delete(TempProduct).where(TempProduct.user_id.in_(expired),
+                                                                TempProduct.updated_at < cutoff))
+                await session.commit()
+
+        for row in rows:
+            if row.updated_at < cutoff:
+                continue
+            products = self._products.setdefault(row.user_id, OrderedDict())
+            products[row.temp_id] = {field: getattr(row, field) for field in PRODUCT_FIELDS}
+            self._touched[row.user_id] = max(self._touched.get(row.user_id, row.updated_at), row.updated_at)
+
+    def start(self):
+        """Starts the background flush loop."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def close(self):
+        """Stops the flush loop and writes pending changes."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def evict_idle(self) -> int:
+        """Drops users idle for longer than ttl, returns number of dropped users."""
+        cutoff = datetime.utcnow() - self.ttl
+        idle = [user_id for user_id, touched in self._touched.items() if touched < cutoff]
+        for user_id in idle:
+            self.clear(user_id)
+        return len(idle)
+
+    async def flush(self):
+        """Writes products of changed users and touch times of read ones in one transaction."""
+        if not self._dirty and not self._read:
+            return
+
+        dirty, self._dirty = self._dirty, set()
+        read, self._read = self._read - dirty, set()
+        touches = [{'touched_user_id': user_id, 'touched_at': self._touched[user_id]}
+                   for user_id in read if user_id in self._touched]
+        rows = []
+        for user_id in dirty:
+            updated_at = self._touched.get(user_id, datetime.utcnow())
+            for position, product in enumerate(self._products.get(user_id, {}).values()):
+                rows.append({**{field: product[field] for field in PRODUCT_FIELDS},
+                             'user_id': user_id, 'position': position, 'updated_at': updated_at})
+
+        try:
+            async with self.session_factory() as session:
+                if dirty:
+                    await session.execute(delete(TempProduct).where(TempProduct.user_id.in_(dirty)))
+                if rows:
+                    await session.execute(insert(TempProduct), rows)
+                if touches:
+                    # Core table, so the executemany isn't taken for an ORM update by primary key.
+                    await session.execute(
+                        update(TempProduct.__table__)
+                        .where(TempProduct.__table__.c.user_id == bindparam('touched_user_id'))
+                        .values(updated_at=bindparam('touched_at')),
+                        touches
+                    )
+                await session.commit()
+        except Exception as e:
+            self._dirty |= dirty
+            self._read |= read
+            print(f"Failed to save temporary products: {e}")
+
+    def _changed(self, user_id: str):
+        self._touched[user_id] = datetime.utcnow()
+        self._dirty.add(user_id)
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            self.evict_idle()
+            await self.flush()
+
+temp_product_store = TempProductStore()
@@ -0,0 +1,202 @@
+import asyncio
+import contextvars
+from typing import Dict, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery, TelegramObject
+
+from callbacks import Op
+from config import config
+from database import AsyncDatabaseManager
+from db_executor import db_executor
+from messaging import safe_edit_or_send
+from shopping_list_renderer import shopping_list_renderer
+from temp_product_store import temp_product_store
+
+TOGGLE_OPS = (Op.TOGGLE_ITEM, Op.TOGGLE_TEMP)
+# Windows a batch is written in before its toggles are given up.
+MAX_FLUSH_ATTEMPTS = 3
+
+class PendingToggles:
+    """Toggles of one chat waiting for the end of its window."""
+
+    def __init__(self, user_id: str):
+        self.user_id = user_id
+        # Latest callback of every list message tapped in the window, by message id.
+        self.callbacks: Dict[int, CallbackQuery] = {}
+        self.item_ids = set()
+        self.received = 0
+        self.attempts = 0
+        self.task: Optional[asyncio.Task] = None
+
+class ToggleCoalescer(BaseMiddleware):
+    """Collects shopping list toggles of a chat and shows them with one edit.
+
+    The first toggle of a chat opens a window of window seconds. Item
+    toggles received in it are written, and the list reloaded, in one
+    executor call when it closes, and every list message tapped in the
+    window is edited once. An item toggled twice in the same window is not
+    written at all. If the write fails, the toggles go back into the chat's
+    next window, up to MAX_FLUSH_ATTEMPTS windows. Temporary products live
+    in memory, so they are toggled right away and only their edit is
+    deferred.
+
+    As a middleware, before any other update of the chat is handled, it
+    writes the pending toggles in a transaction of their own, so the
+    handler sees them and can't take them along if it fails. The deferred
+    edit is dropped because the handler renders the message itself.
+    Flushes run in a fresh context, not in the one of the update that
+    opened the window, which has finished by then.
+    """
+
+    def __init__(self, window: float = config.TOGGLE_DEBOUNCE_SECONDS):
+        self.window = window
+        self.toggles = 0
+        self.edits = 0
+        self.coalesced_edits = 0
+        self.cancelled_toggles = 0
+        self.flushed_by_updates = 0
+        self.retried_batches = 0
+        self.dropped_toggles = 0
+        self.max_batch = 0
+        self._pending: Dict[int, PendingToggles] = {}
+        self._flushing: Dict[int, asyncio.Task] = {}
+
+    async def __call__(self, handler, event: TelegramObject, data: dict):
+        chat = data.get('event_chat')
+        if chat is not None and data.get('callback_op') not in TOGGLE_OPS:
+            await self.flush(chat.id)
+        return await handler(event, data)
+
+    def add(self, callback: CallbackQuery, user_id: str, item_id: Optional[int] = None):
+        """Adds a toggle of the list shown in callback's message, item_id is None for temp products."""
+        chat_id = callback.message.chat.id
+        pending = self._pending.get(chat_id)
+        if pending is None:
+            pending = PendingToggles(user_id)
+            pending.task = asyncio.create_task(self._flush_later(chat_id, pending), context=contextvars.Context())
+            self._pending[chat_id] = pending
+
+        pending.callbacks[callback.message.message_id] = callback
+        pending.received += 1
+        self.toggles += 1
+        if item_id is not None:
+            if item_id in pending.item_ids:
+                pending.item_ids.remove(item_id)
+                self.cancelled_toggles += 2
+            else:
+                pending.item_ids.add(item_id)
+
+    async def flush(self, chat_id: int):
+        """Writes pending toggles of the chat without editing the message."""
+        flushing = self._flushing.get(chat_id)
+        if flushing is not None:
+            # The pending toggles are written after the ones being written now.
+            await flushing
+
+        pending = self._pending.pop(chat_id, None)
+        if pending is None:
+            return
+
+        pending.task.cancel()
+        self.flushed_by_updates += 1
+        if not await self._flush_batch(pending, show=False):
+            self._retry(chat_id, pending)
+
+    async def close(self):
+        """Writes and shows all pending toggles, waiting for running flushes."""
+        pending_chats, self._pending = self._pending, {}
+        for pending in pending_chats.values():
+            pending.task.cancel()
+            if not await self._flush_batch(pending):
+                self._drop(pending)
+
+        for task in list(self._flushing.values()):
+            await task
+
+    async def _flush_later(self, chat_id: int, pending: PendingToggles):
+        await asyncio.sleep(self.window)
+        if self._pending.get(chat_id) is not pending:
+            return
+        del self._pending[chat_id]
+
+        task = asyncio.current_task()
+        previous = self._flushing.get(chat_id)
+        self._flushing[chat_id] = task
+        try:
+            if previous is not None:
+                await previous
+            if not await self._flush_batch(pending):
+                self._retry(chat_id, pending)
+        finally:
+            if self._flushing.get(chat_id) is task:
+                del self._flushing[chat_id]
+
+    async def _flush_batch(self, pending: PendingToggles, show: bool = True) -> bool:
+        """Writes the toggles and, if show, edits the tapped messages; returns False if the write failed."""
+        self.max_batch = max(self.max_batch, pending.received)
+        pending.attempts += 1
+        item_ids = sorted(pending.item_ids)
+        try:
+            # Off the event loop: a flush doesn't hold up updates of other users.
+            async with AsyncDatabaseManager(executor=db_executor) as db:
+                if show:
+                    shopping_items = await db.toggle_shopping_items_and_get_list(item_ids, pending.user_id)
+                else:
+                    await db.toggle_shopping_items(item_ids, pending.user_id)
+        except Exception as e:
+            print(f"Failed to apply shopping list toggles: {e}")
+            return False
+
+        if not show:
+            self.coalesced_edits += pending.received
+            return True
+
+        temp_products = temp_product_store.get_all(pending.user_id)
+        text, keyboard = shopping_list_renderer.render(pending.user_id, shopping_items, temp_products)
+        for callback in pending.callbacks.values():
+            try:
+                await safe_edit_or_send(callback, text, reply_markup=keyboard)
+                self.edits += 1
+            except Exception as e:
+                print(f"Failed to show shopping list toggles: {e}")
+        self.coalesced_edits += pending.received - len(pending.callbacks)
+        return True
+
+    def _retry(self, chat_id: int, pending: PendingToggles):
+        """Puts toggles of a failed batch back into the chat's window."""
+        if pending.attempts >= MAX_FLUSH_ATTEMPTS:
+            self._drop(pending)
+            return
+
+        self.retried_batches += 1
+        current = self._pending.get(chat_id)
+        if current is None:
+            pending.task = asyncio.create_task(self._flush_later(chat_id, pending), context=contextvars.Context())
+            self._pending[chat_id] = pending
+            return
+
+        # Taps that came in meanwhile are newer, so their callbacks win.
+        current.item_ids ^= pending.item_ids
+        current.received += pending.received
+        current.attempts = max(current.attempts, pending.attempts)
+        current.callbacks = {**pending.callbacks, **current.callbacks}
+
+    def _drop(self, pending: PendingToggles):
+        self.dropped_toggles += len(pending.item_ids)
+        print(f"Dropped {len(pending.item_ids)} shopping list toggles of user {pending.user_id}")
+
+    def get_stats(self) -> dict:
+        """Gets toggle counters."""
+        return {
+            'toggles': self.toggles,
+            'edits': self.edits,
+            'coalesced_edits': self.coalesced_edits,
+            'cancelled_toggles': self.cancelled_toggles,
+            'flushed_by_updates': self.flushed_by_updates,
+            'retried_batches': self.retried_batches,
+            'dropped_toggles': self.dropped_toggles,
+            'max_batch': self.max_batch,
+        }
+
+toggle_coalescer = ToggleCoalescer()
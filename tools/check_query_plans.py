@@ -0,0 +1,170 @@
+"""Fails if a DatabaseManager method makes SQLite fall back to a full table scan.
+
+Every DatabaseManager method is run against a throwaway database filled with
+sample data. Each SQL statement it issues is passed through EXPLAIN QUERY PLAN,
+and any plain "SCAN <table>" step (one without an index) is reported.
+Methods that read a whole table on purpose are listed in FULL_READ_METHODS.
+
+Usage:
+    python tools/check_query_plans.py
+"""
+import os
+import sys
+import tempfile
+
+DB_PATH = os.path.join(tempfile.mkdtemp(), "check_query_plans.db")
+os.environ.setdefault("BOT_TOKEN", "0:query-plans")
+os.environ["DATABASE_URL"] = f"sqlite:///{DB_PATH}"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event
+
+from database import DatabaseManager, create_tables, engine
+
+USER_ID = "plan-check"
+
+# Methods whose purpose is to list or count a whole table.
+FULL_READ_METHODS = {
+    'get_categories',
+    'get_categories_with_product_counts',
+    'get_products',
+    'get_all_products',
+    'get_recipes',
+    'count_recipes',
+    'count_products',
+    'count_categories',
+    'create_category',
+    'get_stats',
+}
+
+def seed(db: DatabaseManager) -> dict:
+    """Fills the database with enough rows for the planner to prefer indexes."""
+    recipe_ids = []
+    for r in range(40):
+        recipe = db.create_recipe(f"Recipe {r}", f"user-{r % 5}", [
+            {'product_name': f"Product {(r + i) % 60}", 'quantity': 1 + i, 'unit': "g",
+             'category': f"Category {i % 6}"}
+            for i in range(8)
+        ])
+        recipe_ids.append(recipe.id)
+
+    for u in range(5):
+        for recipe_id in recipe_ids[u::5]:
+            db.add_selected_recipe(f"user-{u}", recipe_id)
+        db.create_shopping_list_from_selected(f"user-{u}")
+
+    db.add_selected_recipe(USER_ID, recipe_ids[0])
+    db.add_selected_recipe(USER_ID, recipe_ids[1])
+    db.create_shopping_list_from_selected(USER_ID)
+    db.add_selected_recipe(USER_ID, recipe_ids[2])
+
+    product = db.get_product_by_name("Product 1")
+    item = db.get_shopping_list(USER_ID)[0]
+    return {
+        'recipe_id': recipe_ids[0],
+        'product_id': product.id,
+        'category_id': product.category_id,
+        'item_id': item.id,
+    }
+
+def method_calls(ids: dict) -> list:
+    """Sample invocations covering every DatabaseManager method."""
+    ingredients = [{'product_name': "Product 1", 'quantity': 2, 'unit': "g", 'category': "Category 1"},
+                   {'product_name': "Plan product", 'quantity': 1, 'unit': "pcs", 'category': "Plan category"}]
+    return [
+        ('get_categories', ()),
+        ('get_category_by_name', ("Category 1",)),
+        ('get_category_by_id', (ids['category_id'],)),
+        ('get_categories_with_product_counts', ()),
+        ('create_category', ("Plan check category",)),
+        ('update_category_order', (ids['category_id'], 3)),
+        ('delete_category', (ids['category_id'],)),
+        ('count_recipes', ()),
+        ('count_products', ()),
+        ('count_categories', ()),
+        ('get_stats', ()),
+        ('count_products_in_category', (ids['category_id'],)),
+        ('get_products', ()),
+        ('get_all_products', ()),
+        ('get_product_by_name', ("Product 1",)),
+        ('get_product_by_id', (ids['product_id'],)),
+        ('create_product', ("Plan check product", ids['category_id'])),
+        ('get_or_create_product', ("Plan check product 2", "Category 2")),
+        ('count_recipes_with_product', (ids['product_id'],)),
+        ('get_recipes_with_product', (ids['product_id'],)),
+        ('get_recipes', (USER_ID,)),
+        ('get_recipe_by_id', (ids['recipe_id'],)),
+        ('create_recipe', ("Plan recipe", USER_ID, ingredients)),
+        ('update_recipe', (ids['recipe_id'], "Plan recipe renamed", ingredients)),
+        ('get_shopping_list', (USER_ID,)),
+        ('has_shopping_list', ("plan-check-empty",)),
+        ('toggle_shopping_item', (ids['item_id'], USER_ID)),
+        ('toggle_shopping_items', ([ids['item_id']], USER_ID)),
+        ('toggle_shopping_items_and_get_list', ([ids['item_id']], USER_ID)),
+        ('add_recipe_ingredients_to_shopping_list', (USER_ID, ingredients)),
+        ('get_selected_recipes', (USER_ID,)),
+        ('add_selected_recipe', (USER_ID, ids['recipe_id'])),
+        ('remove_selected_recipe', (USER_ID, ids['recipe_id'])),
+        ('create_shopping_list_from_selected', (USER_ID,)),
+        ('update_product_name', (ids['product_id'], "Product 1 renamed")),
+        ('delete_shopping_item', (ids['item_id'], USER_ID)),
+        ('clear_selected_recipes', (USER_ID,)),
+        ('clear_shopping_list', (USER_ID,)),
+        ('delete_recipe', (ids['recipe_id'],)),
+        ('delete_product', (ids['product_id'],)),
+    ]
+
+def full_scans(connection, statement: str, parameters) -> list:
+    """Returns plan steps that scan a table without using an index."""
+    rows = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).all()
+    return [row[-1] for row in rows
+            if row[-1].startswith("SCAN ") and "USING" not in row[-1]
+            and not row[-1].startswith(("SCAN CONSTANT ROW", "SCAN anon_"))]
+
+def main() -> int:
+    create_tables()
+
+    with DatabaseManager() as db:
+        ids = seed(db)
+
+    captured = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if executemany:
+            parameters = parameters[0] if parameters else ()
+        if not statement.lstrip().upper().startswith(("EXPLAIN", "PRAGMA", "BEGIN", "SAVEPOINT", "RELEASE", "ROLLBACK")):
+            captured.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", capture)
+
+    failures = []
+    checked = 0
+    with DatabaseManager() as db, engine.connect() as plan_connection:
+        for name, args in method_calls(ids):
+            captured.clear()
+            getattr(db, name)(*args)
+            statements = list(captured)
+            checked += len(statements)
+
+            if name in FULL_READ_METHODS:
+                continue
+
+            for statement, parameters in statements:
+                for step in full_scans(plan_connection, statement, parameters):
+                    failures.append((name, step, " ".join(statement.split())))
+
+    event.remove(engine, "before_cursor_execute", capture)
+
+    for name, step, statement in failures:
+        print(f"FAIL {name}: {step}\n     {statement}\n")
+
+    methods = {name for name in dir(DatabaseManager) if not name.startswith('_')}
+    missing = methods - {name for name, _ in method_calls(ids)}
+    if missing:
+        print(f"FAIL methods without a sample call: {', '.join(sorted(missing))}")
+
+    print(f"{checked} statements checked, {len(failures)} full scans")
+    return 1 if failures or missing else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,271 @@
+"""Fails if a main flow of the bot runs the same SQL statement in a loop.
+
+Every main flow (start, recipe creation and editing, composing a menu,
+the shopping list, additional products, saved data, categories, finishing
+shopping) is fed to the dispatcher of main.create_dispatcher as scripted
+messages and button taps, with DB_REPEATED_QUERIES=fail. An update that
+runs one statement more than the limit times (per-ingredient lookups and
+the like) raises RepeatedQueryError and is reported. The database is a
+temporary one, seeded with recipes of many ingredients so that loops stand
+out; Telegram is the local fake Bot API (tools/fake_telegram.py).
+
+Usage:
+    python tools/check_repeated_queries.py [limit]
+"""
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+
+WORK_DIR = tempfile.mkdtemp()
+os.environ.setdefault("BOT_TOKEN", "0:fake-telegram")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(WORK_DIR, 'flows.db')}"
+os.environ["ASYNC_DATABASE_URL"] = f"sqlite+aiosqlite:///{os.path.join(WORK_DIR, 'flows.db')}"
+os.environ["DB_REPEATED_QUERIES"] = "fail"
+os.environ["TOGGLE_DEBOUNCE_SECONDS"] = "0.05"
+if len(sys.argv) > 1:
+    os.environ["DB_REPEATED_QUERY_LIMIT"] = sys.argv[1]
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiogram import Bot
+from aiogram.dispatcher.event.bases import UNHANDLED
+from aiogram.types import Update
+
+from callbacks import Op, pack
+from config import config
+from database import DatabaseManager, async_engine, create_tables
+from db_executor import db_executor
+from db_middleware import commit_before_request
+from fake_telegram import FakeTelegram
+from fsm_storage import DatabaseStorage
+from main import create_dispatcher
+from models import Category, Product, Recipe, ShoppingListItem
+from repeated_queries import RepeatedQueriesMiddleware
+from temp_product_store import temp_product_store
+from toggle_coalescer import toggle_coalescer
+
+USER_ID = 4242
+
+SEED_RECIPE = "Borscht"
+SEED_INGREDIENTS = [
+    ("Beet", 2, "pcs", "Vegetables"),
+    ("Potato", 4, "pcs", "Vegetables"),
+    ("Cabbage", 300, "g", "Vegetables"),
+    ("Carrot", 1, "pcs", "Vegetables"),
+    ("Onion", 1, "pcs", "Vegetables"),
+    ("Beef", 500, "g", "Meat"),
+    ("Sour cream", 100, "g", "Dairy"),
+    ("Dill", 1, "tbsp", "Greens"),
+]
+
+def seed():
+    """Creates a recipe of many ingredients."""
+    with DatabaseManager() as db:
+        db.create_recipe(SEED_RECIPE, str(USER_ID), [
+            {'product_name': name, 'quantity': quantity, 'unit': unit, 'category': category}
+            for name, quantity, unit, category in SEED_INGREDIENTS
+        ])
+
+def lookup(model, name: str):
+    """Gets a function that finds the id of the named row when the step runs."""
+    def find() -> int:
+        with DatabaseManager() as db:
+            return db.session.query(model.id).filter(model.name == name).scalar()
+    return find
+
+def item(product_name: str):
+    """Gets a function that finds the shopping list item of a product when the step runs."""
+    def find() -> int:
+        with DatabaseManager() as db:
+            return (db.session.query(ShoppingListItem.id).join(Product)
+                    .filter(ShoppingListItem.user_id == str(USER_ID), Product.name == product_name)
+                    .scalar())
+    return find
+
+def temp(name: str):
+    """Gets a function that finds the id of an additional product when the step runs."""
+    def find() -> str:
+        return next(p['temp_id'] for p in temp_product_store.get_all(str(USER_ID)) if p['name'] == name)
+    return find
+
+def ingredient(name: str, quantity: str, unit: str, category: str = None, new_category: str = None) -> list:
+    """Steps that add one ingredient; a category is picked for products the bot doesn't know yet."""
+    steps = [name, quantity, (Op.UNIT, unit)]
+    if category:
+        steps.append((Op.INGREDIENT_CATEGORY, lookup(Category, category)))
+    elif new_category:
+        steps += [(Op.NEW_CATEGORY,), new_category]
+    return steps
+
+def temp_product(name: str, quantity: str, unit: str, category: str) -> list:
+    return [(Op.ADD_TEMP_PRODUCTS,), name, quantity, (Op.UNIT, unit), (Op.TEMP_CATEGORY, lookup(Category, category))]
+
+FLOWS = [
+    ("start", ["/start", (Op.MAIN_MENU,)]),
+    ("create recipe", [
+        (Op.RECIPES_MENU,), (Op.ADD_RECIPE,), "Vegetable stew",
+        *ingredient("Potato", "5", "pcs"), (Op.ADD_INGREDIENT,),
+        *ingredient("Carrot", "2", "pcs"), (Op.ADD_INGREDIENT,),
+        *ingredient("Zucchini", "1", "pcs", category="Vegetables"), (Op.ADD_INGREDIENT,),
+        *ingredient("Eggplant", "1", "pcs", category="Vegetables"), (Op.ADD_INGREDIENT,),
+        *ingredient("Paprika", "1", "tsp", new_category="Spices"), (Op.ADD_INGREDIENT,),
+        *ingredient("Olive oil", "2", "tbsp", category="Grocery"),
+        (Op.FINISH_RECIPE,),
+    ]),
+    ("edit recipe", [
+        (Op.RECIPES_MENU,), (Op.RECIPES_TO_EDIT,), (Op.EDIT_RECIPE, lookup(Recipe, SEED_RECIPE)), SEED_RECIPE,
+        (Op.ADD_INGREDIENT,), *ingredient("Garlic", "2", "pcs", category="Vegetables"),
+        (Op.FINISH_RECIPE,),
+    ]),
+    ("rewrite recipe", [
+        (Op.RECIPES_TO_EDIT,), (Op.EDIT_RECIPE, lookup(Recipe, "Vegetable stew")), "Ratatouille",
+        (Op.RESET_INGREDIENTS,),
+        *ingredient("Zucchini", "2", "pcs"), (Op.ADD_INGREDIENT,),
+        *ingredient("Eggplant", "2", "pcs"), (Op.ADD_INGREDIENT,),
+        *ingredient("Tomato", "4", "pcs", category="Vegetables"), (Op.ADD_INGREDIENT,),
+        *ingredient("Onion", "1", "pcs"), (Op.ADD_INGREDIENT,),
+        *ingredient("Thyme", "1", "tsp", category="Spices"),
+        (Op.FINISH_RECIPE,),
+    ]),
+    ("compose menu", [
+        (Op.COMPOSE_MENU,),
+        (Op.SELECT_RECIPE, lookup(Recipe, SEED_RECIPE)), (Op.SELECT_RECIPE, lookup(Recipe, SEED_RECIPE)),
+        (Op.SELECT_RECIPE, lookup(Recipe, "Ratatouille")),
+        (Op.MANAGE_SELECTED,), (Op.REMOVE_SELECTED, lookup(Recipe, SEED_RECIPE)),
+        (Op.ADD_SELECTED, lookup(Recipe, "Ratatouille")), (Op.BACK_TO_SELECTION,),
+        (Op.CLEAR_SELECTION,), (Op.SELECT_RECIPE, lookup(Recipe, SEED_RECIPE)),
+        (Op.SELECT_RECIPE, lookup(Recipe, "Ratatouille")),
+        (Op.CREATE_SHOPPING_LIST,),
+    ]),
+    ("shopping list", [
+        (Op.MAIN_MENU,), (Op.SHOPPING_MENU,),
+        (Op.TOGGLE_ITEM, item("Beet")), (Op.TOGGLE_ITEM, item("Potato")), (Op.TOGGLE_ITEM, item("Beet")),
+        (Op.DELETE_ITEM, item("Dill")),
+        (Op.RECIPES_FOR_LIST,), (Op.ADD_RECIPE_TO_LIST, lookup(Recipe, SEED_RECIPE)),
+        (Op.RECIPES_FOR_LIST,), (Op.ADD_RECIPE_TO_LIST, lookup(Recipe, "Ratatouille")),
+        (Op.BACK_TO_SHOPPING_LIST,),
+    ]),
+    ("additional products", [
+        *temp_product("Napkins", "2", "pcs", "Grocery"),
+        *temp_product("Candles", "6", "pcs", "Grocery"),
+        *temp_product("Lemon", "1", "pcs", "Vegetables"),
+        (Op.MANAGE_TEMP_PRODUCTS,), (Op.DELETE_TEMP, temp("Candles")), (Op.CONFIRM_DELETE_TEMP, temp("Candles")),
+        (Op.TOGGLE_TEMP, temp("Napkins")), (Op.DELETE_LIST_TEMP, temp("Lemon")),
+        (Op.MANAGE_TEMP_PRODUCTS,), (Op.TEMP_PRODUCTS_BACK,), (Op.CREATE_LIST_WITH_TEMP,),
+        (Op.CLEAR_TEMP_PRODUCTS,), (Op.CONFIRM_CLEAR_TEMP,),
+        (Op.ADD_TEMP_PRODUCTS,), (Op.CANCEL_TEMP_PRODUCTS,),
+    ]),
+    ("saved data", [
+        (Op.SAVED_MENU,), (Op.SAVED_RECIPES,), (Op.VIEW_RECIPE, lookup(Recipe, SEED_RECIPE)),
+        (Op.SAVED_PRODUCTS,), (Op.VIEW_SAVED_PRODUCT, lookup(Product, "Beet")),
+        (Op.EDIT_PRODUCT_NAME, lookup(Product, "Beet")), "Beetroot",
+        (Op.VIEW_SAVED_PRODUCT, lookup(Product, "Beetroot")),
+        (Op.DELETE_PRODUCT, lookup(Product, "Thyme")),
+        (Op.SAVED_CATEGORIES,),
+        (Op.DELETE_SAVED_RECIPE, lookup(Recipe, "Ratatouille")),
+    ]),
+    ("categories", [
+        (Op.CATEGORIES_MENU,), (Op.LIST_CATEGORIES,), (Op.ADD_CATEGORY,), "Snacks", (Op.REORDER_CATEGORIES,),
+    ]),
+    ("delete recipe", [
+        (Op.RECIPES_MENU,), (Op.RECIPES_TO_DELETE,), (Op.DELETE_RECIPE, lookup(Recipe, "Ratatouille")),
+        (Op.CANCEL_DELETE_RECIPE,), (Op.DELETE_RECIPE, lookup(Recipe, "Ratatouille")),
+        (Op.CONFIRM_DELETE_RECIPE, lookup(Recipe, "Ratatouille")),
+    ]),
+    ("cancel", [(Op.RECIPES_MENU,), (Op.ADD_RECIPE,), "Soup", "Water", (Op.CANCEL,)]),
+    ("finish shopping", [
+        (Op.SHOPPING_MENU,), (Op.FINISH_SHOPPING,), (Op.CANCEL_FINISH_SHOPPING,),
+        (Op.FINISH_SHOPPING,), (Op.CONFIRM_FINISH_SHOPPING,), (Op.MAIN_MENU,),
+    ]),
+]
+
+def build_update(bot: Bot, update_id: int, step) -> Update:
+    """Turns a step into an update: text is a message, a tuple a button tap of (Op, *args)."""
+    chat = {'id': USER_ID, 'type': "private"}
+    sender = {'id': USER_ID, 'is_bot': False, 'first_name': "Flows"}
+    if isinstance(step, str):
+        return Update.model_validate({
+            'update_id': update_id,
+            'message': {'message_id': 1000 + update_id, 'date': 0, 'chat': chat, 'from': sender, 'text': step},
+        }, context={'bot': bot})
+
+    op, *args = step
+    args = [arg() if callable(arg) else arg for arg in args]
+    return Update.model_validate({
+        'update_id': update_id,
+        'callback_query': {
+            'id': str(update_id),
+            'from': sender,
+            'chat_instance': str(USER_ID),
+            'data': pack(op, *args),
+            'message': {'message_id': 1, 'date': 0, 'text': "Menu", 'chat': chat},
+        },
+    }, context={'bot': bot})
+
+def describe(step) -> str:
+    return repr(step) if isinstance(step, str) else step[0].name
+
+async def run_flow(dp, bot: Bot, checker: RepeatedQueriesMiddleware, name: str, steps: list,
+                   first_update_id: int) -> list:
+    """Feeds the steps of a flow one by one, returns what went wrong."""
+    failures = []
+    checker.max_repeats = 0
+    for number, step in enumerate(steps):
+        update_id = first_update_id + number
+        try:
+            result = await dp.feed_update(bot, build_update(bot, update_id, step))
+        except Exception as e:
+            failures.append(f"{describe(step)}: {type(e).__name__}: {e}")
+            continue
+        if result is UNHANDLED:
+            failures.append(f"{describe(step)}: not handled")
+        # Lets debounced toggles write before the next step.
+        await asyncio.sleep(config.TOGGLE_DEBOUNCE_SECONDS * 2)
+
+    status = "FAILED" if failures else "ok"
+    print(f"{name:<22} {len(steps):3d} updates   most repeated statement {checker.max_repeats:3d}x   {status}")
+    for failure in failures:
+        print(f"    {failure}")
+    return failures
+
+async def main():
+    logging.getLogger().setLevel(logging.WARNING)
+    config.ALLOWED_USERS = [USER_ID]
+    create_tables()
+    seed()
+
+    fake = FakeTelegram(global_rate=100000, chat_rate=100000, chat_burst=100000, latency=0)
+    await fake.start()
+    bot = Bot(token="0:fake-telegram", session=fake.session())
+    bot.session.middleware(commit_before_request)
+    storage = DatabaseStorage()
+    await temp_product_store.load()
+    dp, _, _ = create_dispatcher(storage)
+    checker = next(m for m in dp.callback_query.middleware if isinstance(m, RepeatedQueriesMiddleware))
+
+    print(f"Main flows, same statement allowed {checker.limit} times per update, database in {WORK_DIR}\n")
+    failed_flows = 0
+    try:
+        update_id = 1
+        for name, steps in FLOWS:
+            if await run_flow(dp, bot, checker, name, steps, update_id):
+                failed_flows += 1
+            update_id += len(steps)
+    finally:
+        await toggle_coalescer.close()
+        await bot.session.close()
+        await fake.stop()
+        await storage.close()
+        await temp_product_store.close()
+        await db_executor.close()
+        await async_engine.dispose()
+
+    print(f"\n{checker.updates} updates checked, {checker.flagged} ran a statement in a loop")
+    if failed_flows:
+        print(f"\nFAILED: {failed_flows} of {len(FLOWS)} flows")
+        sys.exit(1)
+    print("\nOK")
+
+if __name__ == "__main__":
+    asyncio.run(main())
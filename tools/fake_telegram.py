@@ -0,0 +1,188 @@
+"""Local fake of the Telegram Bot API that enforces flood limits.
+
+FakeTelegram answers sendMessage, editMessageText, answerCallbackQuery,
+deleteMessage and getMe like Telegram does, and replies 429 with retry_after
+when calls exceed a global rate or the rate of one chat. Updates added with
+push_update are served to getUpdates. Point a Bot at it with
+session=fake.session() (or TELEGRAM_API_URL=fake.url) to try the bot,
+RequestScheduler or the supervisor offline.
+
+Run directly, it replays bursts of button taps from many chats (answer +
+edit per tap) through a plain session and through RequestScheduler, and
+prints how many calls hit flood limits and how long callback answers took.
+
+Usage:
+    python tools/fake_telegram.py [chats] [taps_per_chat]
+"""
+import asyncio
+import os
+import sys
+import time
+
+os.environ.setdefault("BOT_TOKEN", "0:fake-telegram")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiohttp import web
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.exceptions import TelegramRetryAfter
+
+from telegram_scheduler import RequestScheduler, TokenBucket
+
+class FakeTelegram:
+    """Bot API server on localhost with Telegram-like flood limits."""
+
+    def __init__(self, global_rate: float = 30, chat_rate: float = 1, chat_burst: float = 3,
+                 retry_after: int = 1, latency: float = 0.01):
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.retry_after = retry_after
+        self.latency = latency
+        self.calls = {}
+        self.flood_errors = 0
+        self._global = TokenBucket(global_rate, global_rate)
+        self._chats = {}
+        self._message_id = 0
+        self._updates = []
+        self._new_updates = asyncio.Event()
+        self._runner = None
+        self.url = None
+
+    async def start(self) -> str:
+        """Starts the server on a free port, returns its base url."""
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://127.0.0.1:{port}"
+        return self.url
+
+    async def stop(self):
+        """Stops the server."""
+        await self._runner.cleanup()
+
+    def session(self) -> AiohttpSession:
+        """Gets a bot session that talks to this server."""
+        return AiohttpSession(api=TelegramAPIServer.from_base(self.url))
+
+    def push_update(self, update: dict):
+        """Queues an update for getUpdates."""
+        self._updates.append(update)
+        self._new_updates.set()
+
+    def reset(self):
+        """Clears counters and flood state."""
+        self.calls = {}
+        self.flood_errors = 0
+        self._global = TokenBucket(self.global_rate, self.global_rate)
+        self._chats = {}
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info['method']
+        params = await request.post()
+        chat_id = params.get('chat_id')
+        await asyncio.sleep(self.latency)
+
+        if method == "getUpdates":
+            return web.json_response({'ok': True, 'result': await self._get_updates(params)})
+
+        if method != "getMe" and not self._allow(chat_id):
+            self.flood_errors += 1
+            return web.json_response({
+                'ok': False, 'error_code': 429,
+                'description': f"Too Many Requests: retry after {self.retry_after}",
+                'parameters': {'retry_after': self.retry_after},
+            })
+
+        self.calls[method] = self.calls.get(method, 0) + 1
+        return web.json_response({'ok': True, 'result': self._result(method, params)})
+
+    async def _get_updates(self, params) -> list:
+        offset = int(params.get('offset') or 0)
+        self._updates = [update for update in self._updates if update['update_id'] >= offset]
+        if not self._updates:
+            self._new_updates.clear()
+            try:
+                await asyncio.wait_for(self._new_updates.wait(), min(float(params.get('timeout') or 0), 1.0))
+            except asyncio.TimeoutError:
+                pass
+        return self._updates[:100]
+
+    def _allow(self, chat_id) -> bool:
+        now = time.monotonic()
+        buckets = [self._global]
+        if chat_id is not None:
+            buckets.append(self._chats.setdefault(chat_id, TokenBucket(self.chat_rate, self.chat_burst)))
+        # Small tolerance for clock differences between client and server.
+        if any(bucket.ready_at(now) > now + 0.05 for bucket in buckets):
+            return False
+        for bucket in buckets:
+            bucket.take(now)
+        return True
+
+    def _result(self, method: str, params):
+        if method == "getMe":
+            return {'id': 1, 'is_bot': True, 'first_name': "fake"}
+        if method in ("sendMessage", "editMessageText"):
+            if method == "sendMessage":
+                self._message_id += 1
+            return {
+                'message_id': int(params.get('message_id', self._message_id)),
+                'date': int(time.time()),
+                'chat': {'id': int(params['chat_id']), 'type': "private"},
+                'text': params.get('text', ""),
+            }
+        return True
+
+async def tap(bot: Bot, chat_id: int, message_id: int, number: int, answer_times: list, failures: list):
+    """One button tap: answer the callback, then edit the message."""
+    started = time.perf_counter()
+    try:
+        await bot.answer_callback_query(f"{chat_id}-{number}")
+        answer_times.append(time.perf_counter() - started)
+        await bot.edit_message_text(f"List, tap {number}", chat_id=chat_id, message_id=message_id)
+    except TelegramRetryAfter:
+        failures.append(chat_id)
+
+async def replay(fake: FakeTelegram, label: str, scheduler, chats: int, taps: int):
+    fake.reset()
+    bot = Bot(token="0:fake-telegram", session=fake.session())
+    if scheduler is not None:
+        bot.session.middleware(scheduler)
+
+    answer_times, failures = [], []
+    started = time.perf_counter()
+    await asyncio.gather(*[
+        tap(bot, chat_id, 1, number, answer_times, failures)
+        for number in range(taps) for chat_id in range(1, chats + 1)
+    ])
+    elapsed = time.perf_counter() - started
+    if scheduler is not None:
+        await scheduler.close()
+    await bot.session.close()
+
+    answer_times.sort()
+    p95 = answer_times[int(len(answer_times) * 0.95)] if answer_times else 0
+    print(f"{label:<20} {elapsed:6.2f} s   429 replies {fake.flood_errors:4d}   failed taps {len(failures):4d}   "
+          f"answers {len(answer_times):4d}, p95 {p95 * 1000:7.1f} ms   calls {fake.calls}")
+
+async def main():
+    chats = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+    taps = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    fake = FakeTelegram()
+    await fake.start()
+    print(f"{chats} chats x {taps} taps, fake Telegram at {fake.url}\n")
+    try:
+        await replay(fake, "plain session", None, chats, taps)
+        await replay(fake, "RequestScheduler", RequestScheduler(), chats, taps)
+    finally:
+        await fake.stop()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,59 @@
+"""Posts recorded updates to a running webhook, the way Telegram would.
+
+Reads one Update JSON object per line and posts each to the webhook url
+with the secret token header, concurrency requests at a time. Prints the
+HTTP statuses received and the request latency. Start the bot with
+BOT_MODE=webhook (and WEBHOOK_URL empty, so nothing is registered with
+Telegram) and put the sender's id into ALLOWED_USERS first.
+
+Usage:
+    python tools/replay_updates.py updates.jsonl [url] [concurrency]
+
+tools/sample_updates.jsonl holds a short dialog of user 123456789.
+"""
+import asyncio
+import json
+import os
+import sys
+import time
+
+os.environ.setdefault("BOT_TOKEN", "0:replay")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiohttp import ClientSession
+
+from config import config
+from webhook import SECRET_HEADER
+
+async def post(session: ClientSession, url: str, update: dict, semaphore: asyncio.Semaphore,
+               statuses: dict, timings: list):
+    async with semaphore:
+        started = time.perf_counter()
+        async with session.post(url, json=update, headers={SECRET_HEADER: config.WEBHOOK_SECRET}) as response:
+            statuses[response.status] = statuses.get(response.status, 0) + 1
+        timings.append(time.perf_counter() - started)
+
+async def main():
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(2)
+
+    url = sys.argv[2] if len(sys.argv) > 2 else f"http://127.0.0.1:{config.WEBHOOK_PORT}{config.WEBHOOK_PATH}"
+    concurrency = int(sys.argv[3]) if len(sys.argv) > 3 else 1
+    with open(sys.argv[1], encoding="utf-8") as f:
+        updates = [json.loads(line) for line in f if line.strip()]
+
+    statuses, timings = {}, []
+    semaphore = asyncio.Semaphore(concurrency)
+    started = time.perf_counter()
+    async with ClientSession() as session:
+        # With one request at a time updates arrive in order, like from Telegram.
+        await asyncio.gather(*[post(session, url, update, semaphore, statuses, timings) for update in updates])
+    elapsed = time.perf_counter() - started
+
+    timings.sort()
+    print(f"{len(updates)} updates to {url} in {elapsed:.2f} s, statuses {statuses}")
+    print(f"latency median {timings[len(timings) // 2] * 1000:.1f} ms, max {timings[-1] * 1000:.1f} ms")
+
+if __name__ == "__main__":
+    asyncio.run(main())
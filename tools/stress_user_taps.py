@@ -0,0 +1,237 @@
+"""Stress check: bursts of concurrent button taps from many users.
+
+Every user taps "select recipe" and "toggle item" buttons of the menu and
+the shopping list many times at once, all updates fed to the dispatcher
+concurrently, the way aiogram's polling handles them. The dispatcher is
+set up like main.create_dispatcher, with database FSM storage on a
+temporary database and a local fake Bot API (tools/fake_telegram.py).
+Afterwards the selected recipe counts and bought flags must match the
+taps exactly, and the p99 time to handle a tap must stay under the limit.
+
+Runs once with UserEventIsolation (updates of a user handled one at a
+time) and, for comparison, once with aiogram's DisabledEventIsolation.
+The first run must keep every user down to one handler at a time; the
+second must show handlers of one user overlapping, which is what the
+isolation removes. Failures and wrong counts of the second run are
+printed but don't fail the check.
+
+Usage:
+    python tools/stress_user_taps.py [users] [taps_per_user] [p99_limit_ms]
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+WORK_DIR = tempfile.mkdtemp()
+os.environ.setdefault("BOT_TOKEN", "0:fake-telegram")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(WORK_DIR, 'stress.db')}"
+os.environ["ASYNC_DATABASE_URL"] = f"sqlite+aiosqlite:///{os.path.join(WORK_DIR, 'stress.db')}"
+os.environ["TOGGLE_DEBOUNCE_SECONDS"] = "0.05"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiogram import BaseMiddleware, Bot, Dispatcher
+from aiogram.filters import ExceptionTypeFilter
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import DisabledEventIsolation
+from aiogram.types import Update
+
+import additional_handlers  # noqa: F401  (registers callback handlers)
+import handlers  # noqa: F401
+from access_middleware import AccessMiddleware
+from callbacks import Op, callback_dispatcher, pack
+from config import config
+from database import DatabaseManager, async_engine, create_tables
+from db_middleware import DatabaseMiddleware, commit_before_request
+from fake_telegram import FakeTelegram
+from fsm_storage import DatabaseStorage
+from metrics_middleware import HandlerMetricsMiddleware
+from models import Category, Product, SelectedRecipe, ShoppingListItem
+from states import MenuStates
+from toggle_coalescer import toggle_coalescer
+from user_isolation import UserBusyError, UserEventIsolation, drop_busy_update
+from user_middleware import UserIdMiddleware
+
+RECIPES = 3
+ITEMS = 4
+
+class OverlapProbe(BaseMiddleware):
+    """Innermost middleware that finds the most handlers of one user running at the same time."""
+
+    def __init__(self):
+        self.max_running = 0
+        self._running = {}
+
+    async def __call__(self, handler, event, data: dict):
+        user_id = event.from_user.id
+        self._running[user_id] = self._running.get(user_id, 0) + 1
+        self.max_running = max(self.max_running, self._running[user_id])
+        try:
+            return await handler(event, data)
+        finally:
+            self._running[user_id] -= 1
+
+overlap_probe = OverlapProbe()
+
+def create_dispatcher(storage) -> Dispatcher:
+    """Creates a dispatcher with the middlewares of main.create_dispatcher."""
+    dp = Dispatcher(storage=storage, events_isolation=UserEventIsolation())
+    dp.errors.register(drop_busy_update, ExceptionTypeFilter(UserBusyError))
+    metrics_middleware = HandlerMetricsMiddleware()
+    db_middleware = DatabaseMiddleware()
+    for observer in (dp.message, dp.callback_query):
+        observer.middleware(metrics_middleware)
+        observer.middleware(AccessMiddleware())
+        observer.middleware(UserIdMiddleware())
+        observer.middleware(db_middleware)
+        observer.middleware(toggle_coalescer)
+        observer.middleware(overlap_probe)
+    dp.include_router(callback_dispatcher.router)
+    return dp
+
+def prepare(user_ids: list) -> dict:
+    """Creates recipes and a shopping list per user, returns {user_id: (recipe_ids, item_ids)}."""
+    prepared = {}
+    with DatabaseManager() as db:
+        for user_id in user_ids:
+            recipe_ids = [
+                db.create_recipe(f"Recipe {user_id}-{i}", str(user_id),
+                                 [{'product_name': f"Product {i}", 'quantity': 1, 'category': "Stress"}]).id
+                for i in range(RECIPES)
+            ]
+            category = db.session.query(Category).filter(Category.name == "Stress").one()
+            products = [Product(name=f"Item {user_id}-{i}", category_id=category.id) for i in range(ITEMS)]
+            db.session.add_all(products)
+            db.session.flush()
+            items = [ShoppingListItem(product_id=p.id, quantity=1, unit="g", user_id=str(user_id)) for p in products]
+            db.session.add_all(items)
+            db.session.commit()
+            prepared[user_id] = (recipe_ids, [item.id for item in items])
+    return prepared
+
+def tap_update(bot: Bot, update_id: int, user_id: int, data: str) -> Update:
+    return Update.model_validate({
+        'update_id': update_id,
+        'callback_query': {
+            'id': str(update_id),
+            'from': {'id': user_id, 'is_bot': False, 'first_name': "Stress"},
+            'chat_instance': str(user_id),
+            'data': data,
+            'message': {
+                'message_id': 1, 'date': 0, 'text': "Menu",
+                'chat': {'id': user_id, 'type': "private"},
+            },
+        },
+    }, context={'bot': bot})
+
+async def feed(dp: Dispatcher, bot: Bot, update: Update, timings: list, failures: list):
+    started = time.perf_counter()
+    try:
+        await dp.feed_update(bot, update)
+    except Exception as e:
+        failures.append(f"{type(e).__name__}: {e}")
+    timings.append(time.perf_counter() - started)
+
+def check(prepared: dict, expected_selected: dict, expected_bought: dict) -> list:
+    """Compares the database with what the taps should have left, returns the mismatches."""
+    mismatches = []
+    with DatabaseManager() as db:
+        for user_id, (recipe_ids, item_ids) in prepared.items():
+            rows = db.session.query(SelectedRecipe).filter(SelectedRecipe.user_id == str(user_id)).all()
+            selected = {row.recipe_id: row.count for row in rows}
+            if len(rows) != len(selected) or selected != expected_selected[user_id]:
+                mismatches.append(f"user {user_id}: selected {selected}, expected {expected_selected[user_id]}")
+            items = db.session.query(ShoppingListItem).filter(ShoppingListItem.id.in_(item_ids)).all()
+            bought = {item.id: bool(item.is_bought) for item in items}
+            if bought != expected_bought[user_id]:
+                mismatches.append(f"user {user_id}: bought {bought}, expected {expected_bought[user_id]}")
+    return mismatches
+
+async def run(fake: FakeTelegram, dp: Dispatcher, label: str, isolation, user_ids: list, taps: int) -> tuple:
+    prepared = prepare(user_ids)
+    # The routers can be attached to one dispatcher only, so runs swap its isolation.
+    dp.fsm.events_isolation = isolation
+    bot = Bot(token="0:fake-telegram", session=fake.session())
+    bot.session.middleware(commit_before_request)
+    for user_id in user_ids:
+        key = StorageKey(bot_id=bot.id, chat_id=user_id, user_id=user_id)
+        await dp.storage.set_state(key, MenuStates.selecting_recipes)
+
+    updates = []
+    expected_selected = {user_id: {} for user_id in user_ids}
+    expected_bought = {user_id: {item_id: False for item_id in prepared[user_id][1]} for user_id in user_ids}
+    update_id = user_ids[0] * taps
+    for number in range(taps):
+        for user_id in user_ids:
+            recipe_ids, item_ids = prepared[user_id]
+            update_id += 1
+            if number % 2:
+                item_id = item_ids[number % ITEMS]
+                expected_bought[user_id][item_id] = not expected_bought[user_id][item_id]
+                updates.append(tap_update(bot, update_id, user_id, pack(Op.TOGGLE_ITEM, item_id)))
+            else:
+                recipe_id = recipe_ids[number % RECIPES]
+                expected_selected[user_id][recipe_id] = expected_selected[user_id].get(recipe_id, 0) + 1
+                updates.append(tap_update(bot, update_id, user_id, pack(Op.SELECT_RECIPE, recipe_id)))
+
+    timings, failures = [], []
+    overlap_probe.max_running = 0
+    started = time.perf_counter()
+    await asyncio.gather(*[feed(dp, bot, update, timings, failures) for update in updates])
+    await toggle_coalescer.close()
+    elapsed = time.perf_counter() - started
+
+    mismatches = check(prepared, expected_selected, expected_bought)
+    await bot.session.close()
+
+    timings.sort()
+    p50 = timings[len(timings) // 2]
+    p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+    dropped = isolation.get_stats()['dropped'] if isinstance(isolation, UserEventIsolation) else 0
+    print(f"{label:<24} {len(updates)} taps in {elapsed:5.2f} s   p50 {p50 * 1000:7.1f} ms   p99 {p99 * 1000:7.1f} ms   "
+          f"failed {len(failures):3d}   dropped {dropped:3d}   wrong users {len(mismatches):3d}   "
+          f"max handlers per user {overlap_probe.max_running}")
+    for failure in sorted(set(failures))[:3]:
+        print(f"    {failure}")
+    for mismatch in mismatches[:3]:
+        print(f"    {mismatch}")
+    return failures, mismatches, p99, overlap_probe.max_running
+
+async def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    taps = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    p99_limit = float(sys.argv[3]) / 1000 if len(sys.argv) > 3 else 2.0
+
+    first_users = list(range(1001, 1001 + users))
+    second_users = list(range(2001, 2001 + users))
+    config.ALLOWED_USERS = first_users + second_users
+    create_tables()
+    fake = FakeTelegram(global_rate=100000, chat_rate=100000, chat_burst=100000, latency=0.005)
+    await fake.start()
+    storage = DatabaseStorage()
+    dp = create_dispatcher(storage)
+    print(f"{users} users x {taps} concurrent taps, database in {WORK_DIR}\n")
+    try:
+        # Within the pending limit, so no tap may be dropped.
+        isolation = UserEventIsolation(max_pending=taps)
+        failures, mismatches, p99, overlap = await run(fake, dp, "UserEventIsolation", isolation,
+                                                       first_users, taps)
+        print(f"    {isolation.get_stats()}")
+        *_, disabled_overlap = await run(fake, dp, "DisabledEventIsolation", DisabledEventIsolation(),
+                                         second_users, taps)
+    finally:
+        await fake.stop()
+        await storage.close()
+        await async_engine.dispose()
+
+    dropped = isolation.get_stats()['dropped']
+    if failures or mismatches or dropped or p99 > p99_limit or overlap != 1 or disabled_overlap < 2:
+        print(f"\nFAILED: {len(failures)} failed, {dropped} dropped, {len(mismatches)} wrong users, "
+              f"p99 {p99 * 1000:.1f} ms (limit {p99_limit * 1000:.0f} ms), "
+              f"{overlap} handlers of a user at once with isolation, {disabled_overlap} without")
+        sys.exit(1)
+    print("\nOK")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,90 @@
+import asyncio
+from typing import List
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+
+from config import config
+
+def sender_id(update: Update) -> int:
+    """Gets id of the user who sent the update, or the update id if there is none."""
+    user = getattr(update.event, 'from_user', None)
+    return user.id if user else update.update_id
+
+class UpdateQueue:
+    """Feeds updates to the dispatcher from several tasks, each with its own queue.
+
+    Updates of one user always go to the same task, so they are handled one
+    at a time and in order, while different users are handled concurrently.
+    At most size updates wait in the queues altogether.
+    """
+
+    def __init__(self, bot: Bot, dp: Dispatcher, tasks: int = config.UPDATE_TASKS,
+                 size: int = config.UPDATE_QUEUE_SIZE):
+        self.bot = bot
+        self.dp = dp
+        self.received = 0
+        self.rejected = 0
+        self.failed = 0
+        self.max_queued = 0
+        self._queues = [asyncio.Queue(maxsize=max(1, size // tasks)) for _ in range(tasks)]
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self):
+        """Starts the tasks."""
+        self._tasks = [asyncio.create_task(self._work(queue)) for queue in self._queues]
+
+    async def stop(self):
+        """Lets the tasks finish queued updates, then stops them."""
+        for queue in self._queues:
+            await queue.join()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def put_nowait(self, update: Update):
+        """Queues an update, raises asyncio.QueueFull if its queue is full."""
+        try:
+            self._queue_of(update).put_nowait(update)
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise
+        self._received()
+
+    async def put(self, update: Update):
+        """Queues an update, waiting while its queue is full."""
+        await self._queue_of(update).put(update)
+        self._received()
+
+    def queued(self) -> int:
+        """Gets number of updates waiting for a task."""
+        return sum(queue.qsize() for queue in self._queues)
+
+    def _queue_of(self, update: Update) -> asyncio.Queue:
+        return self._queues[sender_id(update) % len(self._queues)]
+
+    def _received(self):
+        self.received += 1
+        self.max_queued = max(self.max_queued, self.queued())
+
+    async def _work(self, queue: asyncio.Queue):
+        while True:
+            update = await queue.get()
+            try:
+                await self.dp.feed_update(self.bot, update)
+            except Exception as e:
+                self.failed += 1
+                print(f"Failed to handle update {update.update_id}: {e}")
+            finally:
+                queue.task_done()
+
+    def get_stats(self) -> dict:
+        """Gets update counters."""
+        return {
+            'received': self.received,
+            'rejected': self.rejected,
+            'failed': self.failed,
+            'queued': self.queued(),
+            'max_queued': self.max_queued,
+        }
@@ -0,0 +1,82 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import Dict
+
+from aiogram.fsm.storage.base import BaseEventIsolation, StorageKey
+from aiogram.types import ErrorEvent
+
+from config import config
+
+class UserBusyError(Exception):
+    """Raised for an update of a user who already has max_pending updates in progress."""
+
+class _UserLock:
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.pending = 0
+
+class UserEventIsolation(BaseEventIsolation):
+    """Handles updates of one user one at a time, in arrival order.
+
+    Passed to the Dispatcher as events_isolation: FSMContextMiddleware takes
+    the user's lock before it reads the state, so every update sees the
+    state and data left by the user's previous one, while updates of
+    different users still run concurrently. A user has at most max_pending
+    updates running or waiting; more are dropped with UserBusyError (see
+    drop_busy_update). Locks are deleted once nothing waits for them.
+    """
+
+    def __init__(self, max_pending: int = config.USER_MAX_PENDING):
+        self.max_pending = max_pending
+        self.updates = 0
+        self.waited = 0
+        self.dropped = 0
+        self.max_wait = 0.0
+        self._locks: Dict[int, _UserLock] = {}
+
+    @asynccontextmanager
+    async def lock(self, key: StorageKey):
+        user_lock = self._locks.get(key.user_id)
+        if user_lock is None:
+            user_lock = self._locks[key.user_id] = _UserLock()
+        if user_lock.pending >= self.max_pending:
+            self.dropped += 1
+            raise UserBusyError(f"User {key.user_id} has {user_lock.pending} updates in progress")
+
+        user_lock.pending += 1
+        self.updates += 1
+        if user_lock.lock.locked():
+            self.waited += 1
+        started = time.monotonic()
+        try:
+            async with user_lock.lock:
+                self.max_wait = max(self.max_wait, time.monotonic() - started)
+                yield
+        finally:
+            user_lock.pending -= 1
+            if user_lock.pending == 0:
+                del self._locks[key.user_id]
+
+    async def close(self) -> None:
+        self._locks.clear()
+
+    def get_stats(self) -> dict:
+        """Gets lock counters."""
+        return {
+            'updates': self.updates,
+            'waited': self.waited,
+            'dropped': self.dropped,
+            'max_wait_ms': round(self.max_wait * 1000, 1),
+            'users_in_progress': len(self._locks),
+        }
+
+async def drop_busy_update(event: ErrorEvent):
+    """Error handler that drops updates rejected by UserEventIsolation, answering dropped button taps."""
+    callback_query = event.update.callback_query
+    if callback_query is not None:
+        try:
+            await callback_query.answer("⏳ Still busy with your previous taps")
+        except Exception as e:
+            print(f"Failed to answer dropped callback: {e}")
+    return True
@@ -0,0 +1,10 @@
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+class UserIdMiddleware(BaseMiddleware):
+    """Middleware that passes the sender's Telegram id to handlers as user_id."""
+
+    async def __call__(self, handler, event: TelegramObject, data: dict):
+        user = data.get("event_from_user")
+        data["user_id"] = str(user.id) if user else ""
+        return await handler(event, data)
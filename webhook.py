@@ -0,0 +1,102 @@
+import asyncio
+import hmac
+import signal
+from typing import Optional
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+
+from config import config
+from update_queue import UpdateQueue
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+class WebhookServer:
+    """aiohttp server that receives updates from Telegram.
+
+    Requests must carry the secret token and are answered right away;
+    the update is passed to updates, an UpdateQueue or anything else with a
+    put_nowait method. When it is full the server answers 503 and Telegram
+    delivers the update again later, instead of the bot buffering without
+    limit.
+    """
+
+    def __init__(self, bot: Bot, updates, secret: str = config.WEBHOOK_SECRET):
+        if not secret:
+            raise ValueError("WebhookServer needs a secret token")
+        self.bot = bot
+        self.updates = updates
+        self.secret = secret
+        self._runner: Optional[web.AppRunner] = None
+
+    def app(self, path: str = config.WEBHOOK_PATH) -> web.Application:
+        """Gets the aiohttp application serving the webhook at path."""
+        app = web.Application()
+        app.router.add_post(path, self._handle)
+        return app
+
+    async def start(self, host: str = config.WEBHOOK_HOST, port: int = config.WEBHOOK_PORT,
+                    path: str = config.WEBHOOK_PATH):
+        """Starts the HTTP server."""
+        self._runner = web.AppRunner(self.app(path))
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+
+    async def stop(self):
+        """Stops accepting updates."""
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        if not hmac.compare_digest(request.headers.get(SECRET_HEADER, "").encode(), self.secret.encode()):
+            return web.Response(status=401)
+
+        try:
+            update = Update.model_validate(await request.json(), context={"bot": self.bot})
+        except Exception as e:
+            print(f"Invalid webhook update: {e}")
+            return web.Response(status=400)
+
+        try:
+            self.updates.put_nowait(update)
+        except asyncio.QueueFull:
+            return web.Response(status=503)
+        return web.Response()
+
+async def wait_for_stop_signal():
+    """Returns on SIGINT or SIGTERM."""
+    stopped = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signal_number in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(signal_number, stopped.set)
+        except NotImplementedError:
+            pass
+    await stopped.wait()
+
+async def set_webhook(bot: Bot, allowed_updates: list):
+    """Registers WEBHOOK_URL with Telegram if it is configured."""
+    if config.WEBHOOK_URL:
+        await bot.set_webhook(
+            config.WEBHOOK_URL.rstrip("/") + config.WEBHOOK_PATH,
+            secret_token=config.WEBHOOK_SECRET,
+            allowed_updates=allowed_updates,
+        )
+    print(f"🌐 Webhook listening on {config.WEBHOOK_HOST}:{config.WEBHOOK_PORT}{config.WEBHOOK_PATH}")
+
+async def run_webhook(bot: Bot, dp: Dispatcher):
+    """Serves updates from the webhook until SIGINT or SIGTERM."""
+    updates = UpdateQueue(bot, dp)
+    updates.start()
+    server = WebhookServer(bot, updates)
+    await server.start()
+    await set_webhook(bot, dp.resolve_used_update_types())
+
+    try:
+        await wait_for_stop_signal()
+    finally:
+        await server.stop()
+        await updates.stop()
+        print(f"🌐 Webhook updates: {updates.get_stats()}")